@@ -0,0 +1,44 @@
+"""
+Shared helpers for the benchmark scripts in this folder.
+
+The scripts import function_app and call its handlers directly with an in-process
+HttpRequest, so they measure the Python side of each route against whatever database
+the DB_* settings (or .env) point at.
+"""
+import json
+import os
+import statistics
+import sys
+
+# Make function_app importable when a script is run from the repository root or from this folder
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if repo_root not in sys.path:
+    sys.path.insert(0, repo_root)
+
+def make_request(method, route, body=None, params=None, route_params=None, headers=None):
+    import azure.functions as func
+
+    return func.HttpRequest(
+        method=method,
+        url=f'/api/{route}',
+        headers=headers or {},
+        params=params or {},
+        route_params=route_params or {},
+        body=json.dumps(body).encode() if body is not None else b''
+    )
+
+def get_handler(app, function_name):
+    for function in app.get_functions():
+        if function.get_function_name() == function_name:
+            return function.get_user_function()
+    raise SystemExit(f'Unknown function: {function_name}')
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'runs': len(ordered),
+        'min': round(ordered[0], 3),
+        'median': round(statistics.median(ordered), 3),
+        'p95': round(ordered[max(int(len(ordered) * 0.95 + 0.5) - 1, 0)], 3),
+        'max': round(ordered[-1], 3)
+    }
@@ -0,0 +1,94 @@
+"""
+Peak memory of one request per route: growth of the process peak RSS while the request runs,
+and the peak of Python allocations (tracemalloc) of a second request. Each run is a fresh
+interpreter with a pooled connection already open, so only the request itself is measured.
+
+    python benchmarks/memory_profile.py --runs 5
+    DB_FETCH_BATCH_SIZE=5000 python benchmarks/memory_profile.py --function get_banks_payments_stats --route financial/payment/stats
+
+By default the three aggregation reports are profiled. Peak RSS needs the resource module,
+so it is reported as null on Windows.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from common import summarize
+
+default_routes = [
+    ('get_monthly_payments_by_province', 'payments/monthly-by-province'),
+    ('get_banks_payments_stats', 'financial/payment/stats'),
+    ('get_students_incomplete_registration', 'students/incomplete-registration'),
+]
+
+CHILD = """
+import inspect, json, sys, tracemalloc
+sys.path.insert(0, {benchmarks_dir!r})
+import function_app
+from common import make_request, get_handler
+try:
+    import resource
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss_unit = 1 if sys.platform == 'darwin' else 1024
+    peak_rss = lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit
+except ImportError:
+    peak_rss = None
+handler = get_handler(function_app.app, {function!r})
+handler = inspect.unwrap(handler)
+function_app.db_pool.prime(1)
+before = peak_rss() if peak_rss else None
+response = handler(make_request('GET', {route!r}))
+after = peak_rss() if peak_rss else None
+tracemalloc.start()
+handler(make_request('GET', {route!r}))
+_, traced_peak = tracemalloc.get_traced_memory()
+tracemalloc.stop()
+print(json.dumps({{
+    'peakRssDeltaMb': (after - before) / 2 ** 20 if peak_rss else None,
+    'peakRssMb': after / 2 ** 20 if peak_rss else None,
+    'tracedPeakMb': traced_peak / 2 ** 20,
+    'responseMb': len(response.get_body()) / 2 ** 20,
+    'status': response.status_code
+}}))
+"""
+
+def profile(function, route, runs, benchmarks_dir):
+    child = CHILD.format(benchmarks_dir=benchmarks_dir, function=function, route=route)
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', child], capture_output=True, text=True, check=True)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    def summary(key):
+        values = [r[key] for r in results if r[key] is not None]
+        return summarize(values) if values else None
+
+    return {
+        'function': function,
+        'peakRssDeltaMb': summary('peakRssDeltaMb'),
+        'peakRssMb': summary('peakRssMb'),
+        'tracedPeakMb': summary('tracedPeakMb'),
+        'responseMb': summary('responseMb'),
+        'statusCodes': sorted({r['status'] for r in results})
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--function', help='Profile only this function (GET routes only)')
+    parser.add_argument('--route', help='Route of --function')
+    args = parser.parse_args()
+    if bool(args.function) != bool(args.route):
+        parser.error('--function and --route go together')
+
+    routes = [(args.function, args.route)] if args.function else default_routes
+    benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+    print(json.dumps({
+        'fetchBatchSize': int(os.getenv('DB_FETCH_BATCH_SIZE', '1000')),
+        'routes': [profile(function, route, args.runs, benchmarks_dir) for function, route in routes]
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Write throughput of loans/make-payment: the synchronous per-request path against the
+asynchronous path (enqueue, then drain the queue in PAYMENT_BATCH_SIZE micro-batches).
+
+    python benchmarks/payment_ingestion.py --payments 2000 --loan-ids 101,102,103
+
+This applies real payments to the given loans, so point DB_* at a test database. Each
+payment is --amount CAD; pick loans whose balance can absorb them. The database needs
+migration V007 (the PaymentQueue table).
+"""
+import argparse
+import json
+import os
+import time
+
+from common import make_request, get_handler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payments', type=int, default=1000)
+    parser.add_argument('--loan-ids', required=True, help='Comma-separated loan IDs to pay into')
+    parser.add_argument('--amount', type=float, default=101)
+    args = parser.parse_args()
+
+    # All requests come from this one client, so the per-client rate limit would cap the run
+    os.environ['ADMISSION_CONTROL_ENABLED'] = 'false'
+    import function_app
+
+    # Apply whatever earlier runs left in the queue so it does not count towards this one
+    function_app.drain_payment_queue(max_seconds=3600)
+
+    handler = get_handler(function_app.app, 'post_loan_payment')
+    loan_ids = [int(loan_id) for loan_id in args.loan_ids.split(',')]
+    bodies = [{'loanid': loan_ids[i % len(loan_ids)], 'amount': args.amount} for i in range(args.payments)]
+
+    started = time.perf_counter()
+    for body in bodies:
+        handler(make_request('POST', 'loans/make-payment', body=body))
+    sync_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for body in bodies:
+        handler(make_request('POST', 'loans/make-payment', body=body, params={'mode': 'async'}))
+    enqueue_seconds = time.perf_counter() - started
+    summary = function_app.drain_payment_queue(max_seconds=3600)
+    async_seconds = time.perf_counter() - started
+
+    print(json.dumps({
+        'payments': args.payments,
+        'batchSize': function_app.payment_batch_size,
+        'sync': {'seconds': round(sync_seconds, 3), 'paymentsPerSecond': round(args.payments / sync_seconds, 1)},
+        'async': {
+            'enqueueSeconds': round(enqueue_seconds, 3),
+            'seconds': round(async_seconds, 3),
+            'paymentsPerSecond': round(args.payments / async_seconds, 1),
+            'drain': summary
+        },
+        'speedup': round(sync_seconds / async_seconds, 2)
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Latency of loans/make-payment on its own and while the aggregation reports run concurrently,
+for checking that the reports' full scans do not hold up payment writes.
+
+    python benchmarks/report_contention.py --payments 200 --loan-ids 101,102,103
+    python benchmarks/report_contention.py --payments 200 --loan-ids 101,102,103 --isolation read-committed
+
+--isolation sets DB_REPORT_ISOLATION, so running both shows the effect of the reports reading
+under SNAPSHOT isolation (migration V004). This applies real payments to the given loans, so
+point DB_* at a test database and pick loans whose balance can absorb 2 x --payments x --amount.
+Admission control, request coalescing and the response cache are bypassed.
+"""
+import argparse
+import inspect
+import json
+import os
+import threading
+import time
+
+from common import make_request, get_handler, summarize
+
+report_routes = [
+    ('get_monthly_payments_by_province', 'payments/monthly-by-province'),
+    ('get_banks_payments_stats', 'financial/payment/stats'),
+    ('get_province_student_count', 'provinces/student-count'),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payments', type=int, default=200, help='Payments per phase')
+    parser.add_argument('--loan-ids', required=True, help='Comma-separated loan IDs to pay into')
+    parser.add_argument('--amount', type=float, default=1)
+    parser.add_argument('--report-threads', type=int, default=4)
+    parser.add_argument('--isolation', choices=['snapshot', 'read-committed'], default='snapshot')
+    args = parser.parse_args()
+
+    os.environ['DB_REPORT_ISOLATION'] = args.isolation
+    os.environ['DB_REPORT_POOL_MAX_SIZE'] = str(args.report_threads)
+    os.environ['ADMISSION_CONTROL_ENABLED'] = 'false'
+    os.environ['CACHE_BACKEND'] = 'none'
+    import function_app
+
+    pay = inspect.unwrap(get_handler(function_app.app, 'post_loan_payment'))
+    reports = [(inspect.unwrap(get_handler(function_app.app, function)), route) for function, route in report_routes]
+    loan_ids = [int(loan_id) for loan_id in args.loan_ids.split(',')]
+
+    def run_payments():
+        samples = []
+        status_codes = set()
+        for i in range(args.payments):
+            body = {'loanid': loan_ids[i % len(loan_ids)], 'amount': args.amount}
+            started = time.perf_counter()
+            response = pay(make_request('POST', 'loans/make-payment', body=body))
+            samples.append((time.perf_counter() - started) * 1000)
+            status_codes.add(response.status_code)
+        return {'latencyMs': summarize(samples), 'statusCodes': sorted(status_codes)}
+
+    baseline = run_payments()
+
+    stop = threading.Event()
+    report_runs = []
+    report_status_codes = set()
+    lock = threading.Lock()
+
+    def run_reports(offset):
+        i = offset
+        while not stop.is_set():
+            handler, route = reports[i % len(reports)]
+            started = time.perf_counter()
+            response = handler(make_request('GET', route))
+            with lock:
+                report_runs.append((time.perf_counter() - started) * 1000)
+                report_status_codes.add(response.status_code)
+            i += 1
+
+    threads = [threading.Thread(target=run_reports, args=(i,), daemon=True) for i in range(args.report_threads)]
+    for thread in threads:
+        thread.start()
+    # Let every reporting thread get its first scan going before the payments start
+    time.sleep(1)
+    under_load = run_payments()
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    print(json.dumps({
+        'reportIsolation': args.isolation,
+        'reportThreads': args.report_threads,
+        'baseline': baseline,
+        'withReports': under_load,
+        'reports': {
+            'latencyMs': summarize(report_runs) if report_runs else None,
+            'statusCodes': sorted(report_status_codes)
+        },
+        'medianSlowdown': round(under_load['latencyMs']['median'] / baseline['latencyMs']['median'], 2)
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
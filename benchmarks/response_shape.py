@@ -0,0 +1,112 @@
+"""
+Body size and handler time of the row and columnar response shapes (?shape=columnar) of
+students/loan/near-completion, on synthetic rows served by an in-memory cursor, so it needs
+no database and gives the same rows on every run.
+
+    python benchmarks/response_shape.py --rows 20000 --runs 10
+
+The rows have the near-completion columns with values of realistic length (seeded with --seed).
+Timings cover the handler from execute to the encoded body; against a real database the fetch
+adds the same time to both shapes, so use route_latency.py for end-to-end numbers.
+"""
+import argparse
+import inspect
+import json
+import os
+import random
+import time
+from decimal import Decimal
+
+from common import make_request, get_handler, summarize
+
+provinces = ['Ontario', 'Quebec', 'British Columbia', 'Alberta', 'Manitoba', 'Saskatchewan', 'Nova Scotia']
+programs = ['Computer Science', 'Nursing', 'Mechanical Engineering', 'Business Administration', 'Early Childhood Education']
+colleges = ['Seneca College', 'Humber College', 'George Brown College', 'Algonquin College', 'Red River College']
+cities = ['Toronto', 'Ottawa', 'Winnipeg', 'Montreal', 'Vancouver']
+
+def synthetic_rows(count, seed):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        loan_amount = Decimal(rng.randrange(5000, 60000))
+        loan_balance = (loan_amount * Decimal(rng.randrange(1, 1000)) / 10000).quantize(Decimal('0.01'))
+        rows.append((
+            f'S{i:08d}',
+            rng.choice(['Emma', 'Liam', 'Olivia', 'Noah', 'Ava', 'William']),
+            rng.choice(['Smith', 'Tremblay', 'Martin', 'Roy', 'Wilson', 'MacDonald']),
+            f'{rng.randrange(1, 9999)} {rng.choice(["King", "Queen", "Main", "Elm"])} Street, {rng.choice(cities)}',
+            loan_amount,
+            loan_balance,
+            f'{int((loan_amount - loan_balance) * 100 / loan_amount)}%',
+            rng.choice(programs),
+            rng.choice(colleges),
+            rng.choice(cities),
+            rng.choice(provinces),
+            f'{rng.randrange(200, 999)}-{rng.randrange(100, 999)}-{rng.randrange(1000, 9999)}',
+            f'student{i}@example.com',
+            rng.choice(['Email', 'Phone', 'Mail'])
+        ))
+    return rows
+
+columns = ['StudentID', 'FirstName', 'LastName', 'HomeAddress', 'LoanAmount', 'LoanBalance', 'PercentagePaid',
+           'ProgramOfStudy', 'CollegeName', 'City', 'Province', 'PhoneNumber', 'Email', 'Preference']
+
+class MemoryCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.description = [(column,) for column in columns]
+
+    def execute(self, name, *params):
+        return self
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def close(self):
+        pass
+
+class MemoryConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self):
+        return MemoryCursor(self.rows)
+
+    def close(self):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ['CACHE_BACKEND'] = 'none'
+    import function_app
+
+    rows = synthetic_rows(args.rows, args.seed)
+    function_app.get_report_db_connection = lambda: MemoryConnection(rows)
+    handler = inspect.unwrap(get_handler(function_app.app, 'get_students_near_completion'))
+
+    results = {}
+    for shape in ('rows', 'columnar'):
+        samples = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            response = handler(make_request('GET', 'students/loan/near-completion/10',
+                                            route_params={'threshold': '10'}, params={'shape': shape}))
+            samples.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.get_body()
+        results[shape] = {'bodyBytes': len(response.get_body()), 'handlerMs': summarize(samples)}
+
+    print(json.dumps({
+        'rows': args.rows,
+        'seed': args.seed,
+        'shapes': results,
+        'bodyRatio': round(results['columnar']['bodyBytes'] / results['rows']['bodyBytes'], 3),
+        'medianTimeRatio': round(results['columnar']['handlerMs']['median'] / results['rows']['handlerMs']['median'], 3)
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
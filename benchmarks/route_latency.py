@@ -0,0 +1,73 @@
+"""
+Warm latency of one route plus the execute time of each SQL statement it ran, for comparing
+a route before and after a schema change (e.g. the indexes in migrations/).
+
+    python benchmarks/route_latency.py --function get_loan_payments --route loans/101/payments --route-params '{"loanid": "101"}'
+    python benchmarks/route_latency.py --function get_province_student_count --route provinces/student-count --runs 50
+    python benchmarks/route_latency.py --function get_students_near_completion --route students/loan/near-completion/90 --route-params '{"threshold": "90"}' --params '{"shape": "columnar"}'
+
+Admission control, request coalescing and the response cache are bypassed so every run reaches the database.
+"""
+import argparse
+import inspect
+import json
+import time
+
+from common import make_request, get_handler, summarize
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--function', required=True)
+    parser.add_argument('--route', required=True)
+    parser.add_argument('--method', default='GET')
+    parser.add_argument('--params', default='{}', help='JSON object of query parameters')
+    parser.add_argument('--route-params', default='{}', help='JSON object of route parameters')
+    parser.add_argument('--body', default='', help='JSON request body, or an empty string for none')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--warmup-runs', type=int, default=3)
+    args = parser.parse_args()
+
+    import function_app
+
+    handler = get_handler(function_app.app, args.function)
+    handler = inspect.unwrap(handler)
+
+    def request():
+        return make_request(args.method, args.route, body=json.loads(args.body) if args.body else None,
+                            params=json.loads(args.params), route_params=json.loads(args.route_params))
+
+    for _ in range(args.warmup_runs):
+        handler(request())
+    before = function_app.sql_statements.snapshot()
+
+    samples = []
+    sizes = []
+    status_codes = set()
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        response = handler(request())
+        samples.append((time.perf_counter() - started) * 1000)
+        sizes.append(len(response.get_body()))
+        status_codes.add(response.status_code)
+
+    # Statement timings of the measured runs only
+    statements = {}
+    for name, stats in function_app.sql_statements.snapshot().items():
+        earlier = before.get(name, {'count': 0, 'totalMs': 0})
+        count = stats['count'] - earlier['count']
+        if count:
+            statements[name] = {
+                'count': count,
+                'avgMs': round((stats['totalMs'] - earlier['totalMs']) / count, 3)
+            }
+
+    print(json.dumps({
+        'function': args.function,
+        'latencyMs': summarize(samples),
+        'responseBytes': max(sizes),
+        'statusCodes': sorted(status_codes),
+        'statements': statements
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
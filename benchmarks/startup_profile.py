@@ -0,0 +1,79 @@
+"""
+Cold-start profile: import time of function_app plus the time of the first and second
+request, each measured in a fresh interpreter so every run is a real cold start.
+
+    python benchmarks/startup_profile.py --runs 20
+    python benchmarks/startup_profile.py --function get_province_student_count --method GET
+
+The default function (is_canadian_address) does not touch the database; pick a database
+route to include the first connection and query in the first-request time.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from common import summarize
+
+CHILD = """
+import json, sys, time
+sys.path.insert(0, {benchmarks_dir!r})
+start = time.perf_counter()
+import function_app
+imported = time.perf_counter()
+pyodbc_at_import = 'pyodbc' in sys.modules
+from common import make_request, get_handler
+handler = get_handler(function_app.app, {function!r})
+timings = []
+for _ in range(2):
+    request = make_request({method!r}, {route!r}, body={body!r}, route_params={route_params!r})
+    before = time.perf_counter()
+    response = handler(request)
+    timings.append((time.perf_counter() - before) * 1000)
+print(json.dumps({{
+    'importMs': (imported - start) * 1000,
+    'firstRequestMs': timings[0],
+    'secondRequestMs': timings[1],
+    'status': response.status_code,
+    'pyodbcLoadedAtImport': pyodbc_at_import
+}}))
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--function', default='is_canadian_address')
+    parser.add_argument('--method', default='POST')
+    parser.add_argument('--route', default='student/address/iscanadian')
+    parser.add_argument('--body', default='{"address": "123 Maple Street, Toronto, ON M5V 2T6"}',
+                        help='JSON request body, or an empty string for none')
+    parser.add_argument('--route-params', default='{}', help='JSON object of route parameters')
+    args = parser.parse_args()
+
+    benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+    child = CHILD.format(
+        benchmarks_dir=benchmarks_dir,
+        function=args.function,
+        method=args.method,
+        route=args.route,
+        body=json.loads(args.body) if args.body else None,
+        route_params=json.loads(args.route_params)
+    )
+
+    results = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, '-c', child], capture_output=True, text=True, check=True)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    print(json.dumps({
+        'function': args.function,
+        'importMs': summarize([r['importMs'] for r in results]),
+        'firstRequestMs': summarize([r['firstRequestMs'] for r in results]),
+        'secondRequestMs': summarize([r['secondRequestMs'] for r in results]),
+        'statusCodes': sorted({r['status'] for r in results}),
+        'pyodbcLoadedAtImport': any(r['pyodbcLoadedAtImport'] for r in results)
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
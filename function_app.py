@@ -1,17 +1,36 @@
 import azure.functions as func
 import logging
+import logging.handlers
 import json
-import pyodbc
+import importlib
+import inspect
+import atexit
+import functools
+import hashlib
+import hmac
 import os
 from azure.functions import HttpResponse
-from dotenv import load_dotenv
 from decimal import Decimal
-from datetime import date
-from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from collections import defaultdict, OrderedDict
+from types import MappingProxyType
 import re
+import bisect
+import math
+import random
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from queue import Full, Queue
+from urllib.parse import urlsplit
 
-# Load environment variables
-load_dotenv()
+# Load environment variables from .env for local development only. WEBSITE_INSTANCE_ID is set
+# on every Azure instance, where settings come from the app configuration instead.
+if not os.getenv('WEBSITE_INSTANCE_ID'):
+    from dotenv import load_dotenv
+    load_dotenv()
 
 app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 
@@ -24,18 +43,1361 @@ password = os.getenv('DB_PASSWORD')
 # Connection string
 conn_str = f'DRIVER={{ODBC Driver 18 for SQL Server}};SERVER={server};DATABASE={database};UID={username};PWD={password};TrustServerCertificate=yes;'
 
-def get_db_connection():
-    return pyodbc.connect(conn_str)
+# pyodbc loads the ODBC driver manager, so it is imported on first database use rather than at cold start
+pyodbc = None
+
+def get_pyodbc():
+    global pyodbc
+    if pyodbc is None:
+        pyodbc = importlib.import_module('pyodbc')
+    return pyodbc
+
+# Retry and circuit breaker settings
+connect_timeout = int(os.getenv('DB_CONNECT_TIMEOUT_SECONDS', '15'))
+query_timeout = int(os.getenv('DB_QUERY_TIMEOUT_SECONDS', '30'))
+retry_attempts = int(os.getenv('DB_RETRY_ATTEMPTS', '3'))
+retry_base_delay = float(os.getenv('DB_RETRY_BASE_DELAY_SECONDS', '0.2'))
+retry_max_delay = float(os.getenv('DB_RETRY_MAX_DELAY_SECONDS', '2'))
+breaker_failure_threshold = int(os.getenv('DB_BREAKER_FAILURE_THRESHOLD', '5'))
+breaker_reset_timeout = float(os.getenv('DB_BREAKER_RESET_SECONDS', '30'))
+
+# SQLSTATEs and SQL Server error numbers worth retrying: lost or refused connections, timeouts,
+# deadlocks, and Azure SQL throttling, failover and reconfiguration errors
+transient_sqlstates = frozenset({'08001', '08004', '08007', '08S01', 'HYT00', 'HYT01', '40001'})
+transient_error_numbers = frozenset({
+    -2, 64, 233, 1205, 4060, 4221, 10053, 10054, 10060, 10928, 10929,
+    40143, 40197, 40501, 40540, 40613, 49918, 49919, 49920
+})
+connection_error_numbers = frozenset({64, 233, 10053, 10054, 10060})
+sql_error_number_pattern = re.compile(r'\((-?\d+)\)')
+
+def db_error_codes(e):
+    # pyodbc errors carry (sqlstate, message); the message embeds native error numbers as "(40613)"
+    sqlstate = e.args[0] if e.args and isinstance(e.args[0], str) else ''
+    message = e.args[1] if len(e.args) > 1 and isinstance(e.args[1], str) else ''
+    return sqlstate, {int(number) for number in sql_error_number_pattern.findall(message)}
+
+def is_transient_db_error(e):
+    if pyodbc is None or not isinstance(e, pyodbc.Error):
+        return False
+    sqlstate, numbers = db_error_codes(e)
+    return sqlstate in transient_sqlstates or bool(numbers & transient_error_numbers)
+
+def is_connection_db_error(e):
+    sqlstate, numbers = db_error_codes(e)
+    return sqlstate.startswith('08') or bool(numbers & connection_error_numbers)
+
+def backoff_delay(attempt):
+    # Full jitter: spreads retries from many instances instead of having them hit the database in step
+    return random.uniform(0, min(retry_max_delay, retry_base_delay * 2 ** attempt))
+
+class DatabaseUnavailableError(Exception):
+    """
+    Raised without touching the database while its circuit breaker is open.
+    """
+
+    def __init__(self, retry_after, message='Database is temporarily unavailable, please retry later'):
+        super().__init__(message)
+        self.retry_after = max(int(math.ceil(retry_after)), 1)
+
+class PoolExhaustedError(DatabaseUnavailableError):
+    """
+    Raised when no pooled connection was freed within the pool wait threshold.
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(retry_after, 'Server is busy, please retry later')
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive transient failures so that requests fail fast
+    instead of piling onto an unhealthy database. After reset_timeout one probe request is let
+    through (half-open); its outcome closes the breaker again or re-opens it.
+    """
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started_at = None
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.state == 'closed':
+                return
+            now = time.monotonic()
+            if self.state == 'open':
+                if now - self.opened_at < self.reset_timeout:
+                    raise DatabaseUnavailableError(self.reset_timeout - (now - self.opened_at))
+                self.state = 'half-open'
+                self.probe_started_at = None
+            # Half-open: let one probe through; a probe that never reported back is replaced after reset_timeout
+            if self.probe_started_at is not None and now - self.probe_started_at < self.reset_timeout:
+                raise DatabaseUnavailableError(self.reset_timeout)
+            self.probe_started_at = now
+
+    def record_success(self):
+        with self.lock:
+            if self.state != 'closed':
+                logging.info('Circuit breaker %s closed', self.name)
+            self.state = 'closed'
+            self.failures = 0
+            self.probe_started_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'half-open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logging.warning('Circuit breaker %s opened after %s transient failures', self.name, self.failures)
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self.probe_started_at = None
+
+    def record_outcome(self, e):
+        # Only transient errors count against the database; any other error still means it answered
+        if is_transient_db_error(e):
+            self.record_failure()
+        else:
+            self.record_success()
+
+class StatementCatalog:
+    """
+    Named, parameterized SQL statements. Cursors execute statements by name only, so every
+    text sent to SQL Server is fixed and reuses its cached plan; values always travel as ?
+    parameters. Execution counts and timings are kept per statement name.
+    """
+
+    def __init__(self):
+        self.statements = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def register(self, name, sql):
+        # A name always maps to one text, so a statement with values interpolated into it fails on
+        # its second distinct value instead of silently compiling a new plan per call
+        with self.lock:
+            existing = self.statements.get(name)
+            if existing is not None and existing != sql:
+                raise ValueError(f'Statement {name} is already registered with different text; pass values as ? parameters')
+            self.statements[name] = sql
+            self.stats.setdefault(name, {'count': 0, 'errors': 0, 'totalMs': 0.0, 'maxMs': 0.0})
+        return name
+
+    def sql(self, name):
+        try:
+            return self.statements[name]
+        except KeyError:
+            raise KeyError(f'Unknown statement {name!r}: SQL must be registered in the statement catalog') from None
+
+    def record(self, name, elapsed, failed=False):
+        elapsed_ms = elapsed * 1000
+        with self.lock:
+            stats = self.stats[name]
+            stats['count'] += 1
+            stats['errors'] += failed
+            stats['totalMs'] += elapsed_ms
+            stats['maxMs'] = max(stats['maxMs'], elapsed_ms)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: {
+                    'count': stats['count'],
+                    'errors': stats['errors'],
+                    'totalMs': round(stats['totalMs'], 3),
+                    'avgMs': round(stats['totalMs'] / stats['count'], 3) if stats['count'] else None,
+                    'maxMs': round(stats['maxMs'], 3)
+                }
+                for name, stats in sorted(self.stats.items())
+            }
+
+sql_statements = StatementCatalog()
+
+health_check_query = sql_statements.register('health.check', "SELECT 1")
+
+# Connection pool settings
+pool_min_size = int(os.getenv('DB_POOL_MIN_SIZE', '2'))
+pool_max_size = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+pool_timeout = float(os.getenv('DB_POOL_TIMEOUT_SECONDS', '5'))
+pool_retry_after = float(os.getenv('DB_POOL_RETRY_SECONDS', '2'))
+pool_max_idle = float(os.getenv('DB_POOL_MAX_IDLE_SECONDS', '300'))
+
+class ConnectionPool:
+    """
+    Keeps open connections for reuse across requests so that each request does not pay for
+    the login handshake. At most max_size connections are handed out at once; callers wait
+    up to timeout seconds for one to be returned.
+    """
+
+    def __init__(self, name, connection_string, min_size, max_size, timeout, max_idle, on_connect=None):
+        self.name = name
+        self.connection_string = connection_string
+        self.on_connect = on_connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.idle = []
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.lock = threading.Lock()
+        self.breaker = CircuitBreaker(name, breaker_failure_threshold, breaker_reset_timeout)
+
+    def connect(self):
+        # Open a new connection, retrying transient failures with jittered exponential backoff
+        attempt = 0
+        while True:
+            try:
+                connection = get_pyodbc().connect(self.connection_string, timeout=connect_timeout)
+                connection.timeout = query_timeout
+                if self.on_connect is not None:
+                    self.on_connect(connection)
+                self.breaker.record_success()
+                return connection
+            except Exception as e:
+                self.breaker.record_outcome(e)
+                attempt += 1
+                if not is_transient_db_error(e) or attempt >= retry_attempts:
+                    raise
+                logging.warning('Transient error connecting to %s (attempt %s): %s', self.name, attempt, e)
+                time.sleep(backoff_delay(attempt))
+                self.breaker.before_call()
+
+    def acquire(self, read_only=False):
+        # Fail fast while the database is known to be unhealthy, even if idle connections are pooled
+        self.breaker.before_call()
+        if not self.slots.acquire(timeout=self.timeout):
+            # Shed the request (503) instead of letting it queue towards functionTimeout
+            raise PoolExhaustedError(pool_retry_after)
+        try:
+            while True:
+                with self.lock:
+                    entry = self.idle.pop() if self.idle else None
+                if entry is None:
+                    return PooledConnection(self, self.connect(), read_only)
+                connection, released_at = entry
+                if time.monotonic() - released_at <= self.max_idle:
+                    return PooledConnection(self, connection, read_only)
+                self.discard(connection)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, connection):
+        try:
+            # Drop any uncommitted work so the next request starts clean; a broken connection fails here
+            connection.rollback()
+            with self.lock:
+                self.idle.append((connection, time.monotonic()))
+        except Exception:
+            self.discard(connection)
+        finally:
+            self.slots.release()
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def prime(self, count):
+        # Open (or revalidate) up to count connections in parallel and leave them idle in the pool
+        count = min(count, self.max_size)
+
+        def open_connection(_):
+            conn = self.acquire(read_only=True)
+            conn.cursor().execute(health_check_query).fetchone()
+            return conn
+
+        with ThreadPoolExecutor(max_workers=max(count, 1)) as executor:
+            connections = list(executor.map(open_connection, range(count)))
+        for conn in connections:
+            conn.close()
+        return len(connections)
+
+class PooledConnection:
+    """
+    A pyodbc connection borrowed from a ConnectionPool; close() hands it back instead of closing it.
+    Statements on read-only connections are retried on transient errors.
+    """
+
+    def __init__(self, pool, connection, read_only=False):
+        self.__dict__['pool'] = pool
+        self.__dict__['connection'] = connection
+        self.__dict__['read_only'] = read_only
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.connection, name, value)
+
+    def cursor(self):
+        return RetryingCursor(self, self.connection.cursor())
+
+    def reconnect(self):
+        # Replace a dead connection with a fresh one; the pool slot stays with this borrower
+        self.pool.discard(self.connection)
+        self.__dict__['connection'] = self.pool.connect()
+
+    def close(self):
+        connection = self.__dict__['connection']
+        if connection is not None:
+            self.__dict__['connection'] = None
+            self.pool.release(connection)
+
+class RetryingCursor:
+    """
+    Cursor wrapper that reports statement outcomes to the pool's circuit breaker and, for
+    idempotent reads, retries transient failures with backoff (reconnecting if the link dropped).
+    """
+
+    def __init__(self, conn, cursor):
+        self.__dict__['conn'] = conn
+        self.__dict__['cursor'] = cursor
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.cursor, name, value)
+
+    def __iter__(self):
+        for row in self.cursor:
+            count_rows(1)
+            yield row
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            count_rows(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self.cursor.fetchmany() if size is None else self.cursor.fetchmany(size)
+        count_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        count_rows(len(rows))
+        return rows
+
+    def execute(self, name, *params):
+        query = sql_statements.sql(name)
+        breaker = self.conn.pool.breaker
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                self.cursor.execute(query, *params)
+                sql_statements.record(name, time.perf_counter() - started)
+                breaker.record_success()
+                return self
+            except Exception as e:
+                sql_statements.record(name, time.perf_counter() - started, failed=True)
+                breaker.record_outcome(e)
+                attempt += 1
+                if not self.conn.read_only or not is_transient_db_error(e) or attempt >= retry_attempts:
+                    raise
+                logging.warning('Transient error on read (attempt %s): %s', attempt, e)
+                time.sleep(backoff_delay(attempt))
+                breaker.before_call()
+                if is_connection_db_error(e):
+                    self.conn.reconnect()
+                    self.__dict__['cursor'] = self.conn.connection.cursor()
+
+    def executemany(self, name, params):
+        query = sql_statements.sql(name)
+        breaker = self.conn.pool.breaker
+        started = time.perf_counter()
+        try:
+            self.cursor.executemany(query, params)
+        except Exception as e:
+            sql_statements.record(name, time.perf_counter() - started, failed=True)
+            breaker.record_outcome(e)
+            raise
+        sql_statements.record(name, time.perf_counter() - started)
+        breaker.record_success()
+
+def db_unavailable_response(e):
+    return HttpResponse(
+        json.dumps({
+            'status': 'error',
+            'message': str(e)
+        }),
+        status_code=503,
+        headers={'Retry-After': str(e.retry_after)},
+        mimetype="application/json"
+    )
+
+db_pool = ConnectionPool('primary', conn_str, pool_min_size, pool_max_size, pool_timeout, pool_max_idle)
+
+def get_db_connection(read_only=False):
+    return db_pool.acquire(read_only)
+
+# Read replica settings. Read-only routes use a separate ApplicationIntent=ReadOnly connection
+# (DB_READ_SERVER, or the primary server's readable secondary) with its own pool.
+read_replica_enabled = os.getenv('DB_READ_REPLICA_ENABLED', 'false').lower() == 'true'
+read_server = os.getenv('DB_READ_SERVER', server)
+read_conn_str = f'DRIVER={{ODBC Driver 18 for SQL Server}};SERVER={read_server};DATABASE={database};UID={username};PWD={password};TrustServerCertificate=yes;ApplicationIntent=ReadOnly;'
+read_max_lag = float(os.getenv('DB_READ_MAX_LAG_SECONDS', '30'))
+read_lag_check_interval = float(os.getenv('DB_READ_LAG_CHECK_SECONDS', '10'))
+read_retry_after = float(os.getenv('DB_READ_RETRY_SECONDS', '30'))
+
+# Estimated seconds of log the local secondary still has to redo
+read_lag_query = sql_statements.register('replica.lag', os.getenv('DB_READ_LAG_QUERY', """
+    SELECT CASE WHEN redo_rate > 0 THEN CAST(redo_queue_size AS float) / redo_rate ELSE 0 END
+    FROM sys.dm_hadr_database_replica_states
+    WHERE is_local = 1 AND database_id = DB_ID()
+"""))
+
+read_db_pool = ConnectionPool(
+    'read-replica', read_conn_str, pool_min_size,
+    int(os.getenv('DB_READ_POOL_MAX_SIZE', str(pool_max_size))),
+    pool_timeout, pool_max_idle
+) if read_replica_enabled else None
+
+read_replica_state = {'unavailableUntil': 0.0, 'lagCheckedAt': 0.0, 'lagSeconds': None, 'reason': None}
+read_replica_lock = threading.Lock()
+
+def mark_read_replica_unavailable(reason):
+    logging.warning('Read replica unavailable, using primary for %ss: %s', read_retry_after, reason)
+    read_replica_state['unavailableUntil'] = time.monotonic() + read_retry_after
+    read_replica_state['reason'] = reason
+
+def read_replica_lag_check_due():
+    # Only one request re-checks the lag per interval; the rest trust the last result
+    with read_replica_lock:
+        if time.monotonic() - read_replica_state['lagCheckedAt'] < read_lag_check_interval:
+            return False
+        read_replica_state['lagCheckedAt'] = time.monotonic()
+        return True
+
+def get_read_db_connection(fallback=get_db_connection):
+    """
+    Connection for read-only routes: the read replica when it is enabled, reachable and no more
+    than DB_READ_MAX_LAG_SECONDS behind, otherwise a connection from fallback (the primary pool).
+    """
+    if read_db_pool is None or time.monotonic() < read_replica_state['unavailableUntil']:
+        return fallback(read_only=True)
+
+    try:
+        conn = read_db_pool.acquire(read_only=True)
+    except PoolExhaustedError:
+        # The replica pool is busy rather than unhealthy; borrow from the primary for this request
+        return fallback(read_only=True)
+    except Exception as e:
+        mark_read_replica_unavailable(f'connection failed: {e}')
+        return fallback(read_only=True)
+
+    if read_replica_lag_check_due():
+        try:
+            cursor = conn.cursor()
+            row = cursor.execute(read_lag_query).fetchone()
+            cursor.close()
+            read_replica_state['lagSeconds'] = float(row[0]) if row and row[0] is not None else 0.0
+        except Exception as e:
+            conn.close()
+            mark_read_replica_unavailable(f'lag check failed: {e}')
+            return fallback(read_only=True)
+
+    if read_replica_state['lagSeconds'] is not None and read_replica_state['lagSeconds'] > read_max_lag:
+        conn.close()
+        mark_read_replica_unavailable(f"lagging {read_replica_state['lagSeconds']:.1f}s behind the primary")
+        return fallback(read_only=True)
+
+    return conn
+
+# Reporting routes scan whole tables. On the primary they use their own pool whose connections
+# read under SNAPSHOT isolation (DB_REPORT_ISOLATION=snapshot): the scans see a consistent
+# version of the data without taking shared locks, so they neither wait on nor hold up payment
+# writes. Readable secondaries already map every read to snapshot isolation.
+report_isolation = os.getenv('DB_REPORT_ISOLATION', 'snapshot').lower()
+report_pool_max_size = int(os.getenv('DB_REPORT_POOL_MAX_SIZE', '4'))
+
+snapshot_isolation_state_query = sql_statements.register('session.snapshot_isolation_state', """
+    SELECT snapshot_isolation_state FROM sys.databases WHERE database_id = DB_ID()
+""")
+snapshot_isolation_query = sql_statements.register('session.snapshot_isolation', "SET TRANSACTION ISOLATION LEVEL SNAPSHOT")
+
+def use_snapshot_isolation(connection):
+    # Session-level setting, so it holds for every transaction on this pooled connection
+    cursor = connection.cursor()
+    try:
+        row = cursor.execute(sql_statements.sql(snapshot_isolation_state_query)).fetchone()
+        # The level cannot change to SNAPSHOT inside the transaction that query opened
+        connection.rollback()
+        if row and row[0] == 1:
+            cursor.execute(sql_statements.sql(snapshot_isolation_query))
+        else:
+            logging.warning('ALLOW_SNAPSHOT_ISOLATION is off for %s, reports read under READ COMMITTED '
+                            '(apply migration V004)', database)
+    finally:
+        cursor.close()
+
+report_db_pool = ConnectionPool(
+    'primary-reports', conn_str, 0, report_pool_max_size, pool_timeout, pool_max_idle,
+    on_connect=use_snapshot_isolation if report_isolation == 'snapshot' else None
+)
+
+def get_report_db_connection():
+    """
+    Connection for the reporting routes: the read replica when it is usable, otherwise the
+    reporting pool on the primary.
+    """
+    return get_read_db_connection(fallback=report_db_pool.acquire)
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with a time to live per entry.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+class SingleFlight:
+    """
+    Lets concurrent callers with the same key share one execution: the first caller runs it and
+    the others wait for its result (or exception) instead of repeating the work.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'done': threading.Event(), 'result': None, 'error': None}
+                self.calls[key] = call
+
+        if leader:
+            try:
+                call['result'] = fn()
+            except Exception as e:
+                call['error'] = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call['done'].set()
+        else:
+            call['done'].wait()
+
+        if call['error'] is not None:
+            raise call['error']
+        return call['result']
+
+request_flights = SingleFlight()
+
+def request_flight_key(function_name, req):
+    # Route plus sorted route and query parameters, so ?a=1&b=2 and ?b=2&a=1 share a flight. Names
+    # and values are kept exactly as sent: handlers read them case-sensitively and unstripped
+    route_params = sorted((k, str(v)) for k, v in req.route_params.items())
+    query_params = sorted((k, str(v)) for k, v in req.params.items())
+    return (function_name, tuple(route_params), tuple(query_params))
+
+def coalesce_requests(handler):
+    """
+    Decorator for read-only handlers: identical concurrent requests wait on one in-flight
+    execution and each receive a copy of its encoded response.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(req: func.HttpRequest) -> func.HttpResponse:
+        led = False
+
+        def run():
+            nonlocal led
+            led = True
+            response = handler(req)
+            return (response.get_body(), response.status_code, response.mimetype, dict(response.headers),
+                    getattr(request_state, 'rows', None))
+
+        body, status_code, mimetype, headers, rows = request_flights.do(request_flight_key(handler.__name__, req), run)
+        if not led and getattr(request_state, 'rows', None) is not None:
+            # The rows were fetched on the leader's thread; log them for this request as well
+            request_state.rows = rows or 0
+            request_state.coalesced = True
+        return HttpResponse(body, status_code=status_code, mimetype=mimetype, headers=headers)
+
+    return wrapper
+
+# Shared response cache. With CACHE_REDIS_URL set, cached responses live in a Redis-protocol
+# server shared by all instances; CACHE_BACKEND=memory keeps them per instance instead
+cache_redis_url = os.getenv('CACHE_REDIS_URL')
+cache_backend = os.getenv('CACHE_BACKEND', 'redis' if cache_redis_url else 'none').lower()
+cache_key_version = os.getenv('CACHE_KEY_VERSION', '1')
+cache_report_ttl = int(os.getenv('CACHE_REPORT_TTL_SECONDS', '300'))
+cache_lookup_ttl = int(os.getenv('CACHE_LOOKUP_TTL_SECONDS', '60'))
+cache_memory_max_entries = int(os.getenv('CACHE_MEMORY_MAX_ENTRIES', '1000'))
+cache_socket_timeout = float(os.getenv('CACHE_SOCKET_TIMEOUT_SECONDS', '0.5'))
+cache_retry_after = float(os.getenv('CACHE_RETRY_SECONDS', '30'))
+
+# Like pyodbc, the redis client is only imported when the redis backend is used
+redis = None
+
+def get_redis():
+    global redis
+    if redis is None:
+        redis = importlib.import_module('redis')
+    return redis
+
+class MemoryCacheBackend:
+    """
+    Per-instance cache backend. Values are evicted least recently used; namespace version
+    counters are kept separately so they are never evicted.
+    """
+
+    def __init__(self, max_size):
+        self.values = LRUCache(max_size, cache_report_ttl)
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        with self.lock:
+            counters = {key: self.counters[key] for key in keys if key in self.counters}
+        return [counters[key] if key in counters else self.values.get(key) for key in keys]
+
+    def set(self, key, value, ttl):
+        self.values.set(key, value, ttl)
+
+    def init_counter(self, key, value):
+        with self.lock:
+            self.counters.setdefault(key, value)
+
+    def incr(self, key):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+class RedisCacheBackend:
+    """
+    Cache backend on any server speaking the Redis protocol (Redis, Azure Cache for Redis,
+    Valkey). Connections come from the client's own pool.
+    """
+
+    def __init__(self, url):
+        self.client = get_redis().Redis.from_url(
+            url, socket_timeout=cache_socket_timeout, socket_connect_timeout=cache_socket_timeout)
+
+    def get_many(self, keys):
+        return self.client.mget(keys)
+
+    def set(self, key, value, ttl):
+        self.client.set(key, value, ex=ttl)
+
+    def init_counter(self, key, value):
+        self.client.set(key, value, nx=True)
+
+    def incr(self, key):
+        self.client.incr(key)
+
+class SharedCache:
+    """
+    Versioned response cache. Every key embeds the current version of the namespaces its data
+    depends on ('payments', 'students', 'loan:<id>'), and writes invalidate by bumping those
+    versions, so entries of every instance go stale at once without enumerating keys. A reader
+    fetches the versions before querying, so a response computed concurrently with a write is
+    stored under the old version and never served. While the Redis backend is unreachable the
+    per-instance memory backend stands in for CACHE_RETRY_SECONDS; versions bumped in the
+    meantime are bumped on Redis when it is reachable again, before anything is read from it.
+    """
+
+    def __init__(self, backend, fallback):
+        self.backend = backend
+        self.fallback = fallback
+        self.unavailable_until = 0.0
+        # Version keys whose invalidation did not reach the Redis backend
+        self.pending_invalidations = set()
+        self.lock = threading.Lock()
+
+    def active_backend(self):
+        if self.backend is None or time.monotonic() < self.unavailable_until:
+            return self.fallback
+        if self.pending_invalidations and not self.replay_invalidations():
+            return self.fallback
+        return self.backend
+
+    def mark_unavailable(self, e):
+        logging.warning('Cache backend unavailable, using the local cache for %ss: %s', cache_retry_after, e)
+        self.unavailable_until = time.monotonic() + cache_retry_after
+
+    def replay_invalidations(self):
+        # Callers wait on the lock, so none of them reads an entry an unreplayed write made stale
+        with self.lock:
+            try:
+                while self.pending_invalidations:
+                    key = next(iter(self.pending_invalidations))
+                    self.backend.incr(key)
+                    self.pending_invalidations.discard(key)
+                return True
+            except Exception as e:
+                self.mark_unavailable(e)
+                return False
+
+    def call(self, operation, *args):
+        backend = self.active_backend()
+        if backend is not self.backend and self.backend is not None and operation == 'incr':
+            with self.lock:
+                self.pending_invalidations.add(args[0])
+        if backend is None:
+            return None
+        try:
+            return getattr(backend, operation)(*args)
+        except Exception as e:
+            if backend is self.fallback:
+                raise
+            self.mark_unavailable(e)
+            if operation == 'incr':
+                with self.lock:
+                    self.pending_invalidations.add(args[0])
+            return getattr(self.fallback, operation)(*args) if self.fallback is not None else None
+
+    def version_key(self, namespace):
+        return f'studentloan:v{cache_key_version}:ns:{namespace}'
+
+    def versions(self, namespaces):
+        keys = [self.version_key(namespace) for namespace in namespaces]
+        if not keys:
+            return []
+        versions = self.call('get_many', keys)
+        if versions is not None and None in versions:
+            for key, version in zip(keys, versions):
+                if version is None:
+                    # Start unseen (or evicted) namespaces at a fresh value rather than 0, so
+                    # entries written under an earlier counter can never be matched again
+                    self.call('init_counter', key, time.time_ns())
+            versions = self.call('get_many', keys)
+        if versions is None or None in versions:
+            return None
+        return [int(version) for version in versions]
+
+    def key(self, name, namespaces, parts):
+        versions = self.versions(namespaces)
+        if versions is None:
+            return None
+        digest = hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+        tags = ','.join(f'{namespace}={version}' for namespace, version in zip(namespaces, versions))
+        return f'studentloan:v{cache_key_version}:{name}:{tags}:{digest}'
+
+    def get(self, key):
+        values = self.call('get_many', [key])
+        return values[0] if values else None
+
+    def set(self, key, value, ttl):
+        self.call('set', key, value, ttl)
+
+    def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            self.call('incr', self.version_key(namespace))
+
+def new_shared_cache():
+    fallback = MemoryCacheBackend(cache_memory_max_entries) if cache_backend in ('redis', 'memory') else None
+    if cache_backend == 'redis' and cache_redis_url:
+        try:
+            return SharedCache(RedisCacheBackend(cache_redis_url), fallback)
+        except Exception as e:
+            logging.warning('Redis cache backend unavailable, using the local cache: %s', e)
+    return SharedCache(None, fallback)
+
+response_cache = new_shared_cache()
+
+def invalidate_cached(*namespaces):
+    # Called after a write commits; a cache failure must not fail a committed write
+    try:
+        response_cache.invalidate(*namespaces)
+    except Exception as e:
+        logging.warning('Cache invalidation of %s failed: %s', namespaces, e)
+
+def loan_namespace(req):
+    # Normalized so /loans/0101/payments and a payment to loan 101 share a namespace
+    try:
+        return f"loan:{int(req.route_params.get('loanid'))}"
+    except (TypeError, ValueError):
+        return None
+
+def cache_response(ttl, *namespaces):
+    """
+    Decorator for read-only handlers: successful JSON responses are cached for ttl seconds
+    under the sorted route and query parameters. namespaces are names, or functions of the
+    request returning one (None skips the cache for that request).
+    """
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(req: func.HttpRequest) -> func.HttpResponse:
+            if response_cache.active_backend() is None:
+                return handler(req)
+
+            try:
+                request_namespaces = [namespace(req) if callable(namespace) else namespace for namespace in namespaces]
+                key = None
+                if None not in request_namespaces:
+                    key = response_cache.key(handler.__name__, request_namespaces, request_flight_key(handler.__name__, req))
+                body = response_cache.get(key) if key else None
+            except Exception as e:
+                logging.warning('Cache lookup failed: %s', e)
+                key = body = None
+
+            if body is not None:
+                return HttpResponse(body, status_code=200, mimetype="application/json", headers={'X-Cache': 'hit'})
+
+            response = handler(req)
+            if key and response.status_code == 200:
+                try:
+                    response_cache.set(key, response.get_body(), ttl)
+                except Exception as e:
+                    logging.warning('Cache store failed: %s', e)
+            return response
+
+        return wrapper
+
+    return decorator
+
+# Admission control: each route belongs to a budget with its own concurrency limit (shared by the
+# budget's routes on this instance) and per-client token bucket, so a burst of expensive reports
+# cannot starve point lookups and payments of database connections. Off unless enabled, since it
+# sheds requests that were served before
+admission_enabled = os.getenv('ADMISSION_CONTROL_ENABLED', 'false').lower() == 'true'
+# Header the edge in front of the app sets to the caller's address (e.g. X-Azure-ClientIP behind
+# Front Door); when unset, the X-Forwarded-For entry the platform front end appended is used
+admission_client_header = os.getenv('ADMISSION_CLIENT_IP_HEADER')
+admission_queue_timeout = float(os.getenv('ADMISSION_QUEUE_SECONDS', '1'))
+admission_retry_after = float(os.getenv('ADMISSION_RETRY_SECONDS', '1'))
+admission_max_clients = int(os.getenv('ADMISSION_MAX_CLIENTS', '10000'))
+
+class RateLimiter:
+    """
+    Token bucket per client: rate tokens per second, up to burst tokens. The least recently
+    seen clients are dropped beyond max_clients (they start again with a full bucket).
+    """
+
+    def __init__(self, rate, burst, max_clients):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def try_acquire(self, client):
+        # Returns 0 if the request may proceed, otherwise the seconds until a token is available
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated_at = self.buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / self.rate
+            self.buckets[client] = (tokens - 1 if not wait else tokens, now)
+            if len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+            return wait
+
+class AdmissionBudget:
+    def __init__(self, name, max_concurrent, rate, burst):
+        self.name = name
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.limiter = RateLimiter(rate, burst, admission_max_clients)
+
+def new_admission_budget(name, max_concurrent, rate, burst):
+    prefix = f'ADMISSION_{name.upper()}_'
+    return AdmissionBudget(
+        name,
+        int(os.getenv(prefix + 'CONCURRENCY', str(max_concurrent))),
+        float(os.getenv(prefix + 'RATE', str(rate))),
+        float(os.getenv(prefix + 'BURST', str(burst)))
+    )
+
+admission_budgets = {
+    # Full scans and aggregates
+    'reports': new_admission_budget('reports', 2, 1, 5),
+    # Indexed point reads
+    'lookups': new_admission_budget('lookups', 6, 20, 40),
+    # make-payment and the student/loan updates
+    'writes': new_admission_budget('writes', 4, 5, 10),
+}
+
+def client_id(req):
+    # The caller's address as set by our own front end, without its port. Earlier X-Forwarded-For
+    # hops come from the client and can be anything, so only the last one is used. None when the
+    # request carries no address (only calls that do not come through the front end)
+    if admission_client_header:
+        address = req.headers.get(admission_client_header, '').strip()
+    else:
+        address = req.headers.get('X-Forwarded-For', '').split(',')[-1].strip()
+    if address.count(':') == 1:
+        address = address.split(':')[0]
+    return address or None
+
+def shed_response(status_code, message, retry_after):
+    return HttpResponse(
+        json.dumps({
+            'status': 'error',
+            'message': message
+        }),
+        status_code=status_code,
+        headers={'Retry-After': str(max(int(math.ceil(retry_after)), 1))},
+        mimetype="application/json"
+    )
+
+def rate_limit(budget_name):
+    """
+    Decorator: 429 with Retry-After once the caller has used up the budget's token bucket.
+    Goes above coalesce_requests so every request counts against its own client.
+    """
+    budget = admission_budgets[budget_name]
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(req: func.HttpRequest) -> func.HttpResponse:
+            if admission_enabled:
+                # Requests without a client address are not pooled into one shared bucket; the
+                # budget's concurrency limit still applies to them
+                client = client_id(req)
+                wait = budget.limiter.try_acquire(client) if client else 0
+                if wait:
+                    return shed_response(429, 'Too many requests, please retry later', wait)
+            return handler(req)
+
+        return wrapper
+
+    return decorator
+
+def limit_concurrency(budget_name):
+    """
+    Decorator: at most the budget's concurrency limit of executions at once; a request that
+    cannot get a slot within ADMISSION_QUEUE_SECONDS gets a 503 with Retry-After. Goes below
+    coalesce_requests so requests waiting on a shared flight do not hold a slot.
+    """
+    budget = admission_budgets[budget_name]
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(req: func.HttpRequest) -> func.HttpResponse:
+            if not admission_enabled:
+                return handler(req)
+            if not budget.slots.acquire(timeout=admission_queue_timeout):
+                return shed_response(503, 'Server is busy, please retry later', admission_retry_after)
+            try:
+                return handler(req)
+            finally:
+                budget.slots.release()
+
+        return wrapper
+
+    return decorator
+
+# Per-request profiling, for finding where the Python time of a slow route goes in production.
+# Off unless PROFILE_TOKEN is set; then a request sending that token in X-Profile-Token runs
+# under cProfile. At most one profiled request per PROFILE_INTERVAL_SECONDS per instance
+profile_token = os.getenv('PROFILE_TOKEN')
+profile_dir = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'profiles'))
+profile_max_files = int(os.getenv('PROFILE_MAX_FILES', '20'))
+profile_interval = float(os.getenv('PROFILE_INTERVAL_SECONDS', '60'))
+profile_top_functions = 40
+
+profile_limiter = RateLimiter(1 / profile_interval, 1, 1)
+profile_lock = threading.Lock()
+
+def profile_summary(profiler):
+    # The profile's functions by cumulative time: handler frames, json encoding and the
+    # pyodbc fetch calls all show up here
+    import pstats
+
+    stats = pstats.Stats(profiler)
+    functions = [
+        {
+            'function': function_name,
+            'location': f'{file_name}:{line}',
+            'calls': calls,
+            'ownMs': round(own_time * 1000, 3),
+            'cumulativeMs': round(cumulative_time * 1000, 3)
+        }
+        for (file_name, line, function_name), (_, calls, own_time, cumulative_time, _) in stats.stats.items()
+    ]
+    functions.sort(key=lambda entry: entry['cumulativeMs'], reverse=True)
+    return functions[:profile_top_functions]
+
+def save_profile(profiler, function_name):
+    # pstats file, readable with python -m pstats or snakeviz; only the newest PROFILE_MAX_FILES are kept
+    os.makedirs(profile_dir, exist_ok=True)
+    file_name = f"{function_name}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.prof"
+    profiler.dump_stats(os.path.join(profile_dir, file_name))
+    paths = sorted((os.path.join(profile_dir, name) for name in os.listdir(profile_dir) if name.endswith('.prof')),
+                   key=os.path.getmtime)
+    for path in paths[:-profile_max_files]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return file_name
+
+def profile_request(handler):
+    """
+    Decorator, directly below @app.route: with X-Profile-Token matching PROFILE_TOKEN the
+    request runs under cProfile. The profile is written to PROFILE_DIR and named in the
+    X-Profile-File response header, or with X-Profile-Output: inline the top functions are
+    returned instead of the response body. Without PROFILE_TOKEN the handler is not wrapped.
+    """
+    if not profile_token:
+        return handler
+
+    @functools.wraps(handler)
+    def wrapper(req: func.HttpRequest) -> func.HttpResponse:
+        token = req.headers.get('X-Profile-Token')
+        if token is None:
+            return handler(req)
+
+        # Limited before the token is checked, so guessing it is limited too
+        wait = profile_limiter.try_acquire('profile')
+        if wait:
+            return shed_response(429, 'Profiling rate limit reached, please retry later', wait)
+        if not hmac.compare_digest(token.encode(), profile_token.encode()):
+            return HttpResponse(
+                json.dumps({
+                    'status': 'error',
+                    'message': 'Invalid profile token'
+                }),
+                status_code=403,
+                mimetype="application/json"
+            )
+        # cProfile cannot run twice at once in one process
+        if not profile_lock.acquire(blocking=False):
+            return shed_response(429, 'Another request is being profiled, please retry later', 1)
+
+        try:
+            import cProfile
+
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = handler(req)
+            finally:
+                profiler.disable()
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+            logging.info('Profiled %s: %sms', handler.__name__, elapsed_ms)
+
+            if req.headers.get('X-Profile-Output', '').lower() == 'inline':
+                return HttpResponse(
+                    json.dumps({
+                        'status': 'success',
+                        'function': handler.__name__,
+                        'statusCode': response.status_code,
+                        'responseBytes': len(response.get_body()),
+                        'elapsedMs': elapsed_ms,
+                        'functions': profile_summary(profiler)
+                    }),
+                    status_code=200,
+                    mimetype="application/json"
+                )
+
+            response.headers['X-Profile-File'] = save_profile(profiler, handler.__name__)
+            response.headers['X-Profile-Elapsed-Ms'] = str(elapsed_ms)
+            return response
+        finally:
+            profile_lock.release()
+
+    return wrapper
+
+# Request logging: one structured record per request (function, route, status, duration, rows
+# fetched), handed to a queue and written by a background thread so the request thread never
+# waits on log I/O. Successful requests are sampled at LOG_SAMPLE_RATE; errors and requests
+# slower than LOG_SLOW_REQUEST_MS are always logged.
+log_sample_rate = float(os.getenv('LOG_SAMPLE_RATE', '0.1'))
+log_slow_request_ms = float(os.getenv('LOG_SLOW_REQUEST_MS', '1000'))
+log_queue_size = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that drops records (and counts them) when the queue is full instead of
+    blocking the request thread or raising.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+request_log_queue = Queue(log_queue_size)
+request_log_handler = DroppingQueueHandler(request_log_queue)
+request_logger = logging.getLogger('studentloan.requests')
+request_logger.setLevel(logging.INFO)
+request_logger.propagate = False
+request_logger.addHandler(request_log_handler)
+
+# Writes to whatever handlers the host installed on the root logger (the Functions worker's in Azure)
+request_log_listener = logging.handlers.QueueListener(
+    request_log_queue, *(logging.getLogger().handlers or [logging.StreamHandler()]), respect_handler_level=True)
+request_log_listener.start()
+atexit.register(request_log_listener.stop)
+
+# Rows fetched by the current request's cursors, counted by RetryingCursor, and whether the
+# request was answered by another request's coalesced execution
+request_state = threading.local()
+
+def count_rows(count):
+    rows = getattr(request_state, 'rows', None)
+    if rows is not None:
+        request_state.rows = rows + count
+
+def invocation_fields(context):
+    # The record is written on the listener thread, where the worker no longer knows which
+    # invocation it belongs to, so the IDs are copied into the record on the request thread
+    if context is None:
+        return {}
+    fields = {'invocationId': context.invocation_id}
+    trace_parent = getattr(getattr(context, 'trace_context', None), 'trace_parent', None) or ''
+    # traceparent is version-traceid-parentid-flags; the trace ID is the operation ID
+    parts = trace_parent.split('-')
+    if len(parts) == 4:
+        fields['operationId'] = parts[1]
+        fields['parentId'] = parts[2]
+    return fields
+
+def log_request(handler):
+    """
+    Decorator, directly below @app.route: times the request and logs its structured record.
+    The wrapper takes the invocation context, which the worker passes to a parameter named
+    context, for the invocation and operation IDs.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(req: func.HttpRequest, context: func.Context = None) -> func.HttpResponse:
+        request_state.rows = 0
+        request_state.coalesced = False
+        started = time.perf_counter()
+        status_code = 500
+        response = None
+        try:
+            response = handler(req)
+            status_code = response.status_code
+            return response
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            rows = request_state.rows
+            request_state.rows = None
+            if status_code >= 500:
+                level = logging.ERROR
+            elif status_code >= 400 or duration_ms >= log_slow_request_ms:
+                level = logging.WARNING
+            elif random.random() < log_sample_rate:
+                level = logging.INFO
+            else:
+                level = None
+            if level is not None:
+                fields = {
+                    'function': handler.__name__,
+                    'method': req.method,
+                    'route': urlsplit(req.url).path,
+                    'status': status_code,
+                    'durationMs': round(duration_ms, 1),
+                    'rows': rows,
+                    'coalesced': request_state.coalesced,
+                    'cacheHit': response is not None and response.headers.get('X-Cache') == 'hit',
+                    'sampleRate': 1 if level != logging.INFO else log_sample_rate,
+                    'droppedLogRecords': request_log_handler.dropped,
+                    **invocation_fields(context)
+                }
+                request_logger.log(level, json.dumps(fields), extra={'custom_dimensions': fields})
+
+    # functools.wraps makes the worker read the handler's signature, which has no context
+    wrapper.__annotations__ = {**handler.__annotations__, 'context': func.Context}
+    wrapper.__signature__ = inspect.signature(wrapper, follow_wrapped=False)
+    return wrapper
+
+# Rows fetched per round trip by handlers that stream a large result set
+fetch_batch_size = int(os.getenv('DB_FETCH_BATCH_SIZE', '1000'))
+
+def iter_rows(cursor, batch_size=None):
+    # Yield the current result set in cursor.arraysize batches, so only one batch of raw rows is
+    # held at a time instead of the whole set that fetchall() returns
+    cursor.arraysize = batch_size or fetch_batch_size
+    while True:
+        rows = cursor.fetchmany()
+        if not rows:
+            break
+        yield from rows
 
 def decimal_default(obj):
     if isinstance(obj, Decimal):
         return str(obj)
     return obj
 
+def parse_fields(fields_param, allowed_fields):
+    # Resolve a comma-separated ?fields= list (case-insensitive) against a whitelist, keeping whitelist order
+    lookup = {field.lower(): field for field in allowed_fields}
+    requested = {field.strip().lower() for field in fields_param.split(',') if field.strip()}
+    if not requested:
+        raise ValueError(f'At least one field is required. Allowed fields: {", ".join(allowed_fields)}')
+    unknown = sorted(requested - lookup.keys())
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}. Allowed fields: {", ".join(allowed_fields)}')
+    return [field for field in allowed_fields if field.lower() in requested]
+
+response_shapes = ('rows', 'columnar')
+
+def parse_shape(params):
+    # ?shape=rows (default): one object per row; ?shape=columnar: column names once plus one array per row
+    shape = params.get('shape', 'rows').strip().lower()
+    if shape not in response_shapes:
+        raise ValueError(f'Unknown shape: {shape}. Allowed shapes: {", ".join(response_shapes)}')
+    return shape
+
+report_modes = ('app', 'server')
+
+# Month names of both report modes, fixed rather than taken from the session language
+month_names = ('January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September',
+               'October', 'November', 'December')
+
+def parse_report_mode(params):
+    # ?mode=app (default): rows are reshaped into the report tree here; ?mode=server: SQL Server
+    # builds the whole JSON document with FOR JSON and it is passed through as is. Both modes
+    # return the same document: months in calendar order named from month_names, and amounts
+    # summed as exact decimals
+    mode = params.get('mode', 'app').strip().lower()
+    if mode not in report_modes:
+        raise ValueError(f'Unknown mode: {mode}. Allowed modes: {", ".join(report_modes)}')
+    return mode
+
+def read_for_json(cursor):
+    # FOR JSON output arrives split over rows of up to 2033 characters
+    return ''.join(row[0] for row in iter_rows(cursor))
+
+def columnar_response(columns, rows):
+    return HttpResponse(
+        json.dumps({
+            'status': 'success',
+            'count': len(rows),
+            'columns': columns,
+            'rows': rows
+        },default=str),
+        status_code=200,
+        mimetype="application/json"
+    )
+
+def projection_tables(aliases, joins):
+    # The table aliases plus every alias their joins hang off
+    needed = set(aliases)
+    for alias, parent, _ in reversed(joins):
+        if alias in needed:
+            needed.add(parent)
+    return frozenset(needed)
+
+def build_projected_query(tables, field_specs, joins, from_clause, where_clause):
+    """
+    Build a SELECT of every field of the given tables, keeping only the joins to those tables.
+    field_specs maps each field to (SQL expression, table alias); joins is a list of
+    (alias, parent alias, join clause) in dependency order. Everything comes from the
+    whitelists, so the text is still fully parameterized. Projections are per table set rather
+    than per field set, so the joins a request skips are what saves the work, and the number of
+    distinct statements stays small and fixed; callers drop the fields they were not asked for.
+    """
+    select_list = ',\n        '.join(spec[0] for spec in field_specs.values() if spec[1] in tables)
+    join_list = ''.join(f'\n    {clause}' for alias, _, clause in joins if alias in tables)
+    return f"""
+    SELECT 
+        {select_list}
+    {from_clause}{join_list}
+    {where_clause}
+"""
+
+# Columns the lastname search can return: field -> (SQL expression, table alias it comes from)
+student_search_fields = MappingProxyType({
+    'StudentID': ('s.StudentID', 's'),
+    'FirstName': ('s.FirstName', 's'),
+    'LastName': ('s.LastName', 's'),
+    'HomeAddress': ('s.HomeAddress', 's'),
+    'PhoneNumber': ('c.PhoneNumber', 'c'),
+    'Email': ('c.Email', 'c'),
+    'CommunicationPreference': ('c.Preference as CommunicationPreference', 'c'),
+    'EnrollmentType': ('l.EnrollmentType', 'l'),
+    'LoanAmount': ('l.LoanAmount', 'l'),
+    'DisbursementDate': ('l.DisbursementDate', 'l'),
+    'LoanBalance': ('l.LoanBalance', 'l'),
+    'PercentagePaid': ('l.PercentagePaid', 'l'),
+    'ProgramOfStudy': ('si.ProgramOfStudy', 'si'),
+    'ProgramCode': ('si.ProgramCode', 'si'),
+    'CollegeName': ('ei.CollegeName', 'ei'),
+    'CollegeCity': ('ei.City as CollegeCity', 'ei'),
+    'Province': ('p.Province', 'p'),
+})
+
+# All LEFT JOINs on primary keys, so dropping one never changes which students are returned
+student_search_joins = (
+    ('c', 's', 'LEFT JOIN Communication c ON s.CommunicationID = c.CommunicationID'),
+    ('l', 's', 'LEFT JOIN LoanInfo l ON s.LoanInfoID = l.LoanInfoID'),
+    ('si', 'l', 'LEFT JOIN StudyInfo si ON l.StudyInfoID = si.StudyInfoID'),
+    ('ei', 'l', 'LEFT JOIN EducationInstitution ei ON l.EducationInstitutionID = ei.EducationInstitutionID'),
+    ('p', 'ei', 'LEFT JOIN Province p ON ei.ProvinceID = p.ProvinceID'),
+)
+
+def build_students_by_lastname_query(tables):
+    # One catalog statement per table set, named after its tables
+    name = 'students.by_lastname'
+    joined = [alias for alias, _, _ in student_search_joins if alias in tables]
+    if len(joined) < len(student_search_joins):
+        name += f'[{",".join(["s"] + joined)}]'
+    return sql_statements.register(name, build_projected_query(tables, student_search_fields, student_search_joins,
+                                                               'FROM Student s', 'WHERE s.LastName LIKE ?'))
+
+# Every table set a ?fields= list can need, registered up front: requests pick one of these
+# and never add statements to the catalog
+students_by_lastname_queries = {
+    tables: build_students_by_lastname_query(tables)
+    for tables in {
+        projection_tables({'s'} | {alias for i, (alias, _, _) in enumerate(student_search_joins) if included >> i & 1},
+                          student_search_joins)
+        for included in range(1 << len(student_search_joins))
+    }
+}
+
+students_by_lastname_query = build_students_by_lastname_query(frozenset(spec[1] for spec in student_search_fields.values()))
+
 @app.route(route="students/lastname/{lastname}")
+@log_request
+@profile_request
+@rate_limit('lookups')
+@coalesce_requests
+@cache_response(cache_lookup_ttl, 'students', 'payments')
+@limit_concurrency('lookups')
 def get_students_by_lastname(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request.')
-
     lastname = req.route_params.get('lastname')
     if not lastname:
         return HttpResponse(
@@ -47,44 +1409,43 @@ def get_students_by_lastname(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json"
         )
 
+    query = students_by_lastname_query
+    fields = None
     try:
-        conn = get_db_connection()
+        shape = parse_shape(req.params)
+        if req.params.get('fields'):
+            fields = parse_fields(req.params['fields'], tuple(student_search_fields))
+            tables = projection_tables({student_search_fields[field][1] for field in fields}, student_search_joins)
+            query = students_by_lastname_queries[tables]
+    except ValueError as e:
+        return HttpResponse(
+            json.dumps({
+                'status': 'error',
+                'message': str(e)
+            }),
+            status_code=400,
+            mimetype="application/json"
+        )
+
+    try:
+        conn = get_read_db_connection()
         cursor = conn.cursor()
         
-        query = """
-            SELECT 
-                s.StudentID,
-                s.FirstName,
-                s.LastName,
-                s.HomeAddress,
-                c.PhoneNumber,
-                c.Email,
-                c.Preference as CommunicationPreference,
-                l.EnrollmentType,
-                l.LoanAmount,
-                l.DisbursementDate,
-                l.LoanBalance,
-                l.PercentagePaid,
-                si.ProgramOfStudy,
-                si.ProgramCode,
-                ei.CollegeName,
-                ei.City as CollegeCity,
-                p.Province
-            FROM Student s
-            LEFT JOIN Communication c ON s.CommunicationID = c.CommunicationID
-            LEFT JOIN LoanInfo l ON s.LoanInfoID = l.LoanInfoID
-            LEFT JOIN StudyInfo si ON l.StudyInfoID = si.StudyInfoID
-            LEFT JOIN EducationInstitution ei ON l.EducationInstitutionID = ei.EducationInstitutionID
-            LEFT JOIN Province p ON ei.ProvinceID = p.ProvinceID
-            WHERE s.LastName LIKE ?
-        """
-        
         cursor.execute(query, f'%{lastname}%')
         
         columns = [column[0] for column in cursor.description]
+        rows = cursor.fetchall()
+        if fields:
+            # The statement returns every column of the tables it joins; keep the requested ones
+            positions = [columns.index(field) for field in fields]
+            columns = list(fields)
+            rows = [[row[i] for i in positions] for row in rows]
+        if shape == 'columnar':
+            return columnar_response(columns, [tuple(row) for row in rows])
+
         results = []
         
-        for row in cursor.fetchall():
+        for row in rows:
             results.append(dict(zip(columns, row)))
             
         return HttpResponse(
@@ -97,6 +1458,9 @@ def get_students_by_lastname(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json"
         )
 
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
+
     except Exception as e:
         return HttpResponse(
             json.dumps({
@@ -113,27 +1477,31 @@ def get_students_by_lastname(req: func.HttpRequest) -> func.HttpResponse:
         if 'conn' in locals():
             conn.close()
 
+province_student_count_query = sql_statements.register('provinces.student_count', """
+    SELECT 
+        p.Province,
+        COUNT(DISTINCT s.StudentID) as StudentCount
+    FROM Province p
+    LEFT JOIN EducationInstitution ei ON p.ProvinceID = ei.ProvinceID
+    LEFT JOIN LoanInfo l ON ei.EducationInstitutionID = l.EducationInstitutionID
+    LEFT JOIN Student s ON l.LoanInfoID = s.LoanInfoID
+    GROUP BY p.Province
+    ORDER BY p.Province
+""")
+
 @app.route(route="provinces/student-count", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('reports')
+@coalesce_requests
+@cache_response(cache_report_ttl, 'students')
+@limit_concurrency('reports')
 def get_province_student_count(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request.')
-
     try:
-        conn = get_db_connection()
+        conn = get_report_db_connection()
         cursor = conn.cursor()
         
-        query = """
-            SELECT 
-                p.Province,
-                COUNT(DISTINCT s.StudentID) as StudentCount
-            FROM Province p
-            LEFT JOIN EducationInstitution ei ON p.ProvinceID = ei.ProvinceID
-            LEFT JOIN LoanInfo l ON ei.EducationInstitutionID = l.EducationInstitutionID
-            LEFT JOIN Student s ON l.LoanInfoID = s.LoanInfoID
-            GROUP BY p.Province
-            ORDER BY p.Province
-        """
-        
-        cursor.execute(query)
+        cursor.execute(province_student_count_query)
         
         columns = [column[0] for column in cursor.description]
         results = []
@@ -144,13 +1512,167 @@ def get_province_student_count(req: func.HttpRequest) -> func.HttpResponse:
         return HttpResponse(
             json.dumps({
                 'status': 'success',
-                'count': len(results),
-                'data': json.loads(json.dumps(results, default=str))
-            },default=decimal_default),
+                'count': len(results),
+                'data': json.loads(json.dumps(results, default=str))
+            },default=decimal_default),
+            status_code=200,
+            mimetype="application/json"
+        )
+
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
+
+    except Exception as e:
+        return HttpResponse(
+            json.dumps({
+                'status': 'error',
+                'message': str(e)
+            }),
+            status_code=500,
+            mimetype="application/json"
+        )
+        
+    finally:
+        if 'cursor' in locals():
+            cursor.close()
+        if 'conn' in locals():
+            conn.close()
+
+# Loan and student fields once, then the (optionally date-bounded and limited) payments.
+# Parameters: loan ID; loan ID, row limit, first date (inclusive), end date (exclusive)
+loan_payments_query = sql_statements.register('loans.payments', """
+    SELECT 
+        l.LoanInfoID,
+        l.LoanAmount,
+        l.LoanBalance,
+        s.FirstName + ' ' + s.LastName as StudentName
+    FROM LoanInfo l
+    JOIN Student s ON l.LoanInfoID = s.LoanInfoID
+    WHERE l.LoanInfoID = ?;
+
+    SELECT TOP (?)
+        p.PaymentID,
+        p.Amount,
+        FORMAT(p.Paydate, 'yyyy-MM-dd') as PaymentDate,
+        f.InstitutionName as FinInstitution,
+        f.Code as FinCode,
+        f.Type as FinType
+    FROM Payment p
+    JOIN FinancialInstitution f ON f.FinancialInstitutionID = p.FinancialInstitutionID
+    WHERE p.LoanInfoID = ?
+      AND p.Paydate >= ?
+      AND p.Paydate < ?
+    ORDER BY p.Paydate;
+""")
+
+# Bounds used when from, to or limit are not given
+payment_history_min_date = date(1900, 1, 1)
+payment_history_max_date = date(9999, 12, 31)
+payment_history_max_rows = 2147483647
+
+def parse_payment_history_filters(params):
+    """
+    (first date, end date exclusive, limit) from the from/to (yyyy-MM-dd, inclusive) and limit
+    query parameters. Raises ValueError with a client-facing message when one is invalid.
+    """
+    try:
+        first_date = date.fromisoformat(params['from']) if params.get('from') else payment_history_min_date
+        last_date = date.fromisoformat(params['to']) if params.get('to') else None
+    except ValueError:
+        raise ValueError('from and to must be dates in yyyy-MM-dd format')
+    if last_date is not None and last_date < first_date:
+        raise ValueError('from must not be after to')
+    end_date = last_date + timedelta(days=1) if last_date and last_date < payment_history_max_date else payment_history_max_date
+
+    limit = payment_history_max_rows
+    if params.get('limit'):
+        try:
+            limit = int(params['limit'])
+        except ValueError:
+            raise ValueError('limit must be a positive integer')
+        if limit < 1:
+            raise ValueError('limit must be a positive integer')
+    return first_date, end_date, limit
+
+@app.route(route="loans/{loanid}/payments", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('lookups')
+@coalesce_requests
+@cache_response(cache_lookup_ttl, loan_namespace)
+@limit_concurrency('lookups')
+def get_loan_payments(req: func.HttpRequest) -> func.HttpResponse:
+    loan_id = req.route_params.get('loanid')
+    if not loan_id:
+        return HttpResponse(
+            json.dumps({
+                'status': 'error',
+                'message': 'Loan ID parameter is required'
+            }),
+            status_code=400,
+            mimetype="application/json"
+        )
+
+    try:
+        first_date, end_date, limit = parse_payment_history_filters(req.params)
+    except ValueError as e:
+        return HttpResponse(
+            json.dumps({
+                'status': 'error',
+                'message': str(e)
+            }),
+            status_code=400,
+            mimetype="application/json"
+        )
+    filtered = any(req.params.get(name) for name in ('from', 'to', 'limit'))
+
+    try:
+        conn = get_read_db_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(loan_payments_query, loan_id, limit, loan_id, first_date, end_date)
+        
+        loan_info = cursor.fetchone()
+        cursor.nextset()
+        payments = [{
+            'paymentId': payment_id,
+            'amount': float(amount),
+            'paymentDate': payment_date,
+            'finInstitution': fin_institution,
+            'finCode': fin_code,
+            'finType': fin_type
+        } for payment_id, amount, payment_date, fin_institution, fin_code, fin_type in cursor.fetchall()]
+            
+        # An empty date range is a valid answer; an unfiltered loan without payments is not found as before
+        if not loan_info or (not payments and not filtered):
+            return HttpResponse(
+                json.dumps({
+                    'status': 'error',
+                    'message': f'No payments found for loan ID: {loan_id}'
+                }), 
+                status_code=404,
+                mimetype="application/json"
+            )
+            
+        return HttpResponse(
+            json.dumps({
+                'status': 'success',
+                'count': len(payments),
+                'loan': {
+                    'loanId': loan_info[0],
+                    'loanAmount': float(loan_info[1]),
+                    'loanBalance': float(loan_info[2]),
+                    'studentName': loan_info[3]
+                },
+                'data': payments
+            }),
             status_code=200,
             mimetype="application/json"
         )
 
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
+
     except Exception as e:
         return HttpResponse(
             json.dumps({
@@ -167,73 +1689,146 @@ def get_province_student_count(req: func.HttpRequest) -> func.HttpResponse:
         if 'conn' in locals():
             conn.close()
 
-@app.route(route="loans/{loanid}/payments", auth_level=func.AuthLevel.ANONYMOUS)
-def get_loan_payments(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request.')
+# Maximum number of loan IDs accepted by the multi-loan endpoints
+loan_batch_max_size = int(os.getenv('LOAN_BATCH_MAX_SIZE', '1000'))
 
-    loan_id = req.route_params.get('loanid')
-    if not loan_id:
+# Range of a SQL Server int, the type of LoanInfoID
+sql_int_min, sql_int_max = -2 ** 31, 2 ** 31 - 1
+
+def parse_loan_ids(req):
+    """
+    Loan IDs from ?loanids=1,2,3 (GET) or {"loanids": [1, 2, 3]} (POST), de-duplicated in request order.
+    Raises ValueError with a client-facing message when they are missing or invalid: JSON IDs
+    must be integer numbers (not booleans, decimals or strings), and every ID must fit an int.
+    """
+    if req.method == 'POST':
+        try:
+            body = req.get_json()
+        except ValueError:
+            raise ValueError('Request body must be JSON')
+        loan_ids = body.get('loanids') if isinstance(body, dict) else None
+        if not isinstance(loan_ids, list):
+            raise ValueError('A list of loan IDs (loanids) is required')
+    else:
+        loan_ids = [loan_id for loan_id in req.params.get('loanids', '').split(',') if loan_id.strip()]
+
+    if not loan_ids:
+        raise ValueError('At least one loan ID is required')
+    if req.method == 'POST' and not all(type(loan_id) is int for loan_id in loan_ids):
+        raise ValueError('Loan IDs must be integers')
+    try:
+        loan_ids = list(dict.fromkeys(int(loan_id) for loan_id in loan_ids))
+    except (TypeError, ValueError):
+        raise ValueError('Loan IDs must be integers')
+    if not all(sql_int_min <= loan_id <= sql_int_max for loan_id in loan_ids):
+        raise ValueError(f'Loan IDs must be between {sql_int_min} and {sql_int_max}')
+    return loan_ids
+
+# The loan IDs are passed as one JSON array parameter and expanded with OPENJSON, so any number of
+# IDs is a single round trip with a single cached plan (an IN list would compile one plan per length)
+multi_loan_payments_query = sql_statements.register('loans.payments.multi', """
+    SELECT 
+        l.LoanInfoID,
+        l.LoanAmount,
+        l.LoanBalance,
+        s.FirstName + ' ' + s.LastName as StudentName
+    FROM LoanInfo l
+    JOIN Student s ON l.LoanInfoID = s.LoanInfoID
+    WHERE l.LoanInfoID IN (SELECT CAST(value AS int) FROM OPENJSON(?));
+
+    SELECT 
+        p.LoanInfoID,
+        p.PaymentID,
+        p.Amount,
+        FORMAT(p.Paydate, 'yyyy-MM-dd') as PaymentDate,
+        f.InstitutionName as FinInstitution,
+        f.Code as FinCode,
+        f.Type as FinType
+    FROM Payment p
+    JOIN FinancialInstitution f ON f.FinancialInstitutionID = p.FinancialInstitutionID
+    WHERE p.LoanInfoID IN (SELECT CAST(value AS int) FROM OPENJSON(?))
+    ORDER BY p.LoanInfoID, p.Paydate;
+""")
+
+@app.route(route="loans/payments", methods=["GET", "POST"], auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('reports')
+@limit_concurrency('reports')
+def get_multi_loan_payments(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Payments for many loans in one call, grouped by loan. Replaces one loans/{loanid}/payments
+    call (and one connection) per loan.
+    """
+    try:
+        loan_ids = parse_loan_ids(req)
+    except ValueError as e:
         return HttpResponse(
             json.dumps({
                 'status': 'error',
-                'message': 'Loan ID parameter is required'
+                'message': str(e)
             }),
             status_code=400,
             mimetype="application/json"
         )
 
+    if len(loan_ids) > loan_batch_max_size:
+        return HttpResponse(
+            json.dumps({
+                'status': 'error',
+                'message': f'At most {loan_batch_max_size} loan IDs can be requested per call'
+            }),
+            status_code=413,
+            mimetype="application/json"
+        )
+
     try:
-        conn = get_db_connection()
+        conn = get_report_db_connection()
         cursor = conn.cursor()
-        
-        query = """
-            SELECT 
-                p.PaymentID,
-                p.LoanInfoID,
-                p.Amount,
-                FORMAT(p.Paydate, 'yyyy-MM-dd') as PaymentDate,
-                f.InstitutionName as FinInstitution,
-                f.Code as FinCode,
-                f.Type as FinType,
-                l.LoanAmount,
-                l.LoanBalance,
-                s.FirstName + ' ' + s.LastName as StudentName
-            FROM Payment p
-            JOIN LoanInfo l ON p.LoanInfoID = l.LoanInfoID
-            JOIN Student s ON l.LoanInfoID = s.LoanInfoID
-            JOIN FinancialInstitution f ON f.FinancialInstitutionID = p.FinancialInstitutionID
-            WHERE p.LoanInfoID = ?
-            ORDER BY p.Paydate
-        """
-        
-        cursor.execute(query, loan_id)
-        
-        columns = [column[0] for column in cursor.description]
-        results = []
-        
-        for row in cursor.fetchall():
-            results.append(dict(zip(columns, row)))
-            
-        if not results:
-            return HttpResponse(
-                json.dumps({
-                    'status': 'error',
-                    'message': f'No payments found for loan ID: {loan_id}'
-                }), 
-                status_code=404,
-                mimetype="application/json"
-            )
-            
+
+        loan_ids_json = json.dumps(loan_ids)
+        cursor.execute(multi_loan_payments_query, loan_ids_json, loan_ids_json)
+
+        loans = {}
+        for loan_id, loan_amount, loan_balance, student_name in cursor.fetchall():
+            loans[loan_id] = {
+                'loanId': loan_id,
+                'loanAmount': float(loan_amount),
+                'loanBalance': float(loan_balance),
+                'studentName': student_name,
+                'count': 0,
+                'payments': []
+            }
+
+        cursor.nextset()
+        for loan_id, payment_id, amount, payment_date, fin_institution, fin_code, fin_type in cursor.fetchall():
+            loan = loans.get(loan_id)
+            if loan is None:
+                continue
+            loan['payments'].append({
+                'paymentId': payment_id,
+                'amount': float(amount),
+                'paymentDate': payment_date,
+                'finInstitution': fin_institution,
+                'finCode': fin_code,
+                'finType': fin_type
+            })
+            loan['count'] += 1
+
         return HttpResponse(
             json.dumps({
                 'status': 'success',
-                'count': len(results),
-                'data': json.loads(json.dumps(results, default=str))
-            },default=decimal_default),
+                'count': len(loans),
+                'notFound': [loan_id for loan_id in loan_ids if loan_id not in loans],
+                'data': [loans[loan_id] for loan_id in loan_ids if loan_id in loans]
+            }),
             status_code=200,
             mimetype="application/json"
         )
 
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
+
     except Exception as e:
         return HttpResponse(
             json.dumps({
@@ -243,56 +1838,139 @@ def get_loan_payments(req: func.HttpRequest) -> func.HttpResponse:
             status_code=500,
             mimetype="application/json"
         )
-        
+
     finally:
         if 'cursor' in locals():
             cursor.close()
         if 'conn' in locals():
             conn.close()
 
+monthly_payments_by_province_query = sql_statements.register('payments.monthly_by_province', """
+    SELECT 
+        p.Province,
+        YEAR(pay.Paydate) as PaymentYear,
+        MONTH(pay.Paydate) as PaymentMonth,
+        COUNT(DISTINCT s.StudentID) as NumberOfStudents,
+        SUM(pay.Amount) as TotalPayments
+    FROM Province p
+    JOIN EducationInstitution ei ON p.ProvinceID = ei.ProvinceID
+    JOIN LoanInfo l ON ei.EducationInstitutionID = l.EducationInstitutionID
+    JOIN Student s ON l.LoanInfoID = s.LoanInfoID
+    JOIN Payment pay ON l.LoanInfoID = pay.LoanInfoID
+    GROUP BY 
+        p.Province, 
+        YEAR(pay.Paydate), 
+        MONTH(pay.Paydate)
+    ORDER BY 
+        p.Province, 
+        PaymentYear DESC, 
+        PaymentMonth DESC
+""")
+
+# The same report as one JSON document, nested province -> year (newest first) -> month in calendar order
+# The monthly aggregate is read four times to build the JSON, so it is materialized once in a
+# keyed temp table (a CTE would be inlined and the Payment aggregation rerun for each reference)
+monthly_payments_by_province_json_query = sql_statements.register('payments.monthly_by_province.json', """
+    SET NOCOUNT ON;
+    IF OBJECT_ID('tempdb..#MonthlyByProvince') IS NOT NULL DROP TABLE #MonthlyByProvince;
+    CREATE TABLE #MonthlyByProvince (
+        Province NVARCHAR(50) NOT NULL,
+        PaymentYear INT NOT NULL,
+        PaymentMonth INT NOT NULL,
+        NumberOfStudents INT NOT NULL,
+        TotalPayments DECIMAL(38, 2) NOT NULL,
+        PRIMARY KEY (Province, PaymentYear, PaymentMonth)
+    );
+
+    INSERT INTO #MonthlyByProvince (Province, PaymentYear, PaymentMonth, NumberOfStudents, TotalPayments)
+    SELECT 
+        p.Province,
+        YEAR(pay.Paydate) as PaymentYear,
+        MONTH(pay.Paydate) as PaymentMonth,
+        COUNT(DISTINCT s.StudentID) as NumberOfStudents,
+        SUM(pay.Amount) as TotalPayments
+    FROM Province p
+    JOIN EducationInstitution ei ON p.ProvinceID = ei.ProvinceID
+    JOIN LoanInfo l ON ei.EducationInstitutionID = l.EducationInstitutionID
+    JOIN Student s ON l.LoanInfoID = s.LoanInfoID
+    JOIN Payment pay ON l.LoanInfoID = pay.LoanInfoID
+    GROUP BY p.Province, YEAR(pay.Paydate), MONTH(pay.Paydate);
+
+    SELECT 
+        'success' as [status],
+        (SELECT COUNT(DISTINCT Province) FROM #MonthlyByProvince) as [count],
+        JSON_QUERY(ISNULL((
+            SELECT 
+                pv.Province as province,
+                SUM(pv.TotalPayments) as totalAmount,
+                JSON_QUERY((
+                    SELECT 
+                        y.PaymentYear as [year],
+                        SUM(y.TotalPayments) as totalAmount,
+                        JSON_QUERY((
+                            SELECT 
+                                CHOOSE(m.PaymentMonth, 'January', 'February', 'March', 'April', 'May', 'June', 'July', 'August',
+                                       'September', 'October', 'November', 'December') as [month],
+                                m.NumberOfStudents as numberOfStudents,
+                                m.TotalPayments as totalAmount
+                            FROM #MonthlyByProvince m
+                            WHERE m.Province = pv.Province AND m.PaymentYear = y.PaymentYear
+                            ORDER BY m.PaymentMonth
+                            FOR JSON PATH
+                        )) as monthlyBreakdown
+                    FROM #MonthlyByProvince y
+                    WHERE y.Province = pv.Province
+                    GROUP BY y.PaymentYear
+                    ORDER BY y.PaymentYear DESC
+                    FOR JSON PATH
+                )) as yearlyBreakdown
+            FROM #MonthlyByProvince pv
+            GROUP BY pv.Province
+            ORDER BY pv.Province
+            FOR JSON PATH
+        ), '[]')) as [data]
+    FOR JSON PATH, WITHOUT_ARRAY_WRAPPER;
+
+    DROP TABLE #MonthlyByProvince;
+""")
+
 @app.route(route="payments/monthly-by-province", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('reports')
+@coalesce_requests
+@cache_response(cache_report_ttl, 'payments', 'students')
+@limit_concurrency('reports')
 def get_monthly_payments_by_province(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request.')
+    try:
+        mode = parse_report_mode(req.params)
+    except ValueError as e:
+        return HttpResponse(
+            json.dumps({
+                'status': 'error',
+                'message': str(e)
+            }),
+            status_code=400,
+            mimetype="application/json"
+        )
 
     try:
-        conn = get_db_connection()
+        conn = get_report_db_connection()
         cursor = conn.cursor()
         
-        query = """
-            SELECT 
-                p.Province,
-                YEAR(pay.Paydate) as PaymentYear,
-                MONTH(pay.Paydate) as PaymentMonth,
-                FORMAT(pay.Paydate, 'MMMM') as MonthName,
-                COUNT(DISTINCT s.StudentID) as NumberOfStudents,
-                SUM(pay.Amount) as TotalPayments
-            FROM Province p
-            JOIN EducationInstitution ei ON p.ProvinceID = ei.ProvinceID
-            JOIN LoanInfo l ON ei.EducationInstitutionID = l.EducationInstitutionID
-            JOIN Student s ON l.LoanInfoID = s.LoanInfoID
-            JOIN Payment pay ON l.LoanInfoID = pay.LoanInfoID
-            GROUP BY 
-                p.Province, 
-                YEAR(pay.Paydate), 
-                MONTH(pay.Paydate),
-                FORMAT(pay.Paydate, 'MMMM')
-            ORDER BY 
-                p.Province, 
-                PaymentYear DESC, 
-                PaymentMonth DESC
-        """
-        
-        cursor.execute(query)
+        if mode == 'server':
+            cursor.execute(monthly_payments_by_province_json_query)
+            return HttpResponse(
+                read_for_json(cursor),
+                status_code=200,
+                mimetype="application/json"
+            )
+
+        cursor.execute(monthly_payments_by_province_query)
         
-        columns = [column[0] for column in cursor.description]
-                
-        # Organize data by province and year
+        # Organize data by province and year as the rows stream in
         province_data = {}
-        for row in cursor.fetchall():
-            row_dict = dict(zip(columns, row))
-            province = row_dict['Province']
-            year = row_dict['PaymentYear']
-            
+        for province, year, month, number_of_students, total_payments in iter_rows(cursor):
             if province not in province_data:
                 province_data[province] = {
                     'province': province,
@@ -302,18 +1980,18 @@ def get_monthly_payments_by_province(req: func.HttpRequest) -> func.HttpResponse
             if year not in province_data[province]['years']:
                 province_data[province]['years'][year] = {
                     'year': year,
-                    'totalAmount': 0,
+                    'totalAmount': Decimal(0),
                     'months': []
                 }
             
             month_info = {
-                'month': row_dict['MonthName'],
-                'numberOfStudents': row_dict['NumberOfStudents'],
-                'totalAmount': float(row_dict['TotalPayments'])
+                'month': month_names[month - 1],
+                'numberOfStudents': number_of_students,
+                'totalAmount': float(total_payments)
             }
             
-            province_data[province]['years'][year]['months'].append(month_info)
-            province_data[province]['years'][year]['totalAmount'] += month_info['totalAmount']
+            province_data[province]['years'][year]['months'].append((month, month_info))
+            province_data[province]['years'][year]['totalAmount'] += total_payments
         
         # Convert to final format
         results = []
@@ -321,20 +1999,20 @@ def get_monthly_payments_by_province(req: func.HttpRequest) -> func.HttpResponse
             province_info = province_data[province]
             years_list = []
             
-            province_total = 0
+            province_total = Decimal(0)
             for year in sorted(province_info['years'].keys(), reverse=True):
                 year_data = province_info['years'][year]
                 years_list.append({
                     'year': year,
-                    'totalAmount': year_data['totalAmount'],
-                    'monthlyBreakdown': sorted(year_data['months'], 
-                                             key=lambda x: x['month'])
+                    'totalAmount': float(year_data['totalAmount']),
+                    'monthlyBreakdown': [month_info for _, month_info in sorted(year_data['months'],
+                                                                                key=lambda x: x[0])]
                 })
                 province_total += year_data['totalAmount']
             
             results.append({
                 'province': province,
-                'totalAmount': province_total,
+                'totalAmount': float(province_total),
                 'yearlyBreakdown': years_list
             })
         
@@ -342,12 +2020,15 @@ def get_monthly_payments_by_province(req: func.HttpRequest) -> func.HttpResponse
             json.dumps({
                 'status': 'success',
                 'count': len(results),
-                'data': json.loads(json.dumps(results, default=str))
-            },default=decimal_default),
+                'data': results
+            },default=str),
             status_code=200,
             mimetype="application/json"
         )
 
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
+
     except Exception as e:
         return HttpResponse(
             json.dumps({
@@ -364,10 +2045,105 @@ def get_monthly_payments_by_province(req: func.HttpRequest) -> func.HttpResponse
         if 'conn' in locals():
             conn.close()
 
+# Loan details and yearly payment aggregates in one batch (two result sets, one round trip).
+# Parameters: loan ID, loan ID
+loan_yearly_stats_query = sql_statements.register('stats.yearly.loan', """
+    SELECT 
+        l.LoanAmount,
+        l.LoanBalance,
+        FORMAT(l.DisbursementDate, 'yyyy-MM-dd') as DisbursementDate,
+        l.PercentagePaid,
+        FORMAT(l.PayoffDate, 'yyyy-MM-dd') as PayoffDate,
+        s.FirstName + ' ' + s.LastName as StudentName,
+        ei.CollegeName,
+        si.ProgramOfStudy
+    FROM LoanInfo l
+    JOIN Student s ON s.LoanInfoID = l.LoanInfoID
+    JOIN StudyInfo si ON l.StudyInfoID = si.StudyInfoID
+    JOIN EducationInstitution ei ON l.EducationInstitutionID = ei.EducationInstitutionID
+    WHERE l.LoanInfoID = ?;
+
+    SELECT 
+        YEAR(Paydate) as PaymentYear,
+        COUNT(*) as NumberOfPayments,
+        SUM(Amount) as TotalAmount,
+        MIN(FORMAT(Paydate, 'yyyy-MM-dd')) as FirstPayment,
+        MAX(FORMAT(Paydate, 'yyyy-MM-dd')) as LastPayment
+    FROM Payment
+    WHERE LoanInfoID = ?
+    GROUP BY YEAR(Paydate)
+    ORDER BY PaymentYear DESC;
+""")
+
+# Same two result sets for a JSON array of loan IDs, keyed by LoanInfoID. Parameters: IDs, IDs
+multi_loan_yearly_stats_query = sql_statements.register('stats.yearly.loans', """
+    SELECT 
+        l.LoanInfoID,
+        l.LoanAmount,
+        l.LoanBalance,
+        FORMAT(l.DisbursementDate, 'yyyy-MM-dd') as DisbursementDate,
+        l.PercentagePaid,
+        FORMAT(l.PayoffDate, 'yyyy-MM-dd') as PayoffDate,
+        s.FirstName + ' ' + s.LastName as StudentName,
+        ei.CollegeName,
+        si.ProgramOfStudy
+    FROM LoanInfo l
+    JOIN Student s ON s.LoanInfoID = l.LoanInfoID
+    JOIN StudyInfo si ON l.StudyInfoID = si.StudyInfoID
+    JOIN EducationInstitution ei ON l.EducationInstitutionID = ei.EducationInstitutionID
+    WHERE l.LoanInfoID IN (SELECT CAST(value AS int) FROM OPENJSON(?));
+
+    SELECT 
+        LoanInfoID,
+        YEAR(Paydate) as PaymentYear,
+        COUNT(*) as NumberOfPayments,
+        SUM(Amount) as TotalAmount,
+        MIN(FORMAT(Paydate, 'yyyy-MM-dd')) as FirstPayment,
+        MAX(FORMAT(Paydate, 'yyyy-MM-dd')) as LastPayment
+    FROM Payment
+    WHERE LoanInfoID IN (SELECT CAST(value AS int) FROM OPENJSON(?))
+    GROUP BY LoanInfoID, YEAR(Paydate)
+    ORDER BY LoanInfoID, PaymentYear DESC;
+""")
+
+def loan_details_from_row(loan_info):
+    return {
+        'loanAmount': float(loan_info[0]),
+        'loanBalance': float(loan_info[1]),
+        'disbursementDate': loan_info[2],
+        'percentagePaid': loan_info[3],
+        'payoffDate': loan_info[4],
+        'studentName': loan_info[5],
+        'collegeName': loan_info[6],
+        'programOfStudy': loan_info[7]
+    }
+
+def yearly_stats_from_row(row):
+    year, number_of_payments, total_amount, first_payment, last_payment = row
+    return {
+        'year': year,
+        'numberOfPayments': number_of_payments,
+        'totalAmount': float(total_amount),
+        'firstPayment': first_payment,
+        'lastPayment': last_payment
+    }
+
+def yearly_payments_summary(yearly_stats):
+    return {
+        'numberOfYears': len(yearly_stats),
+        'totalPayments': sum(y['numberOfPayments'] for y in yearly_stats),
+        'totalAmountPaid': sum(y['totalAmount'] for y in yearly_stats),
+        'statistics': yearly_stats
+    }
+
 @app.route(route="stats/yearly/loan/{loanid}/payments", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('lookups')
+@coalesce_requests
+@cache_response(cache_lookup_ttl, loan_namespace)
+@limit_concurrency('lookups')
 def get_loan_payments_yearly_stats(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request.')
-
     loan_id = req.route_params.get('loanid')
     if not loan_id:
         return HttpResponse(
@@ -380,26 +2156,11 @@ def get_loan_payments_yearly_stats(req: func.HttpRequest) -> func.HttpResponse:
         )
 
     try:
-        conn = get_db_connection()
+        conn = get_read_db_connection()
         cursor = conn.cursor()
         
-        # Get loan information
-        cursor.execute("""
-            SELECT 
-                l.LoanAmount,
-                l.LoanBalance,
-                FORMAT(l.DisbursementDate, 'yyyy-MM-dd') as DisbursementDate,
-                l.PercentagePaid,
-                FORMAT(l.PayoffDate, 'yyyy-MM-dd') as PayoffDate,
-                s.FirstName + ' ' + s.LastName as StudentName,
-                ei.CollegeName,
-                si.ProgramOfStudy
-            FROM LoanInfo l
-            JOIN Student s ON s.LoanInfoID = l.LoanInfoID
-            JOIN StudyInfo si ON l.StudyInfoID = si.StudyInfoID
-            JOIN EducationInstitution ei ON l.EducationInstitutionID = ei.EducationInstitutionID
-            WHERE l.LoanInfoID = ?
-        """, loan_id)
+        # Get loan information and yearly payment statistics in one round trip
+        cursor.execute(loan_yearly_stats_query, loan_id, loan_id)
         
         loan_info = cursor.fetchone()
         if not loan_info:
@@ -411,56 +2172,103 @@ def get_loan_payments_yearly_stats(req: func.HttpRequest) -> func.HttpResponse:
                 status_code=404,
                 mimetype="application/json"
             )
-        # Get yearly payment statistics
-        cursor.execute("""
-            SELECT 
-                YEAR(Paydate) as PaymentYear,
-                COUNT(*) as NumberOfPayments,
-                SUM(Amount) as TotalAmount,
-                MIN(FORMAT(Paydate, 'yyyy-MM-dd')) as FirstPayment,
-                MAX(FORMAT(Paydate, 'yyyy-MM-dd')) as LastPayment
-            FROM Payment
-            WHERE LoanInfoID = ?
-            GROUP BY YEAR(Paydate)
-            ORDER BY PaymentYear DESC
-        """, loan_id)
-
-        # Process results
-        columns = ['year', 'numberOfPayments', 'totalAmount', 'firstPayment', 'lastPayment']
-        yearly_stats = []
+
+        cursor.nextset()
+        yearly_stats = [yearly_stats_from_row(row) for row in cursor.fetchall()]
+
+        return HttpResponse(
+            json.dumps({
+                'status': 'success',
+                'loanDetails': loan_details_from_row(loan_info),
+                'yearlyPayments': yearly_payments_summary(yearly_stats)
+            },default=decimal_default),
+            status_code=200,
+            mimetype="application/json"
+        )
+
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
+
+    except Exception as e:
+        return HttpResponse(
+            json.dumps({
+                'status': 'error',
+                'message': str(e)
+            }),
+            status_code=500,
+            mimetype="application/json"
+        )
         
+    finally:
+        if 'cursor' in locals():
+            cursor.close()
+        if 'conn' in locals():
+            conn.close()
+
+@app.route(route="stats/yearly/loans/payments", methods=["GET", "POST"], auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('reports')
+@limit_concurrency('reports')
+def get_multi_loan_payments_yearly_stats(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Yearly payment statistics for many loans in one call (?loanids=1,2,3 or {"loanids": [...]}),
+    with the same per-loan shape as stats/yearly/loan/{loanid}/payments.
+    """
+    try:
+        loan_ids = parse_loan_ids(req)
+    except ValueError as e:
+        return HttpResponse(
+            json.dumps({
+                'status': 'error',
+                'message': str(e)
+            }),
+            status_code=400,
+            mimetype="application/json"
+        )
+
+    if len(loan_ids) > loan_batch_max_size:
+        return HttpResponse(
+            json.dumps({
+                'status': 'error',
+                'message': f'At most {loan_batch_max_size} loan IDs can be requested per call'
+            }),
+            status_code=413,
+            mimetype="application/json"
+        )
+
+    try:
+        conn = get_report_db_connection()
+        cursor = conn.cursor()
+
+        loan_ids_json = json.dumps(loan_ids)
+        cursor.execute(multi_loan_yearly_stats_query, loan_ids_json, loan_ids_json)
+
+        loan_details = {row[0]: loan_details_from_row(row[1:]) for row in cursor.fetchall()}
+
+        cursor.nextset()
+        yearly_stats = defaultdict(list)
         for row in cursor.fetchall():
-            payment_data = dict(zip(columns, row))
-            payment_data['totalAmount'] = float(payment_data['totalAmount'])
-            yearly_stats.append(payment_data)
-
-        # Create response
-        loan_details = {
-            'loanAmount': float(loan_info[0]),
-            'loanBalance': float(loan_info[1]),
-            'disbursementDate': loan_info[2],
-            'percentagePaid': loan_info[3],
-            'payoffDate': loan_info[4],
-            'studentName': loan_info[5],
-            'collegeName': loan_info[6],
-            'programOfStudy': loan_info[7]
-        }
+            yearly_stats[row[0]].append(yearly_stats_from_row(row[1:]))
 
         return HttpResponse(
             json.dumps({
                 'status': 'success',
-                'loanDetails': loan_details,
-                'yearlyPayments': {
-                    'numberOfYears': len(yearly_stats),
-                    'totalPayments': sum(y['numberOfPayments'] for y in yearly_stats),
-                    'totalAmountPaid': sum(y['totalAmount'] for y in yearly_stats),
-                    'statistics': yearly_stats
-                }
+                'count': len(loan_details),
+                'notFound': [loan_id for loan_id in loan_ids if loan_id not in loan_details],
+                'data': [{
+                    'loanId': loan_id,
+                    'loanDetails': loan_details[loan_id],
+                    'yearlyPayments': yearly_payments_summary(yearly_stats[loan_id])
+                } for loan_id in loan_ids if loan_id in loan_details]
             },default=decimal_default),
             status_code=200,
             mimetype="application/json"
         )
 
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
+
     except Exception as e:
         return HttpResponse(
             json.dumps({
@@ -470,57 +2278,82 @@ def get_loan_payments_yearly_stats(req: func.HttpRequest) -> func.HttpResponse:
             status_code=500,
             mimetype="application/json"
         )
-        
+
     finally:
         if 'cursor' in locals():
             cursor.close()
         if 'conn' in locals():
             conn.close()
 
+incomplete_registration_query = sql_statements.register('students.incomplete_registration', """
+    SELECT 
+        s.StudentID,
+        s.FirstName,
+        s.LastName,
+        s.HomeAddress,
+        c.PhoneNumber,
+        c.Email,
+        c.Preference,
+        CASE 
+            WHEN s.LoanInfoID IS NULL THEN 'Missing'
+            ELSE 'Present'
+        END as LoanStatus,
+        CASE 
+            WHEN l.StudyInfoID IS NULL THEN 'Missing'
+            ELSE 'Present'
+        END as StudyInfoStatus,
+        CASE 
+            WHEN l.EducationInstitutionID IS NULL THEN 'Missing'
+            ELSE 'Present'
+        END as InstitutionStatus
+    FROM Student s
+    JOIN Communication c ON s.CommunicationID = c.CommunicationID
+    LEFT JOIN LoanInfo l ON s.LoanInfoID = l.LoanInfoID
+    WHERE s.LoanInfoID IS NULL
+       OR l.StudyInfoID IS NULL
+       OR l.EducationInstitutionID IS NULL
+    ORDER BY s.LastName, s.FirstName
+""")
+
 @app.route(route="students/incomplete-registration", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('reports')
+@coalesce_requests
+@cache_response(cache_report_ttl, 'students')
+@limit_concurrency('reports')
 def get_students_incomplete_registration(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request.')
+    try:
+        shape = parse_shape(req.params)
+    except ValueError as e:
+        return HttpResponse(
+            json.dumps({
+                'status': 'error',
+                'message': str(e)
+            }),
+            status_code=400,
+            mimetype="application/json"
+        )
 
     try:
-        conn = get_db_connection()
+        conn = get_report_db_connection()
         cursor = conn.cursor()
         
-        query = """
-            SELECT 
-                s.StudentID,
-                s.FirstName,
-                s.LastName,
-                s.HomeAddress,
-                c.PhoneNumber,
-                c.Email,
-                c.Preference,
-                CASE 
-                    WHEN s.LoanInfoID IS NULL THEN 'Missing'
-                    ELSE 'Present'
-                END as LoanStatus,
-                CASE 
-                    WHEN l.StudyInfoID IS NULL THEN 'Missing'
-                    ELSE 'Present'
-                END as StudyInfoStatus,
-                CASE 
-                    WHEN l.EducationInstitutionID IS NULL THEN 'Missing'
-                    ELSE 'Present'
-                END as InstitutionStatus
-            FROM Student s
-            JOIN Communication c ON s.CommunicationID = c.CommunicationID
-            LEFT JOIN LoanInfo l ON s.LoanInfoID = l.LoanInfoID
-            WHERE s.LoanInfoID IS NULL
-               OR l.StudyInfoID IS NULL
-               OR l.EducationInstitutionID IS NULL
-            ORDER BY s.LastName, s.FirstName
-        """
-        
-        cursor.execute(query)
+        cursor.execute(incomplete_registration_query)
         
         columns = [column[0] for column in cursor.description]
+        if shape == 'columnar':
+            status_indexes = [columns.index(name) for name in ('LoanStatus', 'StudyInfoStatus', 'InstitutionStatus')]
+            requirements = ('Loan Information', 'Program of Study', 'Education Institution')
+            rows = [
+                [*row, [item for index, item in zip(status_indexes, requirements) if row[index] == 'Missing']]
+                for row in iter_rows(cursor)
+            ]
+            return columnar_response(columns + ['missingRequirements'], rows)
+
         students = []
         
-        for row in cursor.fetchall():
+        for row in iter_rows(cursor):
             student_data = dict(zip(columns, row))
             # Add missing requirements list
             missing_items = []
@@ -538,12 +2371,233 @@ def get_students_incomplete_registration(req: func.HttpRequest) -> func.HttpResp
             json.dumps({
                 'status': 'success',
                 'count': len(students),
-                'data': json.loads(json.dumps(students, default=str))
-            },default=decimal_default),
+                'data': students
+            },default=str),
             status_code=200,
             mimetype="application/json"
         )
 
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
+
+    except Exception as e:
+        return HttpResponse(
+            json.dumps({
+                'status': 'error',
+                'message': str(e)
+            }),
+            status_code=500,
+            mimetype="application/json"
+        )
+        
+    finally:
+        if 'cursor' in locals():
+            cursor.close()
+        if 'conn' in locals():
+            conn.close()
+
+# Idempotency settings for loans/make-payment
+idempotency_cache_size = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '10000'))
+idempotency_ttl = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+idempotency_key_max_length = 100
+duplicate_key_error_numbers = frozenset({2601, 2627})
+
+# Stored responses by Idempotency-Key: (request hash, status code, response body)
+idempotency_responses = LRUCache(idempotency_cache_size, idempotency_ttl)
+idempotency_flights = SingleFlight()
+
+def payment_request_hash(payment_data):
+    return hashlib.sha256(json.dumps(payment_data, sort_keys=True, default=str).encode()).hexdigest()
+
+idempotency_find_query = sql_statements.register('idempotency.find', """
+    SELECT RequestHash, StatusCode, ResponseBody
+    FROM PaymentIdempotency
+    WHERE IdempotencyKey = ?
+      AND StatusCode IS NOT NULL
+      AND CreatedAt >= DATEADD(SECOND, -?, SYSUTCDATETIME())
+""")
+
+def find_stored_payment_response(cursor, idempotency_key):
+    cursor.execute(idempotency_find_query, idempotency_key, idempotency_ttl)
+    row = cursor.fetchone()
+    return (row[0], row[1], row[2]) if row else None
+
+def idempotency_conflict_response():
+    return HttpResponse(
+        json.dumps({
+            'status': 'error',
+            'message': 'Idempotency-Key was already used with a different payment request'
+        }),
+        status_code=422,
+        mimetype="application/json"
+    )
+
+def replay_payment_response(stored, request_hash):
+    stored_hash, status_code, body = stored
+    if stored_hash != request_hash:
+        return idempotency_conflict_response()
+    return HttpResponse(
+        body,
+        status_code=status_code,
+        headers={'Idempotent-Replayed': 'true'},
+        mimetype="application/json"
+    )
+
+idempotency_expire_query = sql_statements.register('idempotency.expire', """
+    DELETE FROM PaymentIdempotency
+    WHERE IdempotencyKey = ?
+      AND CreatedAt < DATEADD(SECOND, -?, SYSUTCDATETIME())
+""")
+
+idempotency_claim_query = sql_statements.register('idempotency.claim', """
+    INSERT INTO PaymentIdempotency (IdempotencyKey, RequestHash, CreatedAt)
+    VALUES (?, ?, SYSUTCDATETIME())
+""")
+
+loan_balance_query = sql_statements.register('loans.balance', """
+    SELECT LoanAmount, LoanBalance
+    FROM LoanInfo
+    WHERE LoanInfoID = ?
+""")
+
+random_financial_institution_query = sql_statements.register('financial_institutions.random', "SELECT TOP 1 FinancialInstitutionID FROM FinancialInstitution ORDER BY NEWID()")
+
+insert_payment_query = sql_statements.register('payments.insert', """
+    INSERT INTO Payment (LoanInfoID, Amount, Paydate, FinancialInstitutionID)
+    VALUES (?, ?, ?, ?)
+""")
+
+update_loan_balance_query = sql_statements.register('loans.update_balance', """
+    UPDATE LoanInfo
+    SET LoanBalance = ?,
+        PercentagePaid = ?,
+        PayoffDate = ?
+    WHERE LoanInfoID = ?
+""")
+
+idempotency_store_query = sql_statements.register('idempotency.store', """
+    UPDATE PaymentIdempotency
+    SET StatusCode = ?,
+        ResponseBody = ?
+    WHERE IdempotencyKey = ?
+""")
+
+def make_loan_payment(loan_id, payment_amount, idempotency_key=None, request_hash=None):
+    try:
+        conn = get_db_connection()
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
+    cursor = conn.cursor()
+
+    # Begin transaction
+    conn.autocommit = False
+
+    try:
+        try:
+            if idempotency_key:
+                # A retry of a completed payment is answered from the stored response
+                stored = find_stored_payment_response(cursor, idempotency_key)
+                if stored:
+                    idempotency_responses.set(idempotency_key, stored)
+                    return replay_payment_response(stored, request_hash)
+
+                # Claim the key first: a concurrent retry on another instance blocks on this row
+                # until the payment commits, then fails with a duplicate key and replays it
+                cursor.execute(idempotency_expire_query, idempotency_key, idempotency_ttl)
+                try:
+                    cursor.execute(idempotency_claim_query, idempotency_key, request_hash)
+                except Exception as e:
+                    if not db_error_codes(e)[1] & duplicate_key_error_numbers:
+                        raise
+                    conn.rollback()
+                    stored = find_stored_payment_response(cursor, idempotency_key)
+                    if stored:
+                        idempotency_responses.set(idempotency_key, stored)
+                        return replay_payment_response(stored, request_hash)
+                    return HttpResponse(
+                        json.dumps({
+                            'status': 'error',
+                            'message': 'A payment with this Idempotency-Key is still being processed'
+                        }),
+                        status_code=409,
+                        mimetype="application/json"
+                    )
+
+            # Get current loan information
+            cursor.execute(loan_balance_query, loan_id)
+            
+            loan_info = cursor.fetchone()
+            if not loan_info:
+                return HttpResponse(
+                    json.dumps({
+                        'status': 'error',
+                        'message': f'Loan ID {loan_id} not found'
+                    }),
+                    status_code=400,
+                    mimetype="application/json"
+                )
+            
+            loan_amount, current_balance = loan_info
+
+            # Validate payment amount
+            if payment_amount > float(current_balance):
+                return HttpResponse(
+                    json.dumps({
+                        'status': 'error',
+                        'message': f'Payment amount cannot exceed current balance of {float(current_balance)}CAD'
+                    }),
+                    status_code=409,
+                    mimetype="application/json"
+                )
+            
+            # Calculate new balance and percentage paid
+            new_balance = round(float(current_balance) - payment_amount, 2)
+            percentage_paid = f"{int(((float(loan_amount) - new_balance) / float(loan_amount)) * 100)}%"
+            today = date.today()
+
+            # Get a random financial institution
+            cursor.execute(random_financial_institution_query)
+            financial_institution_id = cursor.fetchone()[0]
+
+            # Insert payment record
+            cursor.execute(insert_payment_query, loan_id, payment_amount, today, financial_institution_id)
+
+            # Update loan balance and percentage paid
+            cursor.execute(update_loan_balance_query, new_balance, percentage_paid, 
+                today if new_balance == 0 else None, 
+                loan_id)
+
+            response_body = json.dumps({
+                'status': 'success',
+                'data': {
+                    'loanId': loan_id,
+                    'paymentAmount': payment_amount,
+                    'paymentDate': today.isoformat(),
+                    'newBalance': new_balance,
+                    'percentagePaid': percentage_paid,
+                    'isFullyPaid': new_balance == 0
+                }},default=decimal_default)
+
+            if idempotency_key:
+                # Stored in the same transaction, so a committed payment always has its response
+                cursor.execute(idempotency_store_query, 200, response_body, idempotency_key)
+
+            conn.commit()
+            invalidate_cached('payments', f'loan:{int(loan_id)}')
+
+            if idempotency_key:
+                idempotency_responses.set(idempotency_key, (request_hash, 200, response_body))
+            
+            return HttpResponse(
+                response_body,
+                status_code=200,
+                mimetype="application/json"
+            )
+
+        except Exception as e:
+            conn.rollback()
+            raise e
+
     except Exception as e:
         return HttpResponse(
             json.dumps({
@@ -561,8 +2615,23 @@ def get_students_incomplete_registration(req: func.HttpRequest) -> func.HttpResp
             conn.close()
 
 @app.route(route="loans/make-payment", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('writes')
+@limit_concurrency('writes')
 def post_loan_payment(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request.')
+    idempotency_key = req.headers.get('Idempotency-Key')
+    if idempotency_key is not None:
+        idempotency_key = idempotency_key.strip()
+        if not 0 < len(idempotency_key) <= idempotency_key_max_length:
+            return HttpResponse(
+                json.dumps({
+                    'status': 'error',
+                    'message': f'Idempotency-Key must be between 1 and {idempotency_key_max_length} characters'
+                }),
+                status_code=400,
+                mimetype="application/json"
+            )
 
     # Validate request body
     payment_data = req.get_json()
@@ -597,91 +2666,618 @@ def post_loan_payment(req: func.HttpRequest) -> func.HttpResponse:
             status_code=409,
             mimetype="application/json"
         )
-    
-    conn = get_db_connection()
+
+    request_hash = payment_request_hash(payment_data) if idempotency_key else None
+    if idempotency_key:
+        stored = idempotency_responses.get(idempotency_key)
+        if stored:
+            return replay_payment_response(stored, request_hash)
+
+    # Opt-in asynchronous mode: queue the payment and return 202 with a status URL
+    if req.params.get('mode', '').lower() == 'async' or 'respond-async' in req.headers.get('Prefer', '').lower():
+        return enqueue_loan_payment(loan_id, payment_amount, idempotency_key, request_hash)
+
+    if not idempotency_key:
+        return make_loan_payment(loan_id, payment_amount)
+
+    def run_payment():
+        response = make_loan_payment(loan_id, payment_amount, idempotency_key, request_hash)
+        return response.get_body(), response.status_code, dict(response.headers)
+
+    # Concurrent retries with the same key on this instance wait for the first attempt's response
+    body, status_code, headers = idempotency_flights.do((idempotency_key, request_hash), run_payment)
+    return HttpResponse(body, status_code=status_code, headers=headers, mimetype="application/json")
+
+# Asynchronous payment ingestion settings. The queue is the PaymentQueue table (migration V007) in
+# the payments database, so every instance enqueues into and drains the same entries.
+payment_batch_size = int(os.getenv('PAYMENT_BATCH_SIZE', '500'))
+payment_drain_max_seconds = float(os.getenv('PAYMENT_DRAIN_MAX_SECONDS', '50'))
+payment_claim_timeout = int(os.getenv('PAYMENT_CLAIM_TIMEOUT_SECONDS', '300'))
+payment_max_attempts = int(os.getenv('PAYMENT_MAX_ATTEMPTS', '5'))
+payment_retry_delay = int(os.getenv('PAYMENT_RETRY_DELAY_SECONDS', '30'))
+
+payment_queue_insert_query = sql_statements.register('payment_queue.insert', """
+    INSERT INTO PaymentQueue (RequestID, LoanInfoID, Amount, IdempotencyKey, RequestHash, Status, EnqueuedAt)
+    VALUES (?, ?, ?, ?, ?, 'queued', SYSUTCDATETIME())
+""")
+
+payment_queue_find_key_query = sql_statements.register('payment_queue.find_key', """
+    SELECT RequestID, LoanInfoID, Amount, RequestHash
+    FROM PaymentQueue
+    WHERE IdempotencyKey = ?
+""")
+
+# A stale claim on its last attempt whose payment was applied (the worker stopped between the
+# apply commit and complete) is finished with the response stored when it was applied
+payment_queue_recover_applied_query = sql_statements.register('payment_queue.recover_applied', """
+    UPDATE q
+    SET Status = 'applied',
+        StatusCode = pi.StatusCode,
+        ResponseBody = pi.ResponseBody,
+        CompletedAt = SYSUTCDATETIME()
+    OUTPUT inserted.RequestID
+    FROM PaymentQueue q
+    JOIN PaymentIdempotency pi ON pi.IdempotencyKey = CONCAT('queue:', q.RequestID)
+    WHERE q.Status = 'processing'
+      AND q.ClaimedAt < DATEADD(SECOND, -?, SYSUTCDATETIME())
+      AND q.Attempts >= ?
+""")
+
+# The other stale claims that already used every attempt are not handed out again: the worker
+# that claimed them last did not finish, most likely because the entry itself broke it
+payment_queue_expire_claims_query = sql_statements.register('payment_queue.expire_claims', """
+    UPDATE q
+    SET Status = 'dead-lettered',
+        LastError = 'Claim timed out after the last attempt',
+        CompletedAt = SYSUTCDATETIME()
+    OUTPUT inserted.RequestID
+    FROM PaymentQueue q
+    WHERE q.Status = 'processing'
+      AND q.ClaimedAt < DATEADD(SECOND, -?, SYSUTCDATETIME())
+      AND q.Attempts >= ?
+      AND NOT EXISTS (
+          SELECT 1 FROM PaymentIdempotency pi
+          WHERE pi.IdempotencyKey = CONCAT('queue:', q.RequestID)
+      )
+""")
+
+# READPAST skips entries another instance is claiming, so concurrent drains take disjoint batches
+payment_queue_claim_query = sql_statements.register('payment_queue.claim', """
+    WITH next AS (
+        SELECT TOP (?) QueueID, RequestID, LoanInfoID, Amount, Status, ClaimedAt, Attempts
+        FROM PaymentQueue WITH (UPDLOCK, READPAST, ROWLOCK)
+        WHERE (Status = 'queued' AND (AvailableAt IS NULL OR AvailableAt <= SYSUTCDATETIME()))
+           OR (Status = 'processing' AND ClaimedAt < DATEADD(SECOND, -?, SYSUTCDATETIME()))
+        ORDER BY QueueID
+    )
+    UPDATE next
+    SET Status = 'processing',
+        ClaimedAt = SYSUTCDATETIME(),
+        Attempts = Attempts + 1
+    OUTPUT inserted.QueueID, inserted.RequestID, inserted.LoanInfoID, inserted.Amount
+""")
+
+payment_queue_complete_query = sql_statements.register('payment_queue.complete', """
+    UPDATE PaymentQueue
+    SET Status = ?,
+        StatusCode = ?,
+        ResponseBody = ?,
+        CompletedAt = SYSUTCDATETIME()
+    WHERE RequestID = ?
+""")
+
+# A queued payment's final response also answers a synchronous retry with its Idempotency-Key
+payment_queue_store_key_response_query = sql_statements.register('payment_queue.store_key_response', """
+    UPDATE pi
+    SET StatusCode = q.StatusCode,
+        ResponseBody = q.ResponseBody
+    FROM PaymentIdempotency pi
+    JOIN PaymentQueue q ON q.IdempotencyKey = pi.IdempotencyKey
+    WHERE q.RequestID = ?
+      AND pi.StatusCode IS NULL
+""")
+
+payment_queue_release_query = sql_statements.register('payment_queue.release', """
+    UPDATE PaymentQueue
+    SET Status = 'queued',
+        ClaimedAt = NULL,
+        Attempts = Attempts - 1
+    WHERE RequestID = ?
+      AND Status = 'processing'
+""")
+
+# A failed entry goes back to the queue, available again after a delay that grows with each
+# attempt, until it has used its attempts; then it is dead-lettered
+payment_queue_fail_query = sql_statements.register('payment_queue.fail', """
+    UPDATE PaymentQueue
+    SET Status = CASE WHEN Attempts >= ? THEN 'dead-lettered' ELSE 'queued' END,
+        ClaimedAt = NULL,
+        AvailableAt = DATEADD(SECOND, ? * Attempts, SYSUTCDATETIME()),
+        LastError = ?,
+        CompletedAt = CASE WHEN Attempts >= ? THEN SYSUTCDATETIME() END
+    OUTPUT inserted.Status
+    WHERE RequestID = ?
+      AND Status = 'processing'
+""")
+
+# A dead-lettered payment with no applied row was never applied, so its Idempotency-Key is
+# freed for a new attempt
+payment_queue_free_key_query = sql_statements.register('payment_queue.free_key', """
+    DELETE pi
+    FROM PaymentIdempotency pi
+    JOIN PaymentQueue q ON q.IdempotencyKey = pi.IdempotencyKey
+    WHERE q.RequestID = ?
+      AND q.Status = 'dead-lettered'
+      AND pi.StatusCode IS NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM PaymentIdempotency applied
+          WHERE applied.IdempotencyKey = CONCAT('queue:', q.RequestID)
+      )
+""")
+
+payment_queue_get_query = sql_statements.register('payment_queue.get', """
+    SELECT RequestID, LoanInfoID, Amount, Status, StatusCode, ResponseBody, EnqueuedAt, CompletedAt, Attempts, LastError
+    FROM PaymentQueue
+    WHERE RequestID = ?
+""")
+
+class PaymentQueue:
+    """
+    Queue of payments accepted in asynchronous mode, kept in the PaymentQueue table. Entries move
+    from queued to processing when a worker claims them, then to applied or failed with the
+    response the synchronous endpoint would have returned. Each claim counts an attempt; an
+    entry that errors is queued again, retry_delay seconds times its attempts later, until it
+    has used max_attempts; then it is dead-lettered.
+    Claims older than claim_timeout seconds are handed out again. A timed-out claim on its last
+    attempt is marked applied if its payment was applied, and dead-lettered otherwise.
+    """
+
+    def __init__(self, claim_timeout, max_attempts, retry_delay):
+        self.claim_timeout = claim_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def run(self, work):
+        # Run work(cursor) in one transaction on the primary and return its result
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        conn.autocommit = False
+        try:
+            result = work(cursor)
+            conn.commit()
+            return result
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            cursor.close()
+            conn.close()
+
+    def claim_batch(self, size):
+        # Returns (request_id, loan_id, amount) in queue order
+        def work(cursor):
+            for row in cursor.execute(payment_queue_recover_applied_query, self.claim_timeout, self.max_attempts).fetchall():
+                cursor.execute(payment_queue_store_key_response_query, row[0])
+                logging.warning('Queued payment %s was applied before its claim timed out; marked applied', row[0])
+            for row in cursor.execute(payment_queue_expire_claims_query, self.claim_timeout, self.max_attempts).fetchall():
+                cursor.execute(payment_queue_free_key_query, row[0])
+                logging.error('Queued payment %s dead-lettered: claim timed out after %s attempts', row[0], self.max_attempts)
+            return cursor.execute(payment_queue_claim_query, size, self.claim_timeout).fetchall()
+        rows = self.run(work)
+        return [(row[1], row[2], float(row[3])) for row in sorted(rows, key=lambda row: row[0])]
+
+    def complete(self, results):
+        # results: list of (request_id, status_code, response_body)
+        def work(cursor):
+            cursor.executemany(payment_queue_complete_query, [
+                ('applied' if status_code == 200 else 'failed', status_code, body, request_id)
+                for request_id, status_code, body in results
+            ])
+            cursor.executemany(payment_queue_store_key_response_query, [(request_id,) for request_id, _, _ in results])
+        self.run(work)
+
+    def release(self, request_ids):
+        # Put claimed entries back without counting the attempt, when the database was unreachable
+        self.run(lambda cursor: cursor.executemany(payment_queue_release_query, [(request_id,) for request_id in request_ids]))
+
+    def fail(self, failures):
+        # failures: list of (request_id, error); returns the request IDs that were dead-lettered
+        def work(cursor):
+            dead_lettered = []
+            for request_id, error in failures:
+                row = cursor.execute(payment_queue_fail_query, self.max_attempts, self.retry_delay, str(error)[:2000],
+                                     self.max_attempts, request_id).fetchone()
+                if row and row[0] == 'dead-lettered':
+                    cursor.execute(payment_queue_free_key_query, request_id)
+                    dead_lettered.append(request_id)
+            return dead_lettered
+        return self.run(work)
+
+    def get(self, request_id):
+        return self.run(lambda cursor: cursor.execute(payment_queue_get_query, request_id).fetchone())
+
+payment_queue = PaymentQueue(payment_claim_timeout, payment_max_attempts, payment_retry_delay)
+
+def payment_accepted_response(request_id, loan_id, payment_amount):
+    status_url = f'/api/loans/make-payment/status/{request_id}'
+    return HttpResponse(
+        json.dumps({
+            'status': 'accepted',
+            'data': {
+                'requestId': request_id,
+                'loanId': loan_id,
+                'paymentAmount': payment_amount,
+                'statusUrl': status_url
+            }
+        }),
+        status_code=202,
+        headers={'Location': status_url},
+        mimetype="application/json"
+    )
+
+def queued_payment_response(queued, request_hash):
+    # A retry of a queued payment gets the original request ID, unless the key was used for another payment
+    request_id, loan_id, amount, queued_hash = queued
+    if queued_hash != request_hash:
+        return idempotency_conflict_response()
+    return payment_accepted_response(request_id, loan_id, float(amount))
+
+def enqueue_loan_payment(loan_id, payment_amount, idempotency_key=None, request_hash=None):
+    try:
+        loan_id = int(loan_id)
+    except (TypeError, ValueError):
+        return HttpResponse(
+            json.dumps({
+                'status': 'error',
+                'message': 'Loan ID must be an integer'
+            }),
+            status_code=400,
+            mimetype="application/json"
+        )
+
+    try:
+        conn = get_db_connection()
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
     cursor = conn.cursor()
+    conn.autocommit = False
 
-    # Begin transaction
+    try:
+        try:
+            if idempotency_key:
+                # The key may already belong to a queued payment or to a synchronous one
+                queued = cursor.execute(payment_queue_find_key_query, idempotency_key).fetchone()
+                if queued:
+                    return queued_payment_response(queued, request_hash)
+                stored = find_stored_payment_response(cursor, idempotency_key)
+                if stored:
+                    idempotency_responses.set(idempotency_key, stored)
+                    return replay_payment_response(stored, request_hash)
+
+                # Claim the key as the synchronous path does, so a synchronous retry cannot pay again
+                # while the payment is queued; the drain stores the final response on the claim
+                cursor.execute(idempotency_expire_query, idempotency_key, idempotency_ttl)
+                try:
+                    cursor.execute(idempotency_claim_query, idempotency_key, request_hash)
+                except Exception as e:
+                    if not db_error_codes(e)[1] & duplicate_key_error_numbers:
+                        raise
+                    conn.rollback()
+                    queued = cursor.execute(payment_queue_find_key_query, idempotency_key).fetchone()
+                    if queued:
+                        return queued_payment_response(queued, request_hash)
+                    stored = find_stored_payment_response(cursor, idempotency_key)
+                    if stored:
+                        idempotency_responses.set(idempotency_key, stored)
+                        return replay_payment_response(stored, request_hash)
+                    return HttpResponse(
+                        json.dumps({
+                            'status': 'error',
+                            'message': 'A payment with this Idempotency-Key is still being processed'
+                        }),
+                        status_code=409,
+                        mimetype="application/json"
+                    )
+
+            request_id = uuid.uuid4().hex
+            cursor.execute(payment_queue_insert_query, request_id, loan_id, payment_amount, idempotency_key, request_hash)
+            conn.commit()
+            return payment_accepted_response(request_id, loan_id, payment_amount)
+
+        except Exception as e:
+            conn.rollback()
+            raise e
+
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
+
+    except Exception as e:
+        return HttpResponse(
+            json.dumps({
+                'status': 'error',
+                'message': str(e)
+            }),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+    finally:
+        cursor.close()
+        conn.close()
+
+payment_batch_create_query = sql_statements.register('payment_batch.create', """
+    IF OBJECT_ID('tempdb..#PaymentBatch') IS NOT NULL DROP TABLE #PaymentBatch;
+    CREATE TABLE #PaymentBatch (
+        Seq INT NOT NULL PRIMARY KEY,
+        RequestKey NVARCHAR(100) NOT NULL,
+        LoanInfoID INT NOT NULL,
+        Amount DECIMAL(18, 2) NOT NULL,
+        InstitutionPick INT NOT NULL
+    )
+""")
+
+payment_batch_insert_query = sql_statements.register('payment_batch.insert', "INSERT INTO #PaymentBatch (Seq, RequestKey, LoanInfoID, Amount, InstitutionPick) VALUES (?, ?, ?, ?, ?)")
+
+payment_batch_replayed_query = sql_statements.register('payment_batch.replayed', """
+    SELECT b.Seq, pi.StatusCode, pi.ResponseBody
+    FROM #PaymentBatch b
+    JOIN PaymentIdempotency pi ON pi.IdempotencyKey = b.RequestKey
+    WHERE pi.StatusCode IS NOT NULL
+""")
+
+payment_batch_lock_loans_query = sql_statements.register('payment_batch.lock_loans', """
+    SELECT l.LoanInfoID, l.LoanAmount, l.LoanBalance
+    FROM LoanInfo l WITH (UPDLOCK, ROWLOCK)
+    WHERE l.LoanInfoID IN (SELECT LoanInfoID FROM #PaymentBatch)
+""")
+
+payment_batch_drop_applied_query = sql_statements.register('payment_batch.drop_applied', """
+    DELETE b FROM #PaymentBatch b
+    JOIN PaymentIdempotency pi ON pi.IdempotencyKey = b.RequestKey
+""")
+
+payment_batch_reject_query = sql_statements.register('payment_batch.reject', "DELETE FROM #PaymentBatch WHERE Seq = ?")
+
+# Each payment's InstitutionPick, a random number drawn per row when the batch is loaded,
+# selects its financial institution by ordinal
+payment_batch_insert_payments_query = sql_statements.register('payment_batch.insert_payments', """
+    INSERT INTO Payment (LoanInfoID, Amount, Paydate, FinancialInstitutionID)
+    SELECT b.LoanInfoID, b.Amount, ?, fi.FinancialInstitutionID
+    FROM #PaymentBatch b
+    JOIN (
+        SELECT FinancialInstitutionID,
+               ROW_NUMBER() OVER (ORDER BY FinancialInstitutionID) - 1 AS Ordinal,
+               COUNT(*) OVER () AS Institutions
+        FROM FinancialInstitution
+    ) fi ON fi.Ordinal = b.InstitutionPick % fi.Institutions
+    ORDER BY b.Seq
+""")
+
+payment_batch_update_balances_query = sql_statements.register('payment_batch.update_balances', """
+    UPDATE l
+    SET LoanBalance = l.LoanBalance - t.TotalAmount,
+        PercentagePaid = CONCAT(CAST((l.LoanAmount - (l.LoanBalance - t.TotalAmount)) * 100 / l.LoanAmount AS INT), '%'),
+        PayoffDate = CASE WHEN l.LoanBalance - t.TotalAmount = 0 THEN ? ELSE NULL END
+    FROM LoanInfo l
+    JOIN (
+        SELECT LoanInfoID, SUM(Amount) as TotalAmount
+        FROM #PaymentBatch
+        GROUP BY LoanInfoID
+    ) t ON t.LoanInfoID = l.LoanInfoID
+""")
+
+payment_batch_store_responses_query = sql_statements.register('payment_batch.store_responses', """
+    INSERT INTO PaymentIdempotency (IdempotencyKey, RequestHash, StatusCode, ResponseBody, CreatedAt)
+    VALUES (?, '', 200, ?, SYSUTCDATETIME())
+""")
+
+payment_batch_drop_query = sql_statements.register('payment_batch.drop', "DROP TABLE #PaymentBatch")
+
+def apply_payment_batch(batch):
+    """
+    Apply a batch of queued payments (request_id, loan_id, amount) in one transaction and return
+    (request_id, status_code, response_body) for each. Balances are validated in queue order per
+    loan; accepted payments are inserted and loan balances updated with set-based statements.
+    Each applied payment records a PaymentIdempotency row keyed by its request ID, so a batch
+    that is claimed again after a crash does not apply the same payment twice.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
     conn.autocommit = False
 
     try:
-        # Get current loan information
-        cursor.execute("""
-            SELECT LoanAmount, LoanBalance
-            FROM LoanInfo
-            WHERE LoanInfoID = ?
-        """, loan_id)
-        
-        loan_info = cursor.fetchone()
-        if not loan_info:
-            return HttpResponse(
-                json.dumps({
+        cursor.execute(payment_batch_create_query)
+        cursor.fast_executemany = True
+        cursor.executemany(
+            payment_batch_insert_query,
+            [(seq, f'queue:{request_id}', loan_id, amount, random.randrange(2 ** 31 - 1))
+             for seq, (request_id, loan_id, amount) in enumerate(batch)]
+        )
+
+        results = {}
+
+        # Payments already applied by an earlier attempt of this batch replay their stored response
+        cursor.execute(payment_batch_replayed_query)
+        for seq, status_code, body in cursor.fetchall():
+            results[seq] = (status_code, body)
+
+        # Lock the affected loans and read their balances in one statement
+        cursor.execute(payment_batch_lock_loans_query)
+        balances = {row[0]: [float(row[1]), float(row[2])] for row in cursor.fetchall()}
+
+        today = date.today()
+        rejected = []
+        accepted = []
+        for seq, (request_id, loan_id, amount) in enumerate(batch):
+            if seq in results:
+                continue
+            if loan_id not in balances:
+                results[seq] = (400, json.dumps({
                     'status': 'error',
                     'message': f'Loan ID {loan_id} not found'
-                }),
-                status_code=400,
-                mimetype="application/json"
-            )
-        
-        loan_amount, current_balance = loan_info
+                }))
+                rejected.append(seq)
+                continue
+            loan_amount, current_balance = balances[loan_id]
+            if amount > current_balance:
+                results[seq] = (409, json.dumps({
+                    'status': 'error',
+                    'message': f'Payment amount cannot exceed current balance of {current_balance}CAD'
+                }))
+                rejected.append(seq)
+                continue
+
+            new_balance = round(current_balance - amount, 2)
+            balances[loan_id][1] = new_balance
+            percentage_paid = f"{int(((loan_amount - new_balance) / loan_amount) * 100)}%"
+            results[seq] = (200, json.dumps({
+                'status': 'success',
+                'data': {
+                    'loanId': loan_id,
+                    'paymentAmount': amount,
+                    'paymentDate': today.isoformat(),
+                    'newBalance': new_balance,
+                    'percentagePaid': percentage_paid,
+                    'isFullyPaid': new_balance == 0
+                }}))
+            accepted.append((seq, results[seq][1]))
+
+        # Keep only the payments to apply in the batch table
+        cursor.execute(payment_batch_drop_applied_query)
+        if rejected:
+            cursor.executemany(payment_batch_reject_query, [(seq,) for seq in rejected])
+
+        if accepted:
+            # One Payment row per accepted payment, each with a random financial institution as before
+            cursor.execute(payment_batch_insert_payments_query, today)
+
+            # One balance update per loan for all of its accepted payments
+            cursor.execute(payment_batch_update_balances_query, today)
+
+            cursor.executemany(payment_batch_store_responses_query, [(f'queue:{batch[seq][0]}', body) for seq, body in accepted])
+
+        cursor.execute(payment_batch_drop_query)
+        conn.commit()
+        if accepted:
+            invalidate_cached('payments', *sorted({f'loan:{int(batch[seq][1])}' for seq, _ in accepted}))
+
+        return [(batch[seq][0], status_code, body) for seq, (status_code, body) in sorted(results.items())]
+
+    except Exception as e:
+        conn.rollback()
+        raise e
+
+    finally:
+        cursor.close()
+        conn.close()
+
+def apply_claimed_payments(batch):
+    """
+    Apply a claimed batch and return (results, failures). When the batch fails as a whole it is
+    split in halves and each half applied on its own, down to single entries, so one entry that
+    breaks the batch does not hold back the others. failures lists (request_id, error) of the
+    entries that failed by themselves.
+    """
+    try:
+        return apply_payment_batch(batch), []
+    except DatabaseUnavailableError:
+        raise
+    except Exception as e:
+        if len(batch) == 1:
+            return [], [(batch[0][0], e)]
+        middle = len(batch) // 2
+        first_results, first_failures = apply_claimed_payments(batch[:middle])
+        rest_results, rest_failures = apply_claimed_payments(batch[middle:])
+        return first_results + rest_results, first_failures + rest_failures
+
+def drain_payment_queue(max_seconds=None):
+    # Claim and apply batches until the queue is empty or the time budget is spent
+    deadline = time.monotonic() + (payment_drain_max_seconds if max_seconds is None else max_seconds)
+    summary = {'batches': 0, 'applied': 0, 'failed': 0, 'retrying': 0, 'deadLettered': 0}
+    while time.monotonic() < deadline:
+        batch = payment_queue.claim_batch(payment_batch_size)
+        if not batch:
+            break
+        try:
+            results, failures = apply_claimed_payments(batch)
+        except DatabaseUnavailableError:
+            payment_queue.release([row[0] for row in batch])
+            raise
+        if results:
+            payment_queue.complete(results)
+        if failures:
+            for request_id, error in failures:
+                logging.warning('Queued payment %s failed: %s', request_id, error)
+            dead_lettered = payment_queue.fail(failures)
+            if dead_lettered:
+                logging.error('Queued payments dead-lettered after %s attempts: %s', payment_max_attempts, ', '.join(dead_lettered))
+            summary['retrying'] += len(failures) - len(dead_lettered)
+            summary['deadLettered'] += len(dead_lettered)
+        summary['batches'] += 1
+        summary['applied'] += sum(1 for _, status_code, _ in results if status_code == 200)
+        summary['failed'] += sum(1 for _, status_code, _ in results if status_code != 200)
+    return summary
+
+@app.timer_trigger(schedule=os.getenv('PAYMENT_QUEUE_DRAIN_SCHEDULE', '*/5 * * * * *'), arg_name="timer",
+                   run_on_startup=False, use_monitor=False)
+def payment_queue_worker(timer: func.TimerRequest) -> None:
+    """
+    Drains payments accepted in asynchronous mode, PAYMENT_BATCH_SIZE per transaction.
+    """
+    started = time.perf_counter()
+    try:
+        summary = drain_payment_queue()
+        if summary['batches']:
+            summary['durationMs'] = round((time.perf_counter() - started) * 1000, 1)
+            logging.info('Payment queue drained: %s', json.dumps(summary))
+    except Exception as e:
+        logging.error('Payment queue drain failed: %s', e)
+
+@app.route(route="loans/make-payment/status/{requestid}", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('lookups')
+@limit_concurrency('lookups')
+def get_loan_payment_status(req: func.HttpRequest) -> func.HttpResponse:
+    request_id = req.route_params.get('requestid')
 
-        # Validate payment amount
-        if payment_amount > float(current_balance):
+    try:
+        entry = payment_queue.get(request_id)
+        if not entry:
             return HttpResponse(
                 json.dumps({
                     'status': 'error',
-                    'message': f'Payment amount cannot exceed current balance of {float(current_balance)}CAD'
+                    'message': f'No queued payment found for request ID: {request_id}'
                 }),
-                status_code=409,
+                status_code=404,
                 mimetype="application/json"
             )
-        
-        # Calculate new balance and percentage paid
-        new_balance = round(float(current_balance) - payment_amount, 2)
-        percentage_paid = f"{int(((float(loan_amount) - new_balance) / float(loan_amount)) * 100)}%"
-        today = date.today()
 
-        # Get a random financial institution
-        cursor.execute("SELECT TOP 1 FinancialInstitutionID FROM FinancialInstitution ORDER BY NEWID()")
-        financial_institution_id = cursor.fetchone()[0]
-
-        # Insert payment record
-        cursor.execute("""
-            INSERT INTO Payment (LoanInfoID, Amount, Paydate, FinancialInstitutionID)
-            VALUES (?, ?, ?, ?)
-        """, loan_id, payment_amount, today, financial_institution_id)
-
-        # Update loan balance and percentage paid
-        cursor.execute("""
-            UPDATE LoanInfo
-            SET LoanBalance = ?,
-                PercentagePaid = ?,
-                PayoffDate = ?
-            WHERE LoanInfoID = ?
-        """, new_balance, percentage_paid, 
-            today if new_balance == 0 else None, 
-            loan_id)
-
-        conn.commit()
-        
+        request_id, loan_id, amount, status, status_code, body, enqueued_at, completed_at, attempts, last_error = entry
         return HttpResponse(
             json.dumps({
                 'status': 'success',
                 'data': {
+                    'requestId': request_id,
                     'loanId': loan_id,
-                    'paymentAmount': payment_amount,
-                    'paymentDate': today.isoformat(),
-                    'newBalance': new_balance,
-                    'percentagePaid': percentage_paid,
-                    'isFullyPaid': new_balance == 0
-                }},default=decimal_default),
+                    'paymentAmount': float(amount),
+                    'paymentStatus': status,
+                    'enqueuedAt': enqueued_at.replace(tzinfo=timezone.utc).isoformat(),
+                    'completedAt': completed_at.replace(tzinfo=timezone.utc).isoformat() if completed_at else None,
+                    'attempts': attempts,
+                    'lastError': last_error,
+                    'result': {
+                        'statusCode': status_code,
+                        'body': json.loads(body)
+                    } if body else None
+                }
+            }),
             status_code=200,
             mimetype="application/json"
         )
 
-    except Exception as e:
-        conn.rollback()
-        raise e
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
 
     except Exception as e:
         return HttpResponse(
@@ -692,17 +3288,39 @@ def post_loan_payment(req: func.HttpRequest) -> func.HttpResponse:
             status_code=500,
             mimetype="application/json"
         )
-        
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
+
+student_communication_id_query = sql_statements.register('students.communication_id', """
+    SELECT CommunicationID
+    FROM Student
+    WHERE StudentID = ?
+""")
+
+update_communication_query = sql_statements.register('communication.update', """
+    UPDATE Communication
+    SET PhoneNumber = ?,
+        Email = ?,
+        Preference = ?
+    WHERE CommunicationID = ?
+""")
+
+student_communication_query = sql_statements.register('students.communication', """
+    SELECT s.StudentID,
+            s.FirstName,
+            s.LastName,
+            c.PhoneNumber,
+            c.Email,
+            c.Preference
+    FROM Student s
+    JOIN Communication c ON s.CommunicationID = c.CommunicationID
+    WHERE s.StudentID = ?
+""")
 
 @app.route(route="student/update/communication", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('writes')
+@limit_concurrency('writes')
 def update_student_communication(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request.')
-
     # Get update data from request body
     update_data = req.get_json()
     if not update_data:
@@ -751,7 +3369,10 @@ def update_student_communication(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json"
         )
     
-    conn = get_db_connection()
+    try:
+        conn = get_db_connection()
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
     cursor = conn.cursor()
 
     # Begin transaction
@@ -759,11 +3380,7 @@ def update_student_communication(req: func.HttpRequest) -> func.HttpResponse:
 
     try:
         # Check if student exists
-        cursor.execute("""
-            SELECT CommunicationID
-            FROM Student
-            WHERE StudentID = ?
-        """, student_id)
+        cursor.execute(student_communication_id_query, student_id)
         
         student = cursor.fetchone()
         if not student:
@@ -779,34 +3396,19 @@ def update_student_communication(req: func.HttpRequest) -> func.HttpResponse:
         communication_id = student[0]
 
         # Update communication information
-        cursor.execute("""
-            UPDATE Communication
-            SET PhoneNumber = ?,
-                Email = ?,
-                Preference = ?
-            WHERE CommunicationID = ?
-        """, update_data['phoneNumber'], 
+        cursor.execute(update_communication_query, update_data['phoneNumber'], 
             update_data['email'], 
             update_data['preference'], 
             communication_id)
 
         # Get updated information
-        cursor.execute("""
-            SELECT s.StudentID,
-                    s.FirstName,
-                    s.LastName,
-                    c.PhoneNumber,
-                    c.Email,
-                    c.Preference
-            FROM Student s
-            JOIN Communication c ON s.CommunicationID = c.CommunicationID
-            WHERE s.StudentID = ?
-        """, student_id)
+        cursor.execute(student_communication_query, student_id)
 
         columns = [column[0] for column in cursor.description]
         updated_info = dict(zip(columns, cursor.fetchone()))
 
         conn.commit()
+        invalidate_cached('students')
 
         return HttpResponse(
             json.dumps({
@@ -838,10 +3440,23 @@ def update_student_communication(req: func.HttpRequest) -> func.HttpResponse:
         if 'conn' in locals():
             conn.close()
 
+update_student_address_query = sql_statements.register('students.update_address', """
+    UPDATE Student
+    SET HomeAddress = ?
+    OUTPUT 
+        inserted.StudentID,
+        inserted.FirstName,
+        inserted.LastName,
+        inserted.HomeAddress
+    WHERE StudentID = ?
+""")
+
 @app.route(route="student/update/address", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('writes')
+@limit_concurrency('writes')
 def update_student_address(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request.')
-
     try:
         # Get update data from request body
         update_data = req.get_json()
@@ -874,16 +3489,7 @@ def update_student_address(req: func.HttpRequest) -> func.HttpResponse:
 
         try:
             # Check if student exists and update address
-            cursor.execute("""
-                UPDATE Student
-                SET HomeAddress = ?
-                OUTPUT 
-                    inserted.StudentID,
-                    inserted.FirstName,
-                    inserted.LastName,
-                    inserted.HomeAddress
-                WHERE StudentID = ?
-            """, update_data['homeAddress'], student_id)
+            cursor.execute(update_student_address_query, update_data['homeAddress'], student_id)
             
             updated_row = cursor.fetchone()
             if not updated_row:
@@ -901,6 +3507,7 @@ def update_student_address(req: func.HttpRequest) -> func.HttpResponse:
             updated_info = dict(zip(columns, updated_row))
 
             conn.commit()
+            invalidate_cached('students')
 
             return HttpResponse(
                 json.dumps({
@@ -911,9 +3518,136 @@ def update_student_address(req: func.HttpRequest) -> func.HttpResponse:
                 status_code=200,
                 mimetype="application/json"
             )
-        except Exception as e:
-            conn.rollback()
-            raise e
+        except Exception as e:
+            conn.rollback()
+            raise e
+
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
+
+    except Exception as e:
+        return HttpResponse(
+            json.dumps({
+                'status': 'error',
+                'message': str(e)
+            }),
+            status_code=500,
+            mimetype="application/json"
+        )
+    finally:
+        if 'cursor' in locals():
+            cursor.close()
+        if 'conn' in locals():
+            conn.close()
+
+# Canadian provinces and territories with the first letters their postal codes may start with
+canadian_provinces = MappingProxyType({
+    'AB': ('Alberta', frozenset('T')),
+    'BC': ('British Columbia', frozenset('V')),
+    'MB': ('Manitoba', frozenset('R')),
+    'NB': ('New Brunswick', frozenset('E')),
+    'NL': ('Newfoundland and Labrador', frozenset('A')),
+    'NS': ('Nova Scotia', frozenset('B')),
+    'NT': ('Northwest Territories', frozenset('X')),
+    'NU': ('Nunavut', frozenset('X')),
+    'ON': ('Ontario', frozenset('KLMNP')),
+    'PE': ('Prince Edward Island', frozenset('C')),
+    'QC': ('Quebec', frozenset('GHJ')),
+    'SK': ('Saskatchewan', frozenset('S')),
+    'YT': ('Yukon', frozenset('Y')),
+})
+
+# Alternate spellings that resolve to a province code
+canadian_province_aliases = MappingProxyType({
+    'QUÉBEC': 'QC',
+    'NEWFOUNDLAND': 'NL',
+    'PEI': 'PE',
+    'P.E.I.': 'PE',
+    'YUKON TERRITORY': 'YT',
+})
+
+canadian_province_tokens = MappingProxyType({
+    **{code: code for code in canadian_provinces},
+    **{name.upper(): code for code, (name, _) in canadian_provinces.items()},
+    **canadian_province_aliases,
+})
+
+# One alternation for every province token plus the postal code, so an address is scanned once.
+# Postal code pattern: A1A 1A1 or A1A1A1 (D, F, I, O, Q and U are never used)
+canadian_address_pattern = re.compile(
+    r'(?<![A-Z0-9])(?:(?P<postal>[ABCEGHJ-NPRSTVXY]\d[ABCEGHJ-NPRSTV-Z]\s*\d[ABCEGHJ-NPRSTV-Z]\d)'
+    r'|(?P<province>' + '|'.join(re.escape(token) for token in sorted(canadian_province_tokens, key=len, reverse=True)) + r'))'
+    r'(?![A-Z0-9])'
+)
+
+address_batch_max_size = int(os.getenv('ADDRESS_BATCH_MAX_SIZE', '50000'))
+
+def match_canadian_address(address):
+    """
+    Return the province code of a Canadian address, or None when the address does not name a
+    province or territory together with a postal code whose first letter belongs to it.
+    """
+    provinces = set()
+    postal_letters = set()
+    for match in canadian_address_pattern.finditer(address.upper()):
+        if match.lastgroup == 'postal':
+            postal_letters.add(match.group()[0])
+        else:
+            provinces.add(canadian_province_tokens[match.group()])
+
+    for code in provinces:
+        if canadian_provinces[code][1] & postal_letters:
+            return code
+    return None
+
+@app.route(route="student/address/iscanadian", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('lookups')
+@limit_concurrency('lookups')
+def is_canadian_address(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Check if an address is Canadian based on province and postal code format.
+    Returns True if address is Canadian, False otherwise.
+    """
+    try:
+        # Get update data from request body
+        payload_data = req.get_json()
+        if not isinstance(payload_data, dict) or 'address' not in payload_data:
+            return HttpResponse(
+                json.dumps({
+                    'status': 'error',
+                    'message': 'Address is required'
+                }),
+                status_code=400,
+                mimetype="application/json"
+            )
+        address = payload_data['address']
+        if not isinstance(address, str):
+            return HttpResponse(
+                json.dumps({
+                    'status': 'error',
+                    'message': 'Address must be a string'
+                }),
+                status_code=400,
+                mimetype="application/json"
+            )
+
+        province = match_canadian_address(address)
+
+        return HttpResponse(
+            json.dumps({
+                'status': 'success',
+                'message': 'Address check successful',
+                'data': {
+                    'address': address,
+                    'isCanadian': province is not None,
+                    'province': province
+                }
+            }),
+            status_code=200,
+            mimetype="application/json"
+        )
 
     except Exception as e:
         return HttpResponse(
@@ -924,97 +3658,69 @@ def update_student_address(req: func.HttpRequest) -> func.HttpResponse:
             status_code=500,
             mimetype="application/json"
         )
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
 
-@app.route(route="student/address/iscanadian", auth_level=func.AuthLevel.ANONYMOUS)
-def is_canadian_address(req: func.HttpRequest) -> func.HttpResponse:
+@app.route(route="student/address/iscanadian/batch", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('reports')
+@limit_concurrency('reports')
+def is_canadian_address_batch(req: func.HttpRequest) -> func.HttpResponse:
     """
-    Check if an address is Canadian based on province and postal code format.
-    Returns True if address is Canadian, False otherwise.
+    Check a list of addresses in one call. Results are returned in the same order as the input.
     """
-    logging.info('Python HTTP trigger function processed a request.')
-
-    # Create a dictionary of Canadian provinces and their codes
-    provinces_cities = {
-        'AB': {
-            'name': 'Alberta',
-            'cities': ['Calgary', 'Edmonton', 'Red Deer', 'Lethbridge', 'Medicine Hat']
-        },
-        'MB': {
-            'name': 'Manitoba',
-            'cities': ['Winnipeg', 'Brandon', 'Steinbach', 'Thompson', 'Portage la Prairie']
-        },
-        'NB': {
-            'name': 'New Brunswick',
-            'cities': ['Saint John', 'Fredericton', 'Moncton', 'Dieppe', 'Miramichi']
-        },
-        'NL': {
-            'name': 'Newfoundland and Labrador',
-            'cities': ['St. John\'s', 'Mount Pearl', 'Corner Brook', 'Paradise', 'Grand Falls-Windsor']
-        },
-        'NS': {
-            'name': 'Nova Scotia',
-            'cities': ['Halifax', 'Dartmouth', 'Sydney', 'Truro', 'New Glasgow']
-        },
-        'ON': {
-            'name': 'Ontario',
-            'cities': ['Toronto', 'Ottawa', 'Mississauga', 'Hamilton', 'London']
-        },
-        'PE': {
-            'name': 'Prince Edward Island',
-            'cities': ['Charlottetown', 'Summerside', 'Stratford', 'Cornwall', 'Montague']
-        },
-    }
-
     try:
-        # Get update data from request body
         payload_data = req.get_json()
-        if not payload_data or 'address' not in payload_data:
+        if not isinstance(payload_data, dict) or not isinstance(payload_data.get('addresses'), list):
             return HttpResponse(
                 json.dumps({
                     'status': 'error',
-                    'message': 'Address is required'
+                    'message': 'A list of addresses is required'
                 }),
                 status_code=400,
                 mimetype="application/json"
             )
-        address = payload_data['address']
+        addresses = payload_data['addresses']
 
-        try:
-            # Canadian postal code pattern: A1A 1A1 or A1A1A1
-            postal_pattern = r'[A-Z]\d[A-Z]\s*\d[A-Z]\d'
-            
-            # Get list of all province codes and names
-            province_codes = list(provinces_cities.keys())
-            province_names = [prov['name'] for prov in provinces_cities.values()]
-            
-            # Check if address contains a valid province
-            has_province = any(code in address.upper() for code in province_codes) or \
-                        any(name in address for name in province_names)
-            
-            # Check if address contains valid postal code format
-            has_postal = bool(re.search(postal_pattern, address.upper()))
-            
-            result = has_province and has_postal
+        if len(addresses) > address_batch_max_size:
+            return HttpResponse(
+                json.dumps({
+                    'status': 'error',
+                    'message': f'At most {address_batch_max_size} addresses can be checked per call'
+                }),
+                status_code=413,
+                mimetype="application/json"
+            )
 
+        invalid = [index for index, address in enumerate(addresses) if not isinstance(address, str)]
+        if invalid:
             return HttpResponse(
                 json.dumps({
-                    'status': 'success',
-                    'message': 'Address check successful',
-                    'data': {
-                        'address': address,
-                        'isCanadian': result
-                    }
+                    'status': 'error',
+                    'message': 'Every address must be a string',
+                    'invalidIndexes': invalid[:100]
                 }),
-                status_code=200,
+                status_code=400,
                 mimetype="application/json"
             )
-        except Exception as e:
-            raise e
+
+        results = []
+        canadian_count = 0
+        for address in addresses:
+            province = match_canadian_address(address)
+            if province is not None:
+                canadian_count += 1
+            results.append({'isCanadian': province is not None, 'province': province})
+
+        return HttpResponse(
+            json.dumps({
+                'status': 'success',
+                'count': len(results),
+                'canadianCount': canadian_count,
+                'data': results
+            }),
+            status_code=200,
+            mimetype="application/json"
+        )
 
     except Exception as e:
         return HttpResponse(
@@ -1026,10 +3732,42 @@ def is_canadian_address(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json"
         )
 
+insert_communication_query = sql_statements.register('communication.insert', """
+    INSERT INTO Communication (PhoneNumber, Email, Preference)
+    OUTPUT inserted.CommunicationID
+    VALUES (?, ?, ?)
+""")
+
+insert_student_query = sql_statements.register('students.insert', """
+    INSERT INTO Student (FirstName, LastName, HomeAddress, CommunicationID)
+    OUTPUT 
+        inserted.StudentID,
+        inserted.FirstName,
+        inserted.LastName,
+        inserted.HomeAddress
+    VALUES (?, ?, ?, ?)
+""")
+
+student_profile_query = sql_statements.register('students.profile', """
+    SELECT 
+        s.StudentID,
+        s.FirstName,
+        s.LastName,
+        s.HomeAddress,
+        c.PhoneNumber,
+        c.Email,
+        c.Preference
+    FROM Student s
+    JOIN Communication c ON s.CommunicationID = c.CommunicationID
+    WHERE s.StudentID = ?
+""")
+
 @app.route(route="student/create-nonregistered", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('writes')
+@limit_concurrency('writes')
 def create_student_nonregistered(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request.')
-
     try:
         # Get student data from request body
         student_data = req.get_json()
@@ -1070,26 +3808,14 @@ def create_student_nonregistered(req: func.HttpRequest) -> func.HttpResponse:
 
         try:
             # Insert communication record
-            cursor.execute("""
-                INSERT INTO Communication (PhoneNumber, Email, Preference)
-                OUTPUT inserted.CommunicationID
-                VALUES (?, ?, ?)
-            """, student_data['phoneNumber'], 
+            cursor.execute(insert_communication_query, student_data['phoneNumber'], 
                 student_data['email'], 
                 student_data['preference'])
             
             communication_id = cursor.fetchone()[0]
 
             # Insert student record
-            cursor.execute("""
-                INSERT INTO Student (FirstName, LastName, HomeAddress, CommunicationID)
-                OUTPUT 
-                    inserted.StudentID,
-                    inserted.FirstName,
-                    inserted.LastName,
-                    inserted.HomeAddress
-                VALUES (?, ?, ?, ?)
-            """, student_data['firstName'],
+            cursor.execute(insert_student_query, student_data['firstName'],
                 student_data['lastName'],
                 student_data['homeAddress'],
                 communication_id)
@@ -1097,25 +3823,14 @@ def create_student_nonregistered(req: func.HttpRequest) -> func.HttpResponse:
             new_student = cursor.fetchone()
             
             # Get complete student information
-            cursor.execute("""
-                SELECT 
-                    s.StudentID,
-                    s.FirstName,
-                    s.LastName,
-                    s.HomeAddress,
-                    c.PhoneNumber,
-                    c.Email,
-                    c.Preference
-                FROM Student s
-                JOIN Communication c ON s.CommunicationID = c.CommunicationID
-                WHERE s.StudentID = ?
-            """, new_student[0])
+            cursor.execute(student_profile_query, new_student[0])
 
             columns = ['studentId', 'firstName', 'lastName', 'homeAddress', 
                       'phoneNumber', 'email', 'preference']
             student_info = dict(zip(columns, cursor.fetchone()))
 
             conn.commit()
+            invalidate_cached('students')
             
             return HttpResponse(
                 json.dumps({
@@ -1131,6 +3846,9 @@ def create_student_nonregistered(req: func.HttpRequest) -> func.HttpResponse:
             conn.rollback()
             raise e
 
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
+
     except Exception as e:
          return HttpResponse(
             json.dumps({
@@ -1146,10 +3864,44 @@ def create_student_nonregistered(req: func.HttpRequest) -> func.HttpResponse:
         if 'conn' in locals():
             conn.close()
 
+loan_study_info_query = sql_statements.register('loans.study_info', """
+    SELECT LoanInfoID, StudyInfoID, EducationInstitutionID
+    FROM LoanInfo
+    WHERE LoanInfoID = ?
+""")
+
+insert_study_info_loan_query = sql_statements.register('loans.insert_study_info', """
+    INSERT INTO LoanInfo 
+    (StudyInfoID, EducationInstitutionID, EnrollmentType, 
+     LoanAmount, DisbursementDate, LoanBalance, PercentagePaid)
+    OUTPUT inserted.LoanInfoID
+    VALUES (?, ?, 'NSL', 0, ?, 0, '0%')
+""")
+
+loan_study_details_query = sql_statements.register('loans.study_details', """
+    SELECT 
+        s.StudentID,
+        s.FirstName,
+        s.LastName,
+        si.ProgramOfStudy,
+        si.ProgramCode,
+        ei.CollegeName,
+        ei.City,
+        p.Province
+    FROM Student s
+    JOIN LoanInfo l ON s.LoanInfoID = l.LoanInfoID
+    JOIN StudyInfo si ON l.StudyInfoID = si.StudyInfoID
+    JOIN EducationInstitution ei ON l.EducationInstitutionID = ei.EducationInstitutionID
+    JOIN Province p ON ei.ProvinceID = p.ProvinceID
+    WHERE l.LoanInfoID = ?
+""")
+
 @app.route(route="loan/update/study-info", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('writes')
+@limit_concurrency('writes')
 def update_loan_study_info(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request.')
-
     try:
         # Get study data from request body
         study_data = req.get_json()
@@ -1187,11 +3939,7 @@ def update_loan_study_info(req: func.HttpRequest) -> func.HttpResponse:
 
         try:
             # Check if loan exists and has study info and efucation institution
-            cursor.execute("""
-                SELECT LoanInfoID, StudyInfoID, EducationInstitutionID
-                FROM LoanInfo
-                WHERE LoanInfoID = ?
-            """, loan_id)
+            cursor.execute(loan_study_info_query, loan_id)
             
             loan_info = cursor.fetchone()
             if not loan_info:
@@ -1216,39 +3964,19 @@ def update_loan_study_info(req: func.HttpRequest) -> func.HttpResponse:
                 )
             
             # Update loan info record
-            cursor.execute("""
-                INSERT INTO LoanInfo 
-                (StudyInfoID, EducationInstitutionID, EnrollmentType, 
-                 LoanAmount, DisbursementDate, LoanBalance, PercentagePaid)
-                OUTPUT inserted.LoanInfoID
-                VALUES (?, ?, 'NSL', 0, ?, 0, '0%')
-            """, study_info_id, education_institution_id, date.today())
+            cursor.execute(insert_study_info_loan_query, study_info_id, education_institution_id, date.today())
             
             loan_info_id = cursor.fetchone()[0]
 
             # Get updated student information
-            cursor.execute("""
-                SELECT 
-                    s.StudentID,
-                    s.FirstName,
-                    s.LastName,
-                    si.ProgramOfStudy,
-                    si.ProgramCode,
-                    ei.CollegeName,
-                    ei.City,
-                    p.Province
-                FROM Student s
-                JOIN LoanInfo l ON s.LoanInfoID = l.LoanInfoID
-                JOIN StudyInfo si ON l.StudyInfoID = si.StudyInfoID
-                JOIN EducationInstitution ei ON l.EducationInstitutionID = ei.EducationInstitutionID
-                JOIN Province p ON ei.ProvinceID = p.ProvinceID
-                WHERE l.LoanInfoID = ?
-            """, loan_info_id)
+            cursor.execute(loan_study_details_query, loan_info_id)
 
             columns = [column[0] for column in cursor.description]
             updated_info = dict(zip(columns, cursor.fetchone()))
 
             conn.commit()
+            # The per-loan routes return CollegeName and ProgramOfStudy too
+            invalidate_cached('students', f'loan:{int(loan_info[0])}', f'loan:{int(loan_info_id)}')
 
             return HttpResponse(
                 json.dumps({
@@ -1264,6 +3992,9 @@ def update_loan_study_info(req: func.HttpRequest) -> func.HttpResponse:
             conn.rollback()
             raise e
 
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
+
     except Exception as e:
         return HttpResponse(
             json.dumps({
@@ -1280,10 +4011,60 @@ def update_loan_study_info(req: func.HttpRequest) -> func.HttpResponse:
         if 'conn' in locals():
             conn.close()
 
+student_current_loan_query = sql_statements.register('students.current_loan', """
+    SELECT s.LoanInfoID, 
+           l.LoanAmount,
+           l.DisbursementDate,
+           l.LoanBalance,
+           si.ProgramOfStudy,
+           ei.CollegeName
+    FROM Student s
+    LEFT JOIN LoanInfo l ON s.LoanInfoID = l.LoanInfoID
+    LEFT JOIN StudyInfo si ON l.StudyInfoID = si.StudyInfoID
+    LEFT JOIN EducationInstitution ei ON l.EducationInstitutionID = ei.EducationInstitutionID
+    WHERE s.StudentID = ?
+""")
+
+insert_loan_query = sql_statements.register('loans.insert', """
+    INSERT INTO LoanInfo 
+    (StudyInfoID, EducationInstitutionID, EnrollmentType, 
+     LoanAmount, DisbursementDate, LoanBalance, PercentagePaid)
+    OUTPUT inserted.LoanInfoID
+    VALUES (?, ?, ?, ?, ?, ?, '0%')
+""")
+
+assign_student_loan_query = sql_statements.register('students.assign_loan', """
+    UPDATE Student
+    SET LoanInfoID = ?
+    WHERE StudentID = ?
+""")
+
+student_loan_query = sql_statements.register('students.loan', """
+    SELECT 
+        s.StudentID,
+        s.FirstName,
+        s.LastName,
+        si.ProgramOfStudy,
+        ei.CollegeName,
+        l.LoanInfoID,
+        l.LoanAmount,
+        l.EnrollmentType,
+        l.DisbursementDate,
+        l.LoanBalance,
+        l.PercentagePaid
+    FROM Student s
+    JOIN LoanInfo l ON s.LoanInfoID = l.LoanInfoID
+    JOIN StudyInfo si ON l.StudyInfoID = si.StudyInfoID
+    JOIN EducationInstitution ei ON l.EducationInstitutionID = ei.EducationInstitutionID
+    WHERE s.StudentID = ?
+""")
+
 @app.route(route="student/update/loan", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('writes')
+@limit_concurrency('writes')
 def add_student_loan(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request.')
-
     try:
         # Validate request body
         loan_data = req.get_json()
@@ -1325,19 +4106,7 @@ def add_student_loan(req: func.HttpRequest) -> func.HttpResponse:
 
         try:
             # Check if student exists and get current loan info
-            cursor.execute("""
-                SELECT s.LoanInfoID, 
-                       l.LoanAmount,
-                       l.DisbursementDate,
-                       l.LoanBalance,
-                       si.ProgramOfStudy,
-                       ei.CollegeName
-                FROM Student s
-                LEFT JOIN LoanInfo l ON s.LoanInfoID = l.LoanInfoID
-                LEFT JOIN StudyInfo si ON l.StudyInfoID = si.StudyInfoID
-                LEFT JOIN EducationInstitution ei ON l.EducationInstitutionID = ei.EducationInstitutionID
-                WHERE s.StudentID = ?
-            """, student_id)
+            cursor.execute(student_current_loan_query, student_id)
             
             student_info = cursor.fetchone()
             if not student_info:
@@ -1371,13 +4140,7 @@ def add_student_loan(req: func.HttpRequest) -> func.HttpResponse:
             
             # Create loan info record
             disbursement_date = date.fromisoformat(loan_data['disbursementDate'])
-            cursor.execute("""
-                INSERT INTO LoanInfo 
-                (StudyInfoID, EducationInstitutionID, EnrollmentType, 
-                 LoanAmount, DisbursementDate, LoanBalance, PercentagePaid)
-                OUTPUT inserted.LoanInfoID
-                VALUES (?, ?, ?, ?, ?, ?, '0%')
-            """, loan_data['studyinfoid'], 
+            cursor.execute(insert_loan_query, loan_data['studyinfoid'], 
                 loan_data['educationinstitutionid'], 
                 loan_data['enrollmentType'],
                 loan_data['loanAmount'],
@@ -1387,37 +4150,17 @@ def add_student_loan(req: func.HttpRequest) -> func.HttpResponse:
             loan_info_id = cursor.fetchone()[0]
 
             # Update student with new loan info
-            cursor.execute("""
-                UPDATE Student
-                SET LoanInfoID = ?
-                WHERE StudentID = ?
-            """, loan_info_id, student_id)
+            cursor.execute(assign_student_loan_query, loan_info_id, student_id)
 
             # Get updated loan information
-            cursor.execute("""
-                SELECT 
-                    s.StudentID,
-                    s.FirstName,
-                    s.LastName,
-                    si.ProgramOfStudy,
-                    ei.CollegeName,
-                    l.LoanInfoID,
-                    l.LoanAmount,
-                    l.EnrollmentType,
-                    l.DisbursementDate,
-                    l.LoanBalance,
-                    l.PercentagePaid
-                FROM Student s
-                JOIN LoanInfo l ON s.LoanInfoID = l.LoanInfoID
-                JOIN StudyInfo si ON l.StudyInfoID = si.StudyInfoID
-                JOIN EducationInstitution ei ON l.EducationInstitutionID = ei.EducationInstitutionID
-                WHERE s.StudentID = ?
-            """, student_id)
+            cursor.execute(student_loan_query, student_id)
 
             columns = [column[0] for column in cursor.description]
             updated_info = dict(zip(columns, cursor.fetchone()))
 
             conn.commit()
+            # A lookup of the new loan ID made before it existed may be cached
+            invalidate_cached('students', f'loan:{int(loan_info_id)}')
 
             return HttpResponse(
                 json.dumps({
@@ -1433,6 +4176,9 @@ def add_student_loan(req: func.HttpRequest) -> func.HttpResponse:
             conn.rollback()
             raise e
 
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
+
     except Exception as e:
         return HttpResponse(
                 json.dumps({
@@ -1448,10 +4194,49 @@ def add_student_loan(req: func.HttpRequest) -> func.HttpResponse:
         if 'conn' in locals():
             conn.close()
 
+students_near_completion_query = sql_statements.register('students.near_completion', """
+    SELECT 
+        s.StudentID,
+        s.FirstName,
+        s.LastName,
+        s.HomeAddress,
+        l.LoanAmount,
+        l.LoanBalance,
+        l.PercentagePaid,
+        si.ProgramOfStudy,
+        ei.CollegeName,
+        ei.City,
+        p.Province,
+        c.PhoneNumber,
+        c.Email,
+        c.Preference
+    FROM Student s
+    JOIN LoanInfo l ON s.LoanInfoID = l.LoanInfoID
+    JOIN StudyInfo si ON l.StudyInfoID = si.StudyInfoID
+    JOIN EducationInstitution ei ON l.EducationInstitutionID = ei.EducationInstitutionID
+    JOIN Province p ON ei.ProvinceID = p.ProvinceID
+    JOIN Communication c ON s.CommunicationID = c.CommunicationID
+    WHERE l.PaidRatio >= ?
+      AND l.LoanBalance <= l.LoanAmount * ?
+    ORDER BY l.LoanBalance ASC, s.LastName, s.FirstName
+""")
+
+# PaidRatio (migrations/V006) is rounded to 6 places, so the index seek starts one rounding step
+# below 1 - threshold and the exact LoanBalance test keeps the boundary where it always was
+paid_ratio_step = Decimal('0.000001')
+
+def near_completion_params(threshold):
+    remaining = Decimal(threshold) / 100
+    return 1 - remaining - paid_ratio_step, remaining
+
 @app.route(route="students/loan/near-completion/{threshold}", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('reports')
+@coalesce_requests
+@cache_response(cache_report_ttl, 'students', 'payments')
+@limit_concurrency('reports')
 def get_students_near_completion(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request.')
-
     threshold = req.route_params.get('threshold')
     if not threshold:
         return HttpResponse(
@@ -1483,40 +4268,39 @@ def get_students_near_completion(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json"
         )
 
+    try:
+        shape = parse_shape(req.params)
+    except ValueError as e:
+        return HttpResponse(
+            json.dumps({
+                'status': 'error',
+                'message': str(e)
+            }),
+            status_code=400,
+            mimetype="application/json"
+        )
+
     try:
         
-        conn = get_db_connection()
+        conn = get_report_db_connection()
         cursor = conn.cursor()
         
-        query = f"""
-            SELECT 
-                s.StudentID,
-                s.FirstName,
-                s.LastName,
-                s.HomeAddress,
-                l.LoanAmount,
-                l.LoanBalance,
-                l.PercentagePaid,
-                si.ProgramOfStudy,
-                ei.CollegeName,
-                ei.City,
-                p.Province,
-                c.PhoneNumber,
-                c.Email,
-                c.Preference
-            FROM Student s
-            JOIN LoanInfo l ON s.LoanInfoID = l.LoanInfoID
-            JOIN StudyInfo si ON l.StudyInfoID = si.StudyInfoID
-            JOIN EducationInstitution ei ON l.EducationInstitutionID = ei.EducationInstitutionID
-            JOIN Province p ON ei.ProvinceID = p.ProvinceID
-            JOIN Communication c ON s.CommunicationID = c.CommunicationID
-            WHERE l.LoanBalance <= l.LoanAmount * {round(threshold/100,2)}
-            ORDER BY l.LoanBalance ASC, s.LastName, s.FirstName
-        """
-        
-        cursor.execute(query)
+        cursor.execute(students_near_completion_query, *near_completion_params(threshold))
         
         columns = [column[0] for column in cursor.description]
+        if shape == 'columnar':
+            # Same conversions as the row shape, on the row tuples: LoanAmount and LoanBalance
+            # as floats plus a trailing PercentageRemaining column
+            amount_index, balance_index = columns.index('LoanAmount'), columns.index('LoanBalance')
+            rows = []
+            for row in cursor.fetchall():
+                row = list(row)
+                row[amount_index] = float(row[amount_index])
+                row[balance_index] = float(row[balance_index])
+                row.append(round(row[balance_index] / row[amount_index] * 100, 2))
+                rows.append(row)
+            return columnar_response(columns + ['PercentageRemaining'], rows)
+
         results = []
         
         for row in cursor.fetchall():
@@ -1538,6 +4322,9 @@ def get_students_near_completion(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json"
             )
 
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
+
     except Exception as e:
         return HttpResponse(
             json.dumps({
@@ -1554,53 +4341,140 @@ def get_students_near_completion(req: func.HttpRequest) -> func.HttpResponse:
         if 'conn' in locals():
             conn.close()
 
+financial_payment_stats_query = sql_statements.register('financial.payment_stats', """
+    SELECT 
+        fi.InstitutionName,
+        fi.Code as InstitutionCode,
+        YEAR(p.Paydate) as PaymentYear,
+        MONTH(p.Paydate) as MonthNumber,
+        COUNT(*) as NumberOfPayments,
+        SUM(p.Amount) as TotalAmount
+    FROM Payment p
+    JOIN FinancialInstitution fi ON p.FinancialInstitutionID = fi.FinancialInstitutionID
+    GROUP BY 
+        fi.InstitutionName,
+        fi.Code,
+        YEAR(p.Paydate),
+        MONTH(p.Paydate)
+    ORDER BY 
+        fi.InstitutionName,
+        PaymentYear DESC,
+        MonthNumber
+""")
+
+# The same report as one JSON document, nested institution (largest total first) -> year
+# (newest first) -> month in calendar order
+# Materialized once for the same reason as payments.monthly_by_province.json
+financial_payment_stats_json_query = sql_statements.register('financial.payment_stats.json', """
+    SET NOCOUNT ON;
+    IF OBJECT_ID('tempdb..#MonthlyByInstitution') IS NOT NULL DROP TABLE #MonthlyByInstitution;
+    CREATE TABLE #MonthlyByInstitution (
+        InstitutionName NVARCHAR(200) NOT NULL,
+        PaymentYear INT NOT NULL,
+        PaymentMonth INT NOT NULL,
+        NumberOfPayments INT NOT NULL,
+        TotalAmount DECIMAL(38, 2) NOT NULL,
+        PRIMARY KEY (InstitutionName, PaymentYear, PaymentMonth)
+    );
+
+    INSERT INTO #MonthlyByInstitution (InstitutionName, PaymentYear, PaymentMonth, NumberOfPayments, TotalAmount)
+    SELECT 
+        fi.InstitutionName,
+        YEAR(p.Paydate) as PaymentYear,
+        MONTH(p.Paydate) as PaymentMonth,
+        COUNT(*) as NumberOfPayments,
+        SUM(p.Amount) as TotalAmount
+    FROM Payment p
+    JOIN FinancialInstitution fi ON p.FinancialInstitutionID = fi.FinancialInstitutionID
+    GROUP BY fi.InstitutionName, YEAR(p.Paydate), MONTH(p.Paydate);
+
+    SELECT 
+        'success' as [status],
+        (SELECT COUNT(DISTINCT InstitutionName) FROM #MonthlyByInstitution) as [count],
+        JSON_QUERY(ISNULL((
+            SELECT 
+                i.InstitutionName as institutionName,
+                SUM(i.NumberOfPayments) as totalPayments,
+                SUM(i.TotalAmount) as totalAmount,
+                JSON_QUERY((
+                    SELECT 
+                        CAST(y.PaymentYear AS varchar(4)) as [year],
+                        SUM(y.NumberOfPayments) as numberOfPayments,
+                        SUM(y.TotalAmount) as totalAmount,
+                        JSON_QUERY((
+                            SELECT 
+                                CHOOSE(m.PaymentMonth, 'January', 'February', 'March', 'April', 'May', 'June', 'July', 'August',
+                                       'September', 'October', 'November', 'December') as [month],
+                                m.NumberOfPayments as numberOfPayments,
+                                m.TotalAmount as totalAmount
+                            FROM #MonthlyByInstitution m
+                            WHERE m.InstitutionName = i.InstitutionName AND m.PaymentYear = y.PaymentYear
+                            ORDER BY m.PaymentMonth
+                            FOR JSON PATH
+                        )) as monthlyStats
+                    FROM #MonthlyByInstitution y
+                    WHERE y.InstitutionName = i.InstitutionName
+                    GROUP BY y.PaymentYear
+                    ORDER BY y.PaymentYear DESC
+                    FOR JSON PATH
+                )) as yearlyStats
+            FROM #MonthlyByInstitution i
+            GROUP BY i.InstitutionName
+            ORDER BY SUM(i.TotalAmount) DESC, i.InstitutionName
+            FOR JSON PATH
+        ), '[]')) as [data]
+    FOR JSON PATH, WITHOUT_ARRAY_WRAPPER;
+
+    DROP TABLE #MonthlyByInstitution;
+""")
+
 @app.route(route="financial/payment/stats", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('reports')
+@coalesce_requests
+@cache_response(cache_report_ttl, 'payments')
+@limit_concurrency('reports')
 def get_banks_payments_stats(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request.')
+    try:
+        mode = parse_report_mode(req.params)
+    except ValueError as e:
+        return HttpResponse(
+            json.dumps({
+                'status': 'error',
+                'message': str(e)
+            }),
+            status_code=400,
+            mimetype="application/json"
+        )
 
     try:
-        conn = get_db_connection()
+        conn = get_report_db_connection()
         cursor = conn.cursor()
         
-        query = """
-            SELECT 
-                fi.InstitutionName,
-                fi.Code as InstitutionCode,
-                YEAR(p.Paydate) as PaymentYear,
-                FORMAT(p.Paydate, 'MMMM') as PaymentMonth,
-                MONTH(p.Paydate) as MonthNumber,
-                COUNT(*) as NumberOfPayments,
-                SUM(p.Amount) as TotalAmount
-            FROM Payment p
-            JOIN FinancialInstitution fi ON p.FinancialInstitutionID = fi.FinancialInstitutionID
-            GROUP BY 
-                fi.InstitutionName,
-                fi.Code,
-                YEAR(p.Paydate),
-                FORMAT(p.Paydate, 'MMMM'),
-                MONTH(p.Paydate)
-            ORDER BY 
-                fi.InstitutionName,
-                PaymentYear DESC,
-                MonthNumber DESC
-        """
-        
-        cursor.execute(query)
+        if mode == 'server':
+            cursor.execute(financial_payment_stats_json_query)
+            return HttpResponse(
+                read_for_json(cursor),
+                status_code=200,
+                mimetype="application/json"
+            )
+
+        cursor.execute(financial_payment_stats_query)
         
         # Organize data hierarchically
         institutions = defaultdict(lambda: defaultdict(dict))
-        institution_totals = defaultdict(lambda: {'totalAmount': 0, 'totalPayments': 0})
+        institution_totals = defaultdict(lambda: {'totalAmount': Decimal(0), 'totalPayments': 0})
         
-        for row in cursor.fetchall():
-            inst_name = row[0]
-            year = str(row[2])
-            month = row[3]
+        # Rows arrive by institution, year newest first, then month in calendar order
+        for inst_name, _, year, month, number_of_payments, total_amount in iter_rows(cursor):
+            year = str(year)
             
             # Create monthly stats
             monthly_stats = {
-                'month': month,
-                'numberOfPayments': row[5],
-                'totalAmount': float(row[6])
+                'month': month_names[month - 1],
+                'numberOfPayments': number_of_payments,
+                'totalAmount': float(total_amount)
             }
             
             # Update year data if not exists
@@ -1608,18 +4482,18 @@ def get_banks_payments_stats(req: func.HttpRequest) -> func.HttpResponse:
                 institutions[inst_name][year] = {
                     'year': year,
                     'numberOfPayments': 0,
-                    'totalAmount': 0,
+                    'totalAmount': Decimal(0),
                     'monthlyStats': []
                 }
             
             # Update year totals
             yearly_data = institutions[inst_name][year]
             yearly_data['numberOfPayments'] += monthly_stats['numberOfPayments']
-            yearly_data['totalAmount'] += monthly_stats['totalAmount']
+            yearly_data['totalAmount'] += total_amount
             yearly_data['monthlyStats'].append(monthly_stats)
             
             # Update institution totals
-            institution_totals[inst_name]['totalAmount'] += monthly_stats['totalAmount']
+            institution_totals[inst_name]['totalAmount'] += total_amount
             institution_totals[inst_name]['totalPayments'] += monthly_stats['numberOfPayments']
             
         # Format final response
@@ -1628,19 +4502,19 @@ def get_banks_payments_stats(req: func.HttpRequest) -> func.HttpResponse:
             institution_data = {
                 'institutionName': inst_name,
                 'totalPayments': institution_totals[inst_name]['totalPayments'],
-                'totalAmount': round(institution_totals[inst_name]['totalAmount'], 2),
+                'totalAmount': float(institution_totals[inst_name]['totalAmount']),
                 'yearlyStats': []
             }
             
             # Add yearly stats
             for year_data in years.values():
-                year_data['totalAmount'] = round(year_data['totalAmount'], 2)
+                year_data['totalAmount'] = float(year_data['totalAmount'])
                 institution_data['yearlyStats'].append(year_data)
             
             results.append(institution_data)
         
-        # Sort results by total amount descending
-        results.sort(key=lambda x: x['totalAmount'], reverse=True)
+        # Sort results by total amount descending, ties in name order as in server mode
+        results.sort(key=lambda x: (-x['totalAmount'], x['institutionName']))
 
         return HttpResponse(
             json.dumps({
@@ -1652,6 +4526,9 @@ def get_banks_payments_stats(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json"
         )
 
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
+
     except Exception as e:
         return HttpResponse(
             json.dumps({
@@ -1665,4 +4542,560 @@ def get_banks_payments_stats(req: func.HttpRequest) -> func.HttpResponse:
         if 'cursor' in locals():
             cursor.close()
         if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+            conn.close()
+
+# Portfolio distribution settings
+balance_bucket_edges = [
+    float(edge) for edge in os.getenv(
+        'PORTFOLIO_BALANCE_BUCKETS', '0,5000,10000,20000,30000,50000,75000,100000'
+    ).split(',')
+]
+percent_paid_bucket_edges = list(range(0, 100, 10))
+distribution_percentiles = [10, 25, 50, 75, 90, 99]
+distribution_relative_accuracy = float(os.getenv('PORTFOLIO_PERCENTILE_ACCURACY', '0.001'))
+portfolio_snapshot_ttl = int(os.getenv('PORTFOLIO_SNAPSHOT_TTL_SECONDS', '300'))
+portfolio_snapshot = {'generatedAt': None, 'expiresAt': 0, 'data': None}
+portfolio_snapshot_lock = threading.Lock()
+portfolio_refreshes = SingleFlight()
+
+class QuantileSketch:
+    """
+    Streaming percentiles in bounded memory: values are counted in logarithmic buckets, so each
+    percentile is within relative_accuracy of the exact nearest-rank value whatever the number
+    of loans. Values of 0 or less are counted together as 0.
+    """
+
+    def __init__(self, relative_accuracy):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.counts = defaultdict(int)
+        self.zero_count = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if value <= 0:
+            self.zero_count += 1
+        else:
+            self.counts[math.ceil(math.log(value) / self.log_gamma)] += 1
+
+    def percentile(self, pct):
+        # Nearest rank, answered with the midpoint of the bucket holding it
+        if not self.count:
+            return None
+        rank = max(int(math.ceil(pct / 100 * self.count)) - 1, 0)
+        seen = self.zero_count
+        if rank < seen:
+            return round(max(self.min, 0.0), 2)
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen > rank:
+                estimate = 2 * self.gamma ** index / (self.gamma + 1)
+                return round(min(max(estimate, self.min), self.max), 2)
+
+def new_distribution():
+    return {
+        'loanCount': 0,
+        'totalLoanAmount': 0.0,
+        'totalBalance': 0.0,
+        'balanceCounts': [0] * len(balance_bucket_edges),
+        'percentPaidCounts': [0] * len(percent_paid_bucket_edges),
+        'balances': QuantileSketch(distribution_relative_accuracy),
+        'percentsPaid': QuantileSketch(distribution_relative_accuracy)
+    }
+
+def add_to_distribution(distribution, loan_amount, loan_balance, percent_paid):
+    distribution['loanCount'] += 1
+    distribution['totalLoanAmount'] += loan_amount
+    distribution['totalBalance'] += loan_balance
+    distribution['balanceCounts'][max(bisect.bisect_right(balance_bucket_edges, loan_balance) - 1, 0)] += 1
+    distribution['balances'].add(loan_balance)
+    if percent_paid is not None:
+        distribution['percentPaidCounts'][max(bisect.bisect_right(percent_paid_bucket_edges, percent_paid) - 1, 0)] += 1
+        distribution['percentsPaid'].add(percent_paid)
+
+def histogram(edges, counts, upper_bound=None):
+    buckets = []
+    for i, count in enumerate(counts):
+        buckets.append({
+            'min': edges[i],
+            'max': edges[i + 1] if i + 1 < len(edges) else upper_bound,
+            'count': count
+        })
+    return buckets
+
+def summarize_distribution(distribution):
+    return {
+        'loanCount': distribution['loanCount'],
+        'totalLoanAmount': round(distribution['totalLoanAmount'], 2),
+        'totalBalance': round(distribution['totalBalance'], 2),
+        'loanBalance': {
+            'histogram': histogram(balance_bucket_edges, distribution['balanceCounts']),
+            'percentiles': {f'p{pct}': distribution['balances'].percentile(pct) for pct in distribution_percentiles}
+        },
+        'percentPaid': {
+            'histogram': histogram(percent_paid_bucket_edges, distribution['percentPaidCounts'], 100),
+            'percentiles': {f'p{pct}': distribution['percentsPaid'].percentile(pct) for pct in distribution_percentiles}
+        }
+    }
+
+portfolio_loans_query = sql_statements.register('portfolio.loans', """
+    SELECT 
+        p.Province,
+        ei.CollegeName,
+        l.EnrollmentType,
+        l.LoanAmount,
+        l.LoanBalance
+    FROM LoanInfo l
+    LEFT JOIN EducationInstitution ei ON l.EducationInstitutionID = ei.EducationInstitutionID
+    LEFT JOIN Province p ON ei.ProvinceID = p.ProvinceID
+""")
+
+def build_portfolio_distribution(cursor):
+    # Single scan over the loans; every grouping is accumulated from the same rows
+    cursor.execute(portfolio_loans_query)
+
+    overall = new_distribution()
+    by_province = defaultdict(new_distribution)
+    by_institution = defaultdict(new_distribution)
+    by_enrollment_type = defaultdict(new_distribution)
+
+    for province, college_name, enrollment_type, loan_amount, loan_balance in iter_rows(cursor):
+        loan_amount = float(loan_amount or 0)
+        loan_balance = float(loan_balance or 0)
+        # Loans without an amount yet have no meaningful percent paid
+        percent_paid = None
+        if loan_amount > 0:
+            percent_paid = min(max((loan_amount - loan_balance) / loan_amount * 100, 0), 100)
+
+        for distribution in (overall,
+                             by_province[province or 'Unknown'],
+                             by_institution[college_name or 'Unknown'],
+                             by_enrollment_type[enrollment_type or 'Unknown']):
+            add_to_distribution(distribution, loan_amount, loan_balance, percent_paid)
+
+    return {
+        'overall': summarize_distribution(overall),
+        'byProvince': {key: summarize_distribution(value) for key, value in sorted(by_province.items())},
+        'byInstitution': {key: summarize_distribution(value) for key, value in sorted(by_institution.items())},
+        'byEnrollmentType': {key: summarize_distribution(value) for key, value in sorted(by_enrollment_type.items())}
+    }
+
+def load_shared_portfolio_snapshot(key):
+    try:
+        stored = response_cache.get(key)
+    except Exception as e:
+        logging.warning('Cache lookup failed: %s', e)
+        return None
+    snapshot = json.loads(stored) if stored is not None else None
+    return snapshot if snapshot is not None and time.time() < snapshot['expiresAt'] else None
+
+def scan_portfolio_snapshot(force):
+    # With a shared cache, instances reuse the snapshot another instance scanned until it expires
+    key = response_cache.key('portfolio.snapshot', [], ()) if response_cache.active_backend() else None
+    snapshot = load_shared_portfolio_snapshot(key) if key and not force else None
+    if snapshot is None:
+        conn = get_report_db_connection()
+        try:
+            cursor = conn.cursor()
+            data = build_portfolio_distribution(cursor)
+            cursor.close()
+        finally:
+            conn.close()
+        snapshot = {
+            'data': data,
+            'generatedAt': datetime.now(timezone.utc).isoformat(),
+            'expiresAt': time.time() + portfolio_snapshot_ttl
+        }
+        if key:
+            try:
+                response_cache.set(key, json.dumps(snapshot), portfolio_snapshot_ttl)
+            except Exception as e:
+                logging.warning('Cache store failed: %s', e)
+
+    with portfolio_snapshot_lock:
+        portfolio_snapshot.update(snapshot)
+    return snapshot['data'], snapshot['generatedAt']
+
+def refresh_portfolio_snapshot(force=False):
+    # Returns (data, generatedAt). The lock only guards the snapshot itself; concurrent callers
+    # of an expired snapshot share one scan through portfolio_refreshes instead of the lock
+    with portfolio_snapshot_lock:
+        if not force and portfolio_snapshot['data'] is not None and time.time() < portfolio_snapshot['expiresAt']:
+            return portfolio_snapshot['data'], portfolio_snapshot['generatedAt']
+    return portfolio_refreshes.do(('portfolio', force), lambda: scan_portfolio_snapshot(force))
+
+@app.route(route="portfolio/distribution", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+@rate_limit('reports')
+@coalesce_requests
+@limit_concurrency('reports')
+def get_portfolio_distribution(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Histograms and percentiles of LoanBalance and percent paid for the whole portfolio,
+    broken down by province, institution and enrollment type. Served from a cached
+    snapshot; pass refresh=true to force a new scan.
+    """
+    refresh = req.params.get('refresh', '').lower() in ('true', '1', 'yes')
+
+    try:
+        data, generated_at = refresh_portfolio_snapshot(force=refresh)
+
+        return HttpResponse(
+            json.dumps({
+                'status': 'success',
+                'generatedAt': generated_at,
+                'data': data
+            }),
+            status_code=200,
+            mimetype="application/json"
+        )
+
+    except DatabaseUnavailableError as e:
+        return db_unavailable_response(e)
+
+    except Exception as e:
+        return HttpResponse(
+            json.dumps({
+                'status': 'error',
+                'message': str(e)
+            }),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+# Loan balance reconciliation: LoanBalance must equal LoanAmount minus the loan's payments.
+# Loans are checked in LoanInfoID key ranges with set-based statements, several ranges in
+# parallel, and each range is checkpointed (migrations/V005) so a long run resumes where it stopped
+reconcile_chunk_size = int(os.getenv('RECONCILE_CHUNK_SIZE', '10000'))
+reconcile_workers = int(os.getenv('RECONCILE_WORKERS', '4'))
+reconcile_repair = os.getenv('RECONCILE_REPAIR', 'false').lower() == 'true'
+reconcile_max_seconds = float(os.getenv('RECONCILE_MAX_SECONDS', '540'))
+reconcile_sample_size = 100
+
+reconcile_key_range_query = sql_statements.register('reconcile.key_range', "SELECT MIN(LoanInfoID), MAX(LoanInfoID) FROM LoanInfo")
+
+reconcile_open_run_query = sql_statements.register('reconcile.open_run', """
+    SELECT TOP 1 RunID, ChunkSize, MinLoanID, MaxLoanID
+    FROM ReconciliationRun
+    WHERE CompletedAt IS NULL AND Repair = ?
+    ORDER BY RunID DESC
+""")
+
+reconcile_start_run_query = sql_statements.register('reconcile.start_run', """
+    INSERT INTO ReconciliationRun (Repair, ChunkSize, MinLoanID, MaxLoanID, StartedAt)
+    OUTPUT inserted.RunID
+    VALUES (?, ?, ?, ?, SYSUTCDATETIME())
+""")
+
+reconcile_done_chunks_query = sql_statements.register('reconcile.done_chunks', "SELECT ChunkStart FROM ReconciliationChunk WHERE RunID = ?")
+
+# Range seeks on the LoanInfo primary key and IX_Payment_LoanInfoID_Paydate (which includes Amount)
+reconcile_check_chunk_query = sql_statements.register('reconcile.check_chunk', """
+    SELECT COUNT(*) FROM LoanInfo WHERE LoanInfoID >= ? AND LoanInfoID < ?;
+
+    SELECT l.LoanInfoID, l.LoanAmount, l.LoanBalance, l.LoanAmount - ISNULL(p.Paid, 0) AS ExpectedBalance
+    FROM LoanInfo l
+    LEFT JOIN (
+        SELECT LoanInfoID, SUM(Amount) AS Paid
+        FROM Payment
+        WHERE LoanInfoID >= ? AND LoanInfoID < ?
+        GROUP BY LoanInfoID
+    ) p ON p.LoanInfoID = l.LoanInfoID
+    WHERE l.LoanInfoID >= ? AND l.LoanInfoID < ?
+      AND l.LoanBalance <> l.LoanAmount - ISNULL(p.Paid, 0)
+    ORDER BY l.LoanInfoID;
+""")
+
+reconcile_lock_loans_query = sql_statements.register('reconcile.lock_loans', """
+    SELECT LoanInfoID
+    FROM LoanInfo WITH (UPDLOCK, ROWLOCK)
+    WHERE LoanInfoID IN (SELECT CAST(value AS int) FROM OPENJSON(?))
+""")
+
+reconcile_repair_query = sql_statements.register('reconcile.repair', """
+    UPDATE l
+    SET LoanBalance = l.LoanAmount - ISNULL(p.Paid, 0),
+        PercentagePaid = CASE WHEN l.LoanAmount = 0 THEN '0%'
+                              ELSE CONCAT(CAST(ISNULL(p.Paid, 0) * 100 / l.LoanAmount AS INT), '%') END,
+        PayoffDate = CASE WHEN l.LoanAmount - ISNULL(p.Paid, 0) = 0 THEN COALESCE(l.PayoffDate, p.LastPaydate) END
+    OUTPUT inserted.LoanInfoID
+    FROM LoanInfo l
+    OUTER APPLY (
+        SELECT SUM(Amount) AS Paid, MAX(Paydate) AS LastPaydate
+        FROM Payment
+        WHERE LoanInfoID = l.LoanInfoID
+    ) p
+    WHERE l.LoanInfoID IN (SELECT CAST(value AS int) FROM OPENJSON(?))
+      AND l.LoanBalance <> l.LoanAmount - ISNULL(p.Paid, 0)
+""")
+
+reconcile_record_mismatch_query = sql_statements.register('reconcile.record_mismatch', """
+    INSERT INTO ReconciliationMismatch (RunID, LoanInfoID, LoanAmount, LoanBalance, ExpectedBalance, Repaired, FoundAt)
+    VALUES (?, ?, ?, ?, ?, ?, SYSUTCDATETIME())
+""")
+
+reconcile_checkpoint_query = sql_statements.register('reconcile.checkpoint', """
+    INSERT INTO ReconciliationChunk (RunID, ChunkStart, ChunkEnd, Loans, Mismatches, Repaired, CompletedAt)
+    VALUES (?, ?, ?, ?, ?, ?, SYSUTCDATETIME())
+""")
+
+reconcile_complete_run_query = sql_statements.register('reconcile.complete_run', """
+    UPDATE r
+    SET CompletedAt = SYSUTCDATETIME(),
+        Loans = c.Loans,
+        Mismatches = c.Mismatches,
+        Repaired = c.Repaired
+    FROM ReconciliationRun r
+    CROSS APPLY (
+        SELECT SUM(Loans) AS Loans, SUM(Mismatches) AS Mismatches, SUM(Repaired) AS Repaired
+        FROM ReconciliationChunk
+        WHERE RunID = r.RunID
+    ) c
+    WHERE r.RunID = ?
+""")
+
+def start_or_resume_reconciliation(repair, chunk_size):
+    # Returns (run_id, chunk_size, chunks still to check), or None when there are no loans
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    conn.autocommit = False
+    try:
+        run = cursor.execute(reconcile_open_run_query, repair).fetchone()
+        if run is None:
+            min_loan_id, max_loan_id = cursor.execute(reconcile_key_range_query).fetchone()
+            if min_loan_id is None:
+                return None
+            run_id = cursor.execute(reconcile_start_run_query, repair, chunk_size, min_loan_id, max_loan_id).fetchone()[0]
+            done = set()
+        else:
+            # Resume with the run's own chunking and key range; loans added since go to the next run
+            run_id, chunk_size, min_loan_id, max_loan_id = run
+            done = {row[0] for row in cursor.execute(reconcile_done_chunks_query, run_id).fetchall()}
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        cursor.close()
+        conn.close()
+
+    chunks = [(start, start + chunk_size) for start in range(min_loan_id, max_loan_id + 1, chunk_size) if start not in done]
+    return run_id, chunk_size, chunks
+
+def reconcile_chunk(run_id, chunk_start, chunk_end, repair):
+    """
+    Check the loans with chunk_start <= LoanInfoID < chunk_end, then record the chunk, its
+    mismatches and (with repair) the corrected balances in one short transaction.
+    """
+    # The check reads a snapshot from the reporting pool, so it takes no locks on LoanInfo or Payment
+    conn = report_db_pool.acquire(read_only=True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(reconcile_check_chunk_query, chunk_start, chunk_end, chunk_start, chunk_end, chunk_start, chunk_end)
+        loans = cursor.fetchone()[0]
+        cursor.nextset()
+        mismatches = [tuple(row) for row in cursor.fetchall()]
+        cursor.close()
+    finally:
+        conn.close()
+
+    repaired = set()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    conn.autocommit = False
+    try:
+        if repair and mismatches:
+            # Lock only the mismatched loans, then recompute them from their current payments, so a
+            # payment made since the check is included rather than overwritten
+            loan_ids = json.dumps([row[0] for row in mismatches])
+            cursor.execute(reconcile_lock_loans_query, loan_ids).fetchall()
+            repaired = {row[0] for row in cursor.execute(reconcile_repair_query, loan_ids).fetchall()}
+        if mismatches:
+            cursor.executemany(reconcile_record_mismatch_query, [
+                (run_id, loan_id, loan_amount, loan_balance, expected_balance, loan_id in repaired)
+                for loan_id, loan_amount, loan_balance, expected_balance in mismatches
+            ])
+        cursor.execute(reconcile_checkpoint_query, run_id, chunk_start, chunk_end, loans, len(mismatches), len(repaired))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        cursor.close()
+        conn.close()
+
+    if repaired:
+        invalidate_cached('payments', *sorted(f'loan:{loan_id}' for loan_id in repaired))
+    return loans, mismatches, repaired
+
+def run_reconciliation(repair=None, chunk_size=None, workers=None, max_seconds=None):
+    """
+    Check (and with repair, fix) LoanBalance of every loan against LoanAmount minus its
+    payments. Resumes the latest unfinished run with the same repair setting; stops starting
+    chunks once max_seconds are spent, leaving the rest for the next call.
+    """
+    repair = reconcile_repair if repair is None else repair
+    deadline = time.monotonic() + (reconcile_max_seconds if max_seconds is None else max_seconds)
+    started = time.perf_counter()
+
+    run = start_or_resume_reconciliation(repair, chunk_size or reconcile_chunk_size)
+    if run is None:
+        return {'runId': None, 'completed': True, 'message': 'No loans to reconcile'}
+    run_id, chunk_size, chunks = run
+
+    summary = {'runId': run_id, 'repair': repair, 'chunkSize': chunk_size, 'chunksChecked': 0,
+               'loansChecked': 0, 'mismatches': 0, 'repaired': 0, 'failedChunks': 0, 'sampleMismatches': []}
+
+    def check(chunk):
+        if time.monotonic() >= deadline:
+            return None
+        return reconcile_chunk(run_id, chunk[0], chunk[1], repair)
+
+    # Each worker holds a reporting pool connection while it checks, so more would only wait for one
+    workers = min(workers or reconcile_workers, report_db_pool.max_size)
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = [executor.submit(check, chunk) for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # Not checkpointed, so the next call retries it
+                logging.error('Reconciliation of loans %s-%s failed: %s', chunk[0], chunk[1] - 1, e)
+                summary['failedChunks'] += 1
+                continue
+            if result is None:
+                continue
+            loans, mismatches, repaired = result
+            summary['chunksChecked'] += 1
+            summary['loansChecked'] += loans
+            summary['mismatches'] += len(mismatches)
+            summary['repaired'] += len(repaired)
+            for loan_id, loan_amount, loan_balance, expected_balance in mismatches:
+                if len(summary['sampleMismatches']) < reconcile_sample_size:
+                    summary['sampleMismatches'].append({
+                        'loanId': loan_id,
+                        'loanAmount': loan_amount,
+                        'loanBalance': loan_balance,
+                        'expectedBalance': expected_balance,
+                        'repaired': loan_id in repaired
+                    })
+
+    summary['remainingChunks'] = len(chunks) - summary['chunksChecked']
+    summary['completed'] = summary['remainingChunks'] == 0
+    if summary['completed']:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(reconcile_complete_run_query, run_id)
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+    summary['durationMs'] = round((time.perf_counter() - started) * 1000, 1)
+    return summary
+
+@app.timer_trigger(schedule=os.getenv('RECONCILE_SCHEDULE', '0 0 3 * * *'), arg_name="timer",
+                   run_on_startup=False, use_monitor=False)
+def reconcile_balances(timer: func.TimerRequest) -> None:
+    """
+    Runs the loan balance reconciliation on RECONCILE_SCHEDULE (03:00 UTC daily by default),
+    repairing mismatches when RECONCILE_REPAIR is true.
+    """
+    try:
+        summary = run_reconciliation()
+        if summary.get('mismatches'):
+            logging.warning('Loan balance reconciliation found mismatches: %s', json.dumps(summary, default=decimal_default))
+        else:
+            logging.info('Loan balance reconciliation: %s', json.dumps(summary, default=decimal_default))
+    except Exception as e:
+        logging.error('Loan balance reconciliation failed: %s', e)
+
+# Outcome of the most recent warm-up run on this instance
+warmup_status = {'lastRunAt': None, 'durationMs': None, 'outcome': None, 'steps': {}}
+
+def warm_query_plans():
+    # Run the hot statements with parameters that match nothing, so SQL Server compiles and
+    # caches their plans without doing the work of a real request. Every other parameter is the
+    # route's default, since the cached plan is built for the sniffed values: loan payments
+    # without limit read with TOP (payment_history_max_rows), not a TOP (1) row goal. The
+    # lastname pattern has no leading wildcard, so it seeks an empty range of
+    # IX_Student_LastName_FirstName instead of scanning it. The per-loan yearly aggregate is the
+    # only aggregate warmed: the monthly and per-institution reports (payments.monthly_by_province,
+    # financial.payment_stats) take no parameters, so their plan is cached only by running the
+    # full report over every payment, and a narrower variant would be a different statement
+    # with its own plan. Their responses are served from the response cache instead.
+    conn = get_read_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(students_by_lastname_query, '~warmup~%').fetchall()
+        cursor.execute(loan_payments_query, -1, payment_history_max_rows, -1, payment_history_min_date, payment_history_max_date).fetchall()
+        cursor.execute(loan_yearly_stats_query, -1, -1).fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+
+def run_warmup():
+    started = time.perf_counter()
+    steps = {}
+    warmup_steps = [
+        ('connections', lambda: db_pool.prime(db_pool.min_size)),
+        ('readReplicaConnections', lambda: read_db_pool.prime(read_db_pool.min_size) if read_db_pool else 0),
+        ('queryPlans', warm_query_plans),
+        # Reuses a snapshot that has not expired, from this instance or the shared cache, so only
+        # an instance with no snapshot pays for the scan
+        ('portfolioSnapshot', lambda: refresh_portfolio_snapshot()[1])
+    ]
+
+    for name, action in warmup_steps:
+        step_started = time.perf_counter()
+        try:
+            result = action()
+            steps[name] = {'outcome': 'success'}
+            if result is not None:
+                steps[name]['result'] = result
+        except Exception as e:
+            steps[name] = {'outcome': 'error', 'message': str(e)}
+        steps[name]['durationMs'] = round((time.perf_counter() - step_started) * 1000, 1)
+
+    warmup_status['lastRunAt'] = datetime.now(timezone.utc).isoformat()
+    warmup_status['durationMs'] = round((time.perf_counter() - started) * 1000, 1)
+    warmup_status['outcome'] = 'success' if all(step['outcome'] == 'success' for step in steps.values()) else 'error'
+    warmup_status['steps'] = steps
+    return warmup_status
+
+@app.timer_trigger(schedule=os.getenv('WARMUP_SCHEDULE', '0 */5 * * * *'), arg_name="timer",
+                   run_on_startup=True, use_monitor=False)
+def warmup(timer: func.TimerRequest) -> None:
+    """
+    Primes the connection pool, query plans and in-process caches after a scale-out or idle period.
+    Runs on host start and then on WARMUP_SCHEDULE (every 5 minutes by default).
+    """
+    status = run_warmup()
+    if status['outcome'] == 'success':
+        logging.info('Warm-up completed: %s', json.dumps(status))
+    else:
+        logging.warning('Warm-up completed with errors: %s', json.dumps(status))
+
+@app.route(route="diagnostics/statements", auth_level=func.AuthLevel.ANONYMOUS)
+@log_request
+@profile_request
+def get_statement_stats(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Execution count, error count and execute time per catalog statement since this instance started.
+    """
+    stats = sql_statements.snapshot()
+    return HttpResponse(
+        json.dumps({
+            'status': 'success',
+            'count': len(stats),
+            'data': stats
+        }),
+        status_code=200,
+        mimetype="application/json"
+    )
@@ -0,0 +1,43 @@
+"""
+Check every loan's LoanBalance against LoanAmount minus the sum of its payments, in
+LoanInfoID key-range chunks checked in parallel, and optionally repair the mismatches.
+
+    python maintenance/reconcile_balances.py                      # report only
+    python maintenance/reconcile_balances.py --repair             # report and repair
+    python maintenance/reconcile_balances.py --chunk-size 50000 --workers 8 --max-seconds 3600
+
+Uses the same DB_* settings (or .env) as function_app and needs migration V005. Every checked
+chunk is checkpointed, so running the command again resumes an unfinished run with the same
+--repair setting. Mismatches are stored in dbo.ReconciliationMismatch; the first ones are also
+printed. The check reads under snapshot isolation and a repair locks only the loans it fixes.
+"""
+import argparse
+import json
+import os
+import sys
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if repo_root not in sys.path:
+    sys.path.insert(0, repo_root)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repair', action='store_true', help='Correct LoanBalance, PercentagePaid and PayoffDate of mismatched loans')
+    parser.add_argument('--chunk-size', type=int, help='LoanInfoIDs per chunk (default RECONCILE_CHUNK_SIZE) for a new run')
+    parser.add_argument('--workers', type=int, help='Chunks checked in parallel (default RECONCILE_WORKERS)')
+    parser.add_argument('--max-seconds', type=float, default=float('inf'), help='Stop starting chunks after this long')
+    args = parser.parse_args()
+
+    if args.workers:
+        # The checks run on the reporting pool, which must allow one connection per worker
+        os.environ.setdefault('DB_REPORT_POOL_MAX_SIZE', str(args.workers))
+    import function_app
+
+    summary = function_app.run_reconciliation(repair=args.repair, chunk_size=args.chunk_size,
+                                              workers=args.workers, max_seconds=args.max_seconds)
+    print(json.dumps(summary, indent=2, default=function_app.decimal_default))
+    if summary.get('failedChunks'):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+-- Base schema used by function_app.py. Tables are only created when missing, so this version
+-- can be applied to (and baselines) a database that was created before migrations existed.
+
+IF OBJECT_ID('dbo.Province', 'U') IS NULL
+CREATE TABLE dbo.Province (
+    ProvinceID INT IDENTITY(1, 1) NOT NULL PRIMARY KEY,
+    Province NVARCHAR(50) NOT NULL
+);
+
+IF OBJECT_ID('dbo.EducationInstitution', 'U') IS NULL
+CREATE TABLE dbo.EducationInstitution (
+    EducationInstitutionID INT IDENTITY(1, 1) NOT NULL PRIMARY KEY,
+    CollegeName NVARCHAR(200) NOT NULL,
+    City NVARCHAR(100) NULL,
+    ProvinceID INT NOT NULL REFERENCES dbo.Province (ProvinceID)
+);
+
+IF OBJECT_ID('dbo.StudyInfo', 'U') IS NULL
+CREATE TABLE dbo.StudyInfo (
+    StudyInfoID INT IDENTITY(1, 1) NOT NULL PRIMARY KEY,
+    ProgramOfStudy NVARCHAR(200) NOT NULL,
+    ProgramCode NVARCHAR(20) NULL
+);
+
+IF OBJECT_ID('dbo.LoanInfo', 'U') IS NULL
+CREATE TABLE dbo.LoanInfo (
+    LoanInfoID INT IDENTITY(1, 1) NOT NULL PRIMARY KEY,
+    StudyInfoID INT NULL REFERENCES dbo.StudyInfo (StudyInfoID),
+    EducationInstitutionID INT NULL REFERENCES dbo.EducationInstitution (EducationInstitutionID),
+    EnrollmentType NVARCHAR(20) NOT NULL,
+    LoanAmount DECIMAL(18, 2) NOT NULL,
+    DisbursementDate DATE NOT NULL,
+    LoanBalance DECIMAL(18, 2) NOT NULL,
+    PercentagePaid NVARCHAR(10) NOT NULL,
+    PayoffDate DATE NULL
+);
+
+IF OBJECT_ID('dbo.Communication', 'U') IS NULL
+CREATE TABLE dbo.Communication (
+    CommunicationID INT IDENTITY(1, 1) NOT NULL PRIMARY KEY,
+    PhoneNumber NVARCHAR(30) NULL,
+    Email NVARCHAR(200) NULL,
+    Preference NVARCHAR(10) NULL
+);
+
+IF OBJECT_ID('dbo.Student', 'U') IS NULL
+CREATE TABLE dbo.Student (
+    StudentID INT IDENTITY(1, 1) NOT NULL PRIMARY KEY,
+    FirstName NVARCHAR(100) NOT NULL,
+    LastName NVARCHAR(100) NOT NULL,
+    HomeAddress NVARCHAR(300) NULL,
+    CommunicationID INT NOT NULL REFERENCES dbo.Communication (CommunicationID),
+    LoanInfoID INT NULL REFERENCES dbo.LoanInfo (LoanInfoID)
+);
+
+IF OBJECT_ID('dbo.FinancialInstitution', 'U') IS NULL
+CREATE TABLE dbo.FinancialInstitution (
+    FinancialInstitutionID INT IDENTITY(1, 1) NOT NULL PRIMARY KEY,
+    InstitutionName NVARCHAR(200) NOT NULL,
+    Code NVARCHAR(20) NOT NULL,
+    Type NVARCHAR(50) NULL
+);
+
+IF OBJECT_ID('dbo.Payment', 'U') IS NULL
+CREATE TABLE dbo.Payment (
+    PaymentID INT IDENTITY(1, 1) NOT NULL PRIMARY KEY,
+    LoanInfoID INT NOT NULL REFERENCES dbo.LoanInfo (LoanInfoID),
+    Amount DECIMAL(18, 2) NOT NULL,
+    Paydate DATE NOT NULL,
+    FinancialInstitutionID INT NOT NULL REFERENCES dbo.FinancialInstitution (FinancialInstitutionID)
+);
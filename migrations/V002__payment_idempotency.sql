@@ -0,0 +1,11 @@
+-- Stored responses for Idempotency-Key on loans/make-payment and for queued payments
+-- (keyed 'queue:<request id>'), written in the same transaction as the payment.
+
+IF OBJECT_ID('dbo.PaymentIdempotency', 'U') IS NULL
+CREATE TABLE dbo.PaymentIdempotency (
+    IdempotencyKey NVARCHAR(100) NOT NULL PRIMARY KEY,
+    RequestHash CHAR(64) NOT NULL,
+    StatusCode INT NULL,
+    ResponseBody NVARCHAR(MAX) NULL,
+    CreatedAt DATETIME2 NOT NULL
+);
@@ -0,0 +1,38 @@
+-- Indexes for the API's access paths. Each one names the routes it serves and the benchmark
+-- that shows its effect: run the benchmark before and after applying this version, e.g.
+--   python benchmarks/route_latency.py --function get_loan_payments --route loans/101/payments --route-params '{"loanid": "101"}'
+
+-- Payment history by loan in date order: a seek plus an ordered range read with no sort and no
+-- lookups for loans/{loanid}/payments (with from/to/limit), loans/payments, the yearly stats
+-- routes (GROUP BY LoanInfoID, YEAR(Paydate)) and the payment queue's balance updates.
+--   route_latency.py --function get_loan_payments --route loans/101/payments --route-params '{"loanid": "101"}'
+--   route_latency.py --function get_loan_payments_yearly_stats --route stats/yearly/loan/101/payments --route-params '{"loanid": "101"}'
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Payment_LoanInfoID_Paydate' AND object_id = OBJECT_ID('dbo.Payment'))
+CREATE NONCLUSTERED INDEX IX_Payment_LoanInfoID_Paydate
+    ON dbo.Payment (LoanInfoID, Paydate)
+    INCLUDE (Amount, FinancialInstitutionID);
+
+-- Student search and listing by name. students/lastname/{lastname} matches LIKE '%name%', which
+-- cannot seek, but scans this narrow index instead of the whole Student table; the
+-- incomplete-registration report reads it in ORDER BY LastName, FirstName order without a sort.
+--   route_latency.py --function get_students_by_lastname --route students/lastname/smi --route-params '{"lastname": "smi"}'
+--   route_latency.py --function get_students_incomplete_registration --route students/incomplete-registration
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Student_LastName_FirstName' AND object_id = OBJECT_ID('dbo.Student'))
+CREATE NONCLUSTERED INDEX IX_Student_LastName_FirstName
+    ON dbo.Student (LastName, FirstName);
+
+-- Loan to student joins (every loan-centric read joins Student ON LoanInfoID) and the
+-- LoanInfoID IS NULL filter of the incomplete-registration report.
+--   route_latency.py --function get_loan_payments --route loans/101/payments --route-params '{"loanid": "101"}'
+--   route_latency.py --function get_students_near_completion --route students/loan/near-completion/90 --route-params '{"threshold": "90"}'
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Student_LoanInfoID' AND object_id = OBJECT_ID('dbo.Student'))
+CREATE NONCLUSTERED INDEX IX_Student_LoanInfoID
+    ON dbo.Student (LoanInfoID);
+
+-- Institution to loan joins of the per-province reports, covering the loan amounts they read.
+--   route_latency.py --function get_province_student_count --route provinces/student-count
+--   route_latency.py --function get_monthly_payments_by_province --route payments/monthly-by-province
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_LoanInfo_EducationInstitutionID' AND object_id = OBJECT_ID('dbo.LoanInfo'))
+CREATE NONCLUSTERED INDEX IX_LoanInfo_EducationInstitutionID
+    ON dbo.LoanInfo (EducationInstitutionID)
+    INCLUDE (LoanAmount, LoanBalance);
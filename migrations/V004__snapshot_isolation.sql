@@ -0,0 +1,9 @@
+-- Allow SNAPSHOT isolation, used by the reporting routes' connections (DB_REPORT_ISOLATION) so
+-- their full scans of Payment neither block nor wait on the payment writes. Compare with
+--   python benchmarks/report_contention.py --payments 200 --loan-ids 101,102,103
+-- Azure SQL Database has this on already. Row versions are kept in tempdb while snapshot
+-- transactions run. ALTER DATABASE cannot run inside a transaction:
+-- migrate: no-transaction
+
+IF (SELECT snapshot_isolation_state FROM sys.databases WHERE database_id = DB_ID()) = 0
+ALTER DATABASE CURRENT SET ALLOW_SNAPSHOT_ISOLATION ON;
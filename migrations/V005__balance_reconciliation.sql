@@ -0,0 +1,42 @@
+-- Progress and findings of the loan balance reconciliation (run_reconciliation in function_app,
+-- maintenance/reconcile_balances.py and the reconcile_balances timer). A run checks LoanInfoID
+-- key ranges [ChunkStart, ChunkEnd); each checked chunk is recorded in the same transaction as
+-- its mismatches and repairs, so an interrupted run resumes after its last checkpointed chunks.
+
+IF OBJECT_ID('dbo.ReconciliationRun', 'U') IS NULL
+CREATE TABLE dbo.ReconciliationRun (
+    RunID INT IDENTITY(1, 1) NOT NULL PRIMARY KEY,
+    Repair BIT NOT NULL,
+    ChunkSize INT NOT NULL,
+    MinLoanID INT NOT NULL,
+    MaxLoanID INT NOT NULL,
+    StartedAt DATETIME2 NOT NULL,
+    CompletedAt DATETIME2 NULL,
+    Loans INT NULL,
+    Mismatches INT NULL,
+    Repaired INT NULL
+);
+
+IF OBJECT_ID('dbo.ReconciliationChunk', 'U') IS NULL
+CREATE TABLE dbo.ReconciliationChunk (
+    RunID INT NOT NULL REFERENCES dbo.ReconciliationRun (RunID),
+    ChunkStart INT NOT NULL,
+    ChunkEnd INT NOT NULL,
+    Loans INT NOT NULL,
+    Mismatches INT NOT NULL,
+    Repaired INT NOT NULL,
+    CompletedAt DATETIME2 NOT NULL,
+    PRIMARY KEY (RunID, ChunkStart)
+);
+
+IF OBJECT_ID('dbo.ReconciliationMismatch', 'U') IS NULL
+CREATE TABLE dbo.ReconciliationMismatch (
+    RunID INT NOT NULL REFERENCES dbo.ReconciliationRun (RunID),
+    LoanInfoID INT NOT NULL,
+    LoanAmount DECIMAL(18, 2) NOT NULL,
+    LoanBalance DECIMAL(18, 2) NOT NULL,
+    ExpectedBalance DECIMAL(18, 2) NOT NULL,
+    Repaired BIT NOT NULL,
+    FoundAt DATETIME2 NOT NULL,
+    PRIMARY KEY (RunID, LoanInfoID)
+);
@@ -0,0 +1,21 @@
+-- Numeric share of the loan that has been paid, next to the display string PercentagePaid ('42%').
+-- A persisted computed column: SQL Server fills it for existing rows when it is added and keeps it
+-- in step with LoanAmount and LoanBalance on every write (payments, the payment queue, new loans,
+-- reconciliation repairs), so no write path can forget it. A loan with nothing to repay counts
+-- as fully paid, matching LoanBalance <= LoanAmount * x for LoanAmount = 0.
+-- Adding a persisted column rewrites LoanInfo, so apply this version outside business hours.
+
+IF COL_LENGTH('dbo.LoanInfo', 'PaidRatio') IS NULL
+ALTER TABLE dbo.LoanInfo ADD PaidRatio AS CAST(
+    CASE WHEN LoanAmount = 0 THEN 1 ELSE (LoanAmount - LoanBalance) / LoanAmount END AS DECIMAL(9, 6)
+) PERSISTED;
+
+GO
+
+-- Near-completion threshold queries become a range seek on PaidRatio; LoanBalance is the second
+-- key for their exact boundary test and ORDER BY, and the joins' columns are included.
+--   route_latency.py --function get_students_near_completion --route students/loan/near-completion/90 --route-params '{"threshold": "90"}'
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_LoanInfo_PaidRatio_LoanBalance' AND object_id = OBJECT_ID('dbo.LoanInfo'))
+CREATE NONCLUSTERED INDEX IX_LoanInfo_PaidRatio_LoanBalance
+    ON dbo.LoanInfo (PaidRatio, LoanBalance)
+    INCLUDE (LoanAmount, PercentagePaid, StudyInfoID, EducationInstitutionID);
@@ -0,0 +1,42 @@
+-- Payments accepted by loans/make-payment in asynchronous mode, drained by payment_queue_worker.
+-- Every instance enqueues into and claims from this table, so a payment accepted on one instance
+-- is applied by whichever instance runs the drain, and nothing is lost when an instance recycles.
+-- Entries move from queued to processing when a worker claims them, then to applied or failed
+-- with the response the synchronous endpoint would have returned. Each claim counts an attempt;
+-- an entry that errors on its own is queued again (not before AvailableAt) until it has used
+-- PAYMENT_MAX_ATTEMPTS, then moved to dead-lettered with LastError. A payment queued with an
+-- Idempotency-Key also claims the key in PaymentIdempotency, and its final response is stored
+-- there, so synchronous and asynchronous retries with the key never apply it twice.
+
+IF OBJECT_ID('dbo.PaymentQueue', 'U') IS NULL
+CREATE TABLE dbo.PaymentQueue (
+    QueueID BIGINT IDENTITY(1, 1) NOT NULL PRIMARY KEY,
+    RequestID CHAR(32) NOT NULL UNIQUE,
+    LoanInfoID INT NOT NULL,
+    Amount DECIMAL(18, 2) NOT NULL,
+    IdempotencyKey NVARCHAR(100) NULL,
+    RequestHash CHAR(64) NULL,
+    Status VARCHAR(20) NOT NULL,
+    StatusCode INT NULL,
+    ResponseBody NVARCHAR(MAX) NULL,
+    Attempts INT NOT NULL DEFAULT 0,
+    LastError NVARCHAR(2000) NULL,
+    EnqueuedAt DATETIME2 NOT NULL,
+    AvailableAt DATETIME2 NULL,
+    ClaimedAt DATETIME2 NULL,
+    CompletedAt DATETIME2 NULL
+);
+
+GO
+
+-- One queued payment per Idempotency-Key
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_PaymentQueue_IdempotencyKey' AND object_id = OBJECT_ID('dbo.PaymentQueue'))
+CREATE UNIQUE NONCLUSTERED INDEX UX_PaymentQueue_IdempotencyKey
+    ON dbo.PaymentQueue (IdempotencyKey)
+    WHERE IdempotencyKey IS NOT NULL;
+
+-- Claims seek the waiting and stale entries in queue order
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_PaymentQueue_Status' AND object_id = OBJECT_ID('dbo.PaymentQueue'))
+CREATE NONCLUSTERED INDEX IX_PaymentQueue_Status
+    ON dbo.PaymentQueue (Status, QueueID)
+    INCLUDE (ClaimedAt);
@@ -0,0 +1,7 @@
+-- Drops IX_Payment_Paydate, which earlier copies of V003 created. It stored the same columns as
+-- IX_Payment_LoanInfoID_Paydate and almost every column of the clustered index, and the monthly
+-- and per-institution reports group every payment by YEAR/MONTH, so they scan about as much
+-- with or without it. It only added a second index write to every payment.
+
+IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Payment_Paydate' AND object_id = OBJECT_ID('dbo.Payment'))
+DROP INDEX IX_Payment_Paydate ON dbo.Payment;
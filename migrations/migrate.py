@@ -0,0 +1,102 @@
+"""
+Apply the versioned schema scripts in this folder (V<version>__<description>.sql) in order.
+
+    python migrations/migrate.py            # apply pending versions
+    python migrations/migrate.py --list     # show applied and pending versions
+    python migrations/migrate.py --target 2 # apply up to and including version 2
+
+Connects with the same DB_* settings (or .env) as function_app, so it works against Azure SQL
+and a local SQL Server alike. Applied versions are recorded in dbo.SchemaVersion with the
+script checksum; each script runs in its own transaction together with its version row.
+Scripts containing the line "-- migrate: no-transaction" (statements such as ALTER DATABASE
+that cannot run in a transaction) run in autocommit mode and are recorded afterwards.
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+
+migrations_dir = os.path.dirname(os.path.abspath(__file__))
+repo_root = os.path.dirname(migrations_dir)
+if repo_root not in sys.path:
+    sys.path.insert(0, repo_root)
+
+script_pattern = re.compile(r'^V(\d+)__(\w+)\.sql$')
+batch_separator = re.compile(r'^\s*GO\s*$', re.IGNORECASE | re.MULTILINE)
+no_transaction_directive = re.compile(r'^--\s*migrate:\s*no-transaction\s*$', re.IGNORECASE | re.MULTILINE)
+
+def load_scripts():
+    scripts = []
+    for file_name in os.listdir(migrations_dir):
+        match = script_pattern.match(file_name)
+        if match:
+            with open(os.path.join(migrations_dir, file_name), encoding='utf-8') as f:
+                sql = f.read()
+            scripts.append((int(match.group(1)), match.group(2), sql, hashlib.sha256(sql.encode()).hexdigest()))
+    scripts.sort()
+    versions = [script[0] for script in scripts]
+    if len(versions) != len(set(versions)):
+        raise SystemExit('Duplicate migration version numbers')
+    return scripts
+
+def applied_versions(cursor):
+    cursor.execute("""
+        IF OBJECT_ID('dbo.SchemaVersion', 'U') IS NULL
+        CREATE TABLE dbo.SchemaVersion (
+            Version INT NOT NULL PRIMARY KEY,
+            Description NVARCHAR(200) NOT NULL,
+            Checksum CHAR(64) NOT NULL,
+            AppliedAt DATETIME2 NOT NULL
+        )
+    """)
+    cursor.connection.commit()
+    cursor.execute("SELECT Version, Checksum FROM dbo.SchemaVersion")
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--list', action='store_true', help='Show versions without applying anything')
+    parser.add_argument('--target', type=int, help='Highest version to apply')
+    args = parser.parse_args()
+
+    # Only the connection settings are needed; migrations bypass the pool and statement catalog
+    import function_app
+
+    scripts = load_scripts()
+    conn = function_app.get_pyodbc().connect(function_app.conn_str, timeout=function_app.connect_timeout)
+    conn.autocommit = False
+    try:
+        cursor = conn.cursor()
+        applied = applied_versions(cursor)
+
+        for version, description, sql, checksum in scripts:
+            if version in applied:
+                state = 'applied' if applied[version] == checksum else 'applied (script changed since)'
+            elif args.target is not None and version > args.target:
+                state = 'skipped'
+            elif args.list:
+                state = 'pending'
+            else:
+                try:
+                    conn.autocommit = bool(no_transaction_directive.search(sql))
+                    for batch in batch_separator.split(sql):
+                        if batch.strip():
+                            cursor.execute(batch)
+                    conn.autocommit = False
+                    cursor.execute(
+                        "INSERT INTO dbo.SchemaVersion (Version, Description, Checksum, AppliedAt) VALUES (?, ?, ?, SYSUTCDATETIME())",
+                        version, description, checksum
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    print(f'V{version:03d} {description}: failed')
+                    raise
+                state = 'applied now'
+            print(f'V{version:03d} {description}: {state}')
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
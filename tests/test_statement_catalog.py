@@ -0,0 +1,173 @@
+"""
+The statement catalog is complete and constant once function_app is imported: every statement
+is registered at import with fixed text, and no request can add a statement or change one.
+
+    python -m pytest tests
+"""
+import ast
+import importlib.util
+import inspect
+import itertools
+import os
+import sys
+import unittest
+from collections import defaultdict
+
+import azure.functions as func
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.environ.setdefault('CACHE_BACKEND', 'none')
+
+import function_app
+
+def load_function_app(module_name):
+    # A second, independent import of function_app.py, to compare its catalog with the first
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(root, 'function_app.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# Calls that may produce the SQL text or name a cursor executes: catalog lookups and
+# registrations, the configurable replica lag query, and the lastname projection registrar
+sql_calls = frozenset({
+    'sql_statements.register', 'sql_statements.sql', 'os.getenv', 'build_students_by_lastname_query'
+})
+
+class FakeCursor:
+    # Answers a lastname search with one row holding each selected column's name
+    def __init__(self):
+        self.description = None
+
+    def execute(self, name, *params):
+        select_list = function_app.sql_statements.sql(name).split('FROM')[0].replace('SELECT', '')
+        columns = [column.strip().split(' as ')[-1].split('.')[-1] for column in select_list.split(',')]
+        self.description = [(column,) for column in columns]
+        return self
+
+    def fetchall(self):
+        return [tuple(column[0] for column in self.description)]
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    def cursor(self):
+        return FakeCursor()
+
+    def close(self):
+        pass
+
+class StatementCatalogTest(unittest.TestCase):
+
+    def test_every_statement_is_constant_text(self):
+        # Importing the module again registers the same names with the same text, so no
+        # statement depends on anything but the code
+        statements = dict(function_app.sql_statements.statements)
+        self.assertTrue(statements)
+        other = load_function_app('function_app_catalog_check')
+        self.assertEqual(statements, other.sql_statements.statements)
+
+        for name, sql in statements.items():
+            # Registering the same text again is accepted; any other text for the name is not
+            self.assertEqual(function_app.sql_statements.register(name, sql), name)
+            with self.assertRaises(ValueError):
+                function_app.sql_statements.register(name, sql + ' ')
+
+    def test_no_statement_is_built_by_interpolation(self):
+        # Every SQL text handed to sql_statements.register or a cursor's execute/executemany, and
+        # every variable it is read from, must be literal text, a catalog name or one of the
+        # calls below; an f-string, % or + expression, .format() or any other helper fails
+        with open(os.path.join(root, 'function_app.py'), encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+
+        assignments = defaultdict(list)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Assign):
+                for target in node.targets:
+                    if isinstance(target, ast.Name):
+                        assignments[target.id].append(node.value)
+            elif isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Name):
+                assignments[node.target.id].append(node)
+
+        problems = []
+
+        def check(node, line, seen):
+            if isinstance(node, ast.JoinedStr):
+                problems.append(f'line {line}: f-string SQL')
+            elif isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Mod, ast.Add)):
+                problems.append(f'line {line}: SQL built with {type(node.op).__name__}')
+            elif isinstance(node, ast.AugAssign):
+                problems.append(f'line {node.lineno}: SQL extended in place')
+            elif isinstance(node, ast.Call):
+                function = ast.unparse(node.func)
+                if function.endswith('.format'):
+                    problems.append(f'line {line}: .format() SQL')
+                elif function == 'build_projected_query':
+                    # The one builder allowed: it joins fixed whitelist entries, passed by name
+                    if not all(isinstance(arg, (ast.Name, ast.Constant)) for arg in node.args):
+                        problems.append(f'line {line}: build_projected_query() with computed arguments')
+                elif function not in sql_calls:
+                    problems.append(f'line {line}: SQL from {function}()')
+            elif isinstance(node, ast.Name):
+                if node.id not in seen:
+                    seen.add(node.id)
+                    for value in assignments.get(node.id, []):
+                        check(value, getattr(value, 'lineno', line), seen)
+            elif isinstance(node, ast.Subscript):
+                check(node.value, line, seen)
+            elif isinstance(node, ast.IfExp):
+                check(node.body, line, seen)
+                check(node.orelse, line, seen)
+            elif isinstance(node, ast.Dict):
+                for value in node.values:
+                    check(value, line, seen)
+            elif isinstance(node, ast.DictComp):
+                check(node.value, line, seen)
+            elif not isinstance(node, (ast.Constant, ast.Attribute)):
+                problems.append(f'line {line}: SQL from {type(node).__name__} expression')
+
+        checked = 0
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Attribute):
+                continue
+            if ast.unparse(node.func) == 'sql_statements.register' and len(node.args) == 2:
+                check(node.args[1], node.lineno, set())
+            elif node.func.attr in ('execute', 'executemany') and node.args:
+                check(node.args[0], node.lineno, set())
+            else:
+                continue
+            checked += 1
+
+        self.assertGreater(checked, 100)
+        self.assertEqual(problems, [])
+
+    def test_field_projections_are_registered_up_front(self):
+        statements = dict(function_app.sql_statements.statements)
+        fields = tuple(function_app.student_search_fields)
+        handler = inspect.unwrap(next(
+            function.get_user_function() for function in function_app.app.get_functions()
+            if function.get_function_name() == 'get_students_by_lastname'
+        ))
+        original_connection = function_app.get_read_db_connection
+        function_app.get_read_db_connection = lambda *args, **kwargs: FakeConnection()
+        try:
+            for count in (1, 2, len(fields)):
+                for requested in itertools.combinations(fields, count):
+                    response = handler(func.HttpRequest(
+                        'GET', '/api/students/lastname/Smith',
+                        route_params={'lastname': 'Smith'},
+                        params={'fields': ','.join(requested), 'shape': 'columnar'},
+                        body=b''
+                    ))
+                    self.assertEqual(response.status_code, 200, response.get_body())
+                    self.assertIn(f'"columns": ["{requested[0]}"'.encode(), response.get_body())
+        finally:
+            function_app.get_read_db_connection = original_connection
+
+        # Every field set reused one of the statements registered at import
+        self.assertEqual(statements, function_app.sql_statements.statements)
+        self.assertLessEqual(len(function_app.students_by_lastname_queries), 2 ** len(function_app.student_search_joins))
+
+if __name__ == '__main__':
+    unittest.main()